@@ -0,0 +1,99 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+import metrics
+
+OVERLOAD_REPLY = "Сейчас очень много обращений. Пожалуйста, напишите чуть позже."
+QUOTA_REPLY = "Вы отправили слишком много сообщений. Пожалуйста, продолжим немного позже."
+
+# Весь бот в хранилище расхода токенов
+BOT = "*"
+
+
+# Допуск сообщений к запуску ассистента. Сообщение отклоняется, если у пользователя уже user_max_queued
+# необработанных сообщений или у бота bot_max_queued, либо если расход токенов за последние window секунд
+# достиг user_token_budget у пользователя или bot_token_budget у бота (0 - без ограничения).
+# Расход хранится в SessionStore корзинами по window / buckets секунд, поэтому окно скользящее и переживает
+# перезапуск; расход всего бота с SqliteSessionStore общий для рабочих процессов supervisor.
+# Отклонённому пользователю сразу уходит короткий ответ, но не чаще раза в reply_interval секунд:
+# quota_reply, если превышен его собственный лимит, и overload_reply, если перегружен весь бот
+class Admission:
+    def __init__(self, bot, sessions, user_max_queued=10, bot_max_queued=1000, user_token_budget=0,
+                 bot_token_budget=0, window=3600, buckets=60, reply_interval=60,
+                 overload_reply=OVERLOAD_REPLY, quota_reply=QUOTA_REPLY):
+        self.bot = bot
+        self.sessions = sessions
+        self.user_max_queued = user_max_queued
+        self.bot_max_queued = bot_max_queued
+        self.user_token_budget = user_token_budget
+        self.bot_token_budget = bot_token_budget
+        self.window = window
+        self.bucket_seconds = max(1, int(window // buckets))
+        self.reply_interval = reply_interval
+        self.overload_reply = overload_reply
+        self.quota_reply = quota_reply
+        self.replied = OrderedDict()
+        self.lock = threading.Lock()
+        self.tasks = set()
+
+    def _since(self, now=None):
+        now = time.time() if now is None else now
+        return int((now - self.window) // self.bucket_seconds + 1) * self.bucket_seconds
+
+    # Токены, потраченные чатом за окно; по этому значению планировщик диспетчера выбирает, кого пустить первым
+    def usage(self, chat_id=BOT):
+        return self.sessions.usage(chat_id, self._since(), shared=chat_id == BOT)
+
+    def record(self, chat_id, tokens):
+        if tokens <= 0:
+            return
+        now = time.time()
+        bucket = int(now // self.bucket_seconds) * self.bucket_seconds
+        since = self._since(now)
+        self.sessions.add_usage(chat_id, bucket, tokens, since)
+        self.sessions.add_usage(BOT, bucket, tokens, since)
+
+    # Причина отказа или None. user_queued и bot_queued - сколько сообщений уже ждут обработки
+    def check(self, chat_id, user_queued=0, bot_queued=0):
+        reason = None
+        if self.user_token_budget and self.usage(chat_id) >= self.user_token_budget:
+            reason = "user_tokens"
+        elif user_queued >= self.user_max_queued:
+            reason = "user_queued"
+        elif self.bot_token_budget and self.usage() >= self.bot_token_budget:
+            reason = "bot_tokens"
+        elif bot_queued >= self.bot_max_queued:
+            reason = "bot_queued"
+        metrics.admission_total.inc(self.bot, reason or "admitted")
+        return reason
+
+    # Текст ответа на отказ или None, если этому чату уже недавно отвечали
+    def reply(self, chat_id, reason):
+        now = time.monotonic()
+        with self.lock:
+            last = self.replied.get(chat_id)
+            if last is not None and now - last < self.reply_interval:
+                return None
+            self.replied[chat_id] = now
+            self.replied.move_to_end(chat_id)
+            while len(self.replied) > 10000:
+                self.replied.popitem(last=False)
+        return self.quota_reply if reason.startswith("user_") else self.overload_reply
+
+    # Для асинхронных ботов: ответ на отказ отправляется в фоне, опрос платформы не ждёт
+    def reject(self, chat_id, reason, send):
+        logging.info(f"{self.bot}: сообщение чата {chat_id} отклонено ({reason})")
+        text = self.reply(chat_id, reason)
+        if text is None:
+            return
+        task = asyncio.create_task(self._send(send, chat_id, text))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, send, chat_id, text):
+        try:
+            await send(chat_id, text)
+        except Exception as e:
+            logging.error(f"Ошибка при отправке ответа о перегрузке в чат {chat_id}: {e}")
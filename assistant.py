@@ -0,0 +1,42 @@
+import time
+import logging
+import importlib
+import threading
+
+# openai со всеми типами импортируется больше секунды, поэтому здесь его нет: клиент создаётся
+# при первом обращении, а обработчик событий (event_handler) подгружается в фоне функцией preload
+
+# Один клиент OpenAI на API ключ: все боты процесса делят его пул HTTP соединений
+clients = {}
+
+def get_openai_client(api_key):
+    if api_key not in clients:
+        clients[api_key] = LazyOpenAI(api_key)
+    return clients[api_key]
+
+# AsyncOpenAI, который создаётся при первом обращении к любому его атрибуту
+class LazyOpenAI:
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.client = None
+
+    def __getattr__(self, name):
+        if self.client is None:
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(api_key=self.api_key)
+        return getattr(self.client, name)
+
+# Импорт openai в отдельном потоке, пока цикл событий уже опрашивает платформы. Если сообщение
+# придёт раньше, импорт в обработчике дождётся этого потока
+def preload():
+    def load():
+        started = time.monotonic()
+        importlib.import_module("event_handler")
+        logging.info(f"Модули OpenAI загружены за {time.monotonic() - started:.2f} с")
+    threading.Thread(target=load, name="openai-preload", daemon=True).start()
+
+# Все сообщения потока от первого к последнему в виде пар (роль, текст)
+async def thread_messages(client, thread_id):
+    async for message in client.beta.threads.messages.list(thread_id=thread_id, order="asc"):
+        text = " ".join(part.text.value for part in message.content if part.type == "text")
+        yield message.role, text
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import metrics
+from play1 import VkBot
+from session_store import SessionStore
+from bench.fakes import FakeAsyncOpenAI
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def event(user_id, text):
+    return SimpleNamespace(text=text, user_id=user_id, attachments={})
+
+
+# Несколько пользователей засыпают бота длинными сообщениями, остальные пишут изредка:
+# сколько ждут ответа обычные пользователи при очереди по порядку, при честной очереди и с бюджетом токенов
+async def run(mode, args):
+    random.seed(1)
+    config = {
+        'name': f'bench_{mode}', 'token': 'x', 'assistant_id': 'asst', 'instructions': '', 'transcript': 'off',
+        'price_file': 'missing.xlsx', 'max_concurrency': args.concurrency, 'context_max_tokens': 0,
+        'user_token_budget': args.budget if mode == 'budget' else 0,
+    }
+    bot = VkBot(config, FakeAsyncOpenAI(latency=args.openai_latency), SessionStore().view(config['name']))
+    if mode == 'fifo':
+        bot.dispatcher.semaphore.priority = None
+    replied = {}
+    canned = []
+
+    async def send_vk_message(user_id, text):
+        if text in (bot.admission.overload_reply, bot.admission.quota_reply):
+            canned.append(user_id)
+        if user_id in replied:
+            replied[user_id].set()
+
+    bot.send_vk_message = send_vk_message
+    heavy_text = "Посчитайте, пожалуйста, ремонт " * 40
+
+    async def heavy(user_id):
+        for _ in range(args.heavy_messages):
+            bot.submit(user_id, event(user_id, heavy_text))
+            await asyncio.sleep(args.heavy_interval)
+
+    latencies = []
+
+    async def light(user_id):
+        replied[user_id] = asyncio.Event()
+        for _ in range(args.light_messages):
+            await asyncio.sleep(random.uniform(0, args.duration / args.light_messages))
+            replied[user_id].clear()
+            started = time.perf_counter()
+            bot.submit(user_id, event(user_id, "Сколько стоит покраска двери?"))
+            await replied[user_id].wait()
+            latencies.append(time.perf_counter() - started)
+
+    heavy_ids = range(args.heavy_users)
+    light_ids = range(args.heavy_users, args.heavy_users + args.light_users)
+    await asyncio.gather(*(heavy(user_id) for user_id in heavy_ids), *(light(user_id) for user_id in light_ids))
+    await bot.dispatcher.join()
+    heavy_tokens = sum(bot.admission.usage(user_id) for user_id in heavy_ids)
+    return latencies, heavy_tokens, len(canned)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время ответа обычным пользователям, когда несколько пользователей спамят")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--openai-latency', type=float, default=0.05)
+    parser.add_argument('--heavy-users', type=int, default=20)
+    parser.add_argument('--heavy-messages', type=int, default=40)
+    parser.add_argument('--heavy-interval', type=float, default=0.2)
+    parser.add_argument('--light-users', type=int, default=40)
+    parser.add_argument('--light-messages', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=4.0, help="за сколько секунд обычный пользователь пишет все сообщения")
+    parser.add_argument('--budget', type=int, default=3000, help="user_token_budget в режиме budget")
+    args = parser.parse_args()
+
+    print(f"{'режим':>7} {'p50':>8} {'p95':>8} {'макс':>8} {'токенов спамеров':>17} {'ответов об отказе':>18}")
+    for mode in ('fifo', 'fair', 'budget'):
+        latencies, heavy_tokens, canned = asyncio.run(run(mode, args))
+        print(f"{mode:>7} " + " ".join(f"{percentile(latencies, p) * 1000:>6.0f}мс" for p in (50, 95, 100))
+              + f" {heavy_tokens:>17} {canned:>18}")
+    print("".join(line + "\n" for line in metrics.admission_total.render()[2:]), end="")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from play1 import VkBot
+from session_store import SessionStore
+from bench.fakes import FakeAsyncOpenAI, FakeTelegramBot
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Много пользователей одновременно присылают фото: через сколько приходит ответ пользователю
+# и сколько сообщений получает оператор
+async def run(args):
+    client = FakeAsyncOpenAI(latency=args.openai_latency)
+    notify_bot = FakeTelegramBot(send_latency=args.send_latency)
+    config = {
+        'name': 'bench', 'token': 'x', 'assistant_id': 'asst', 'instructions': '', 'transcript': 'off',
+        'price_file': 'missing.xlsx', 'max_concurrency': 64, 'notify_chat_id': 1,
+        'notify_digest_window': args.window,
+    }
+    bot = VkBot(config, client, SessionStore().view('bench'), notify_bot=notify_bot)
+    acked = {}
+
+    async def send_vk_message(user_id, text):
+        await asyncio.sleep(args.send_latency)
+        acked.setdefault(user_id, time.perf_counter())
+
+    bot.send_vk_message = send_vk_message
+    for user_id in range(args.users):
+        bot.user_threads[user_id] = (await client.beta.threads.create()).id
+
+    started = time.perf_counter()
+    for user_id in range(args.users):
+        for _ in range(args.files):
+            bot.dispatcher.submit(user_id, SimpleNamespace(text='', user_id=user_id, attachments={'attach1_type': 'photo'}))
+    await bot.dispatcher.join()
+    await bot.notify_digest.close()
+    latencies = [acked[user_id] - started for user_id in range(args.users)]
+    return latencies, notify_bot.sent, client.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обработка присланных файлов: ответ пользователю и сводки оператору")
+    parser.add_argument('--users', type=int, default=30)
+    parser.add_argument('--files', type=int, default=3, help="файлов от каждого пользователя")
+    parser.add_argument('--openai-latency', type=float, default=0.3)
+    parser.add_argument('--send-latency', type=float, default=0.05)
+    parser.add_argument('--window', type=float, default=2.0)
+    args = parser.parse_args()
+
+    latencies, notifications, calls = asyncio.run(run(args))
+    print(f"Файлов: {args.users * args.files}, пользователей: {args.users}")
+    print(f"Первый ответ пользователю: p50 {percentile(latencies, 50) * 1000:.0f} мс, "
+          f"максимум {max(latencies) * 1000:.0f} мс")
+    print(f"Сообщений оператору: {len(notifications)}; удалено потоков: {calls.get('threads.delete', 0)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from session_store import SessionStore
+from tg_bot import TelegramBot
+from bench.fakes import FakeAsyncOpenAI, FakeTelegramBot, make_update
+
+
+# Много разных чатов пишут одновременно, а max_concurrency мал: опрос должен остановиться, как только
+# max_pending сообщений ждут обработки, даже если каждое уже забрано обработчиком своего чата
+async def run(args):
+    config = {
+        'name': 'bench', 'token': '1:bench', 'assistant_id': 'asst', 'instructions': '', 'context_max_tokens': 0,
+        'max_concurrency': args.concurrency, 'max_pending': args.max_pending, 'poll_timeout': 1,
+        'send_rate': 10 ** 6, 'chat_send_rate': 10 ** 6,
+        # Проверяется остановка опроса, а не отказы допуска
+        'bot_max_queued': 10 ** 9,
+    }
+    bot = TelegramBot(config, FakeAsyncOpenAI(latency=args.openai_latency), SessionStore().view('bench'))
+    updates = [make_update(chat_id, "Сколько стоит порог?") for chat_id in range(args.chats)]
+    bot.telegram_bot = fake = FakeTelegramBot(updates)
+
+    samples = []
+
+    async def sample():
+        while True:
+            dispatcher = bot.dispatcher
+            samples.append((dispatcher.queued, dispatcher.active_chats))
+            await asyncio.sleep(0.005)
+
+    poller = asyncio.create_task(bot.start_telegram_bot())
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    while len(fake.sent) < args.chats:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    poller.cancel()
+    sampler.cancel()
+    await asyncio.gather(poller, sampler, return_exceptions=True)
+    return samples, elapsed, fake, bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Остановка опроса Telegram при переполнении очередей диспетчера")
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=50)
+    parser.add_argument('--openai-latency', type=float, default=0.005)
+    args = parser.parse_args()
+
+    samples, elapsed, fake, bot = asyncio.run(run(args))
+    waiting = max(queued for queued, _ in samples)
+    active = max(chats for _, chats in samples)
+    # У каждого чата одно сообщение, поэтому чаты в работе сверх max_concurrency - это сообщения, которые ждут;
+    # счётчик диспетчера так не проверить, он сам под проверкой. Один запрос опроса приносит до 100 обновлений
+    limit = args.max_pending + 100 + args.concurrency
+    print(f"{args.chats} чатов, max_concurrency={args.concurrency}, max_pending={args.max_pending}: "
+          f"ответов {len(fake.sent)} за {elapsed:.2f} с, запросов опроса {fake.polls}")
+    print(f"больше всего ждали обработки {waiting} сообщений, чатов в работе {active}")
+    if active > limit:
+        sys.exit(f"Опрос не остановился: в работе {active} чатов при пороге {args.max_pending}")
+    if len(fake.sent) < args.chats or bot.dispatcher.queued:
+        sys.exit("Не все сообщения обработаны")
+
+
+if __name__ == '__main__':
+    main()
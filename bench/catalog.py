@@ -0,0 +1,79 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+from catalog import ProductCatalog, build_index
+
+BRANDS = ["ВАЗ 2110", "ВАЗ 2114", "Лада Приора", "Лада Гранта", "Kia Rio", "Hyundai Solaris", "Renault Logan",
+          "Ford Focus", "Toyota Corolla", "Skoda Octavia", "Volkswagen Polo", "Chevrolet Lacetti", "Daewoo Nexia"]
+PARTS = ["порог", "арка задняя", "арка передняя", "крыло", "дверь", "капот", "бампер", "лонжерон", "усилитель порога"]
+SIDES = ["левый", "правый", ""]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def make_db(path, count):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE products (name TEXT, price INTEGER, description TEXT)")
+    rows = []
+    for n in range(count):
+        brand, part, side = random.choice(BRANDS), random.choice(PARTS), random.choice(SIDES)
+        name = f"{part} {side} {brand} арт.{n}".replace("  ", " ")
+        rows.append((name, random.randint(900, 9000), f"Ремонтный элемент: {part} для {brand}, сталь 1 мм"))
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def measure(name, func, queries):
+    timings = []
+    found = 0
+    for query in queries:
+        started = time.perf_counter()
+        found += bool(func(query))
+        timings.append(time.perf_counter() - started)
+    print(f"{name}: p50 {percentile(timings, 50) * 1000:.2f} мс, p99 {percentile(timings, 99) * 1000:.2f} мс, "
+          f"найдено для {found} из {len(queries)} запросов")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск товара: LIKE '%...%' против FTS5 и кэша")
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(1)
+    queries = [f"{random.choice(PARTS).split()[0]} {random.choice(BRANDS)}" for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "products.db")
+        make_db(path, args.products)
+
+        # Как было в play.py: новое соединение и полный просмотр таблицы на каждый запрос
+        def like_search(query):
+            conn = sqlite3.connect(path)
+            product = conn.execute("SELECT name, price, description FROM products WHERE name LIKE ?", (f"%{query}%",)).fetchone()
+            conn.close()
+            return product
+
+        started = time.perf_counter()
+        build_index(path)
+        catalog = ProductCatalog(path)
+        print(f"{args.products} товаров, индекс построен за {time.perf_counter() - started:.1f} с")
+        measure("LIKE, новое соединение", like_search, queries)
+        catalog.cache_size = 0
+        measure("FTS5, без кэша", catalog.search, queries)
+        catalog.cache_size = 1000
+        for query in queries:
+            catalog.search(query)
+        measure("FTS5, из кэша", catalog.search, queries)
+        print(catalog.get_product_info(queries[0]).split("\n\n")[0])
+
+
+if __name__ == '__main__':
+    main()
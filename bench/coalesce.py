@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from play1 import VkBot
+from session_store import SessionStore
+from bench.fakes import FakeAsyncOpenAI
+
+
+# Пользователи пишут серии коротких сообщений; сколько запусков и вызовов API уходит с окном склейки и без него
+async def run(window, args):
+    client = FakeAsyncOpenAI(ttft=args.run_latency)
+    config = {
+        'name': 'bench', 'token': 'x', 'assistant_id': 'asst', 'instructions': '', 'transcript': 'off',
+        'price_file': 'missing.xlsx', 'coalesce_window': window, 'max_concurrency': 64,
+    }
+    bot = VkBot(config, client, SessionStore().view('bench'))
+    replies = []
+
+    async def send_vk_message(user_id, text):
+        replies.append(time.perf_counter())
+
+    bot.send_vk_message = send_vk_message
+    started = time.perf_counter()
+    for n in range(args.burst):
+        for user_id in range(args.users):
+            bot.dispatcher.submit(user_id, SimpleNamespace(text=f"сообщение {n}", user_id=user_id, attachments={}))
+        await asyncio.sleep(args.gap)
+    await bot.dispatcher.join()
+    elapsed = time.perf_counter() - started
+    return client.calls, len(replies), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Склейка серий сообщений в один запуск ассистента")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--burst', type=int, default=4, help="сообщений в серии")
+    parser.add_argument('--gap', type=float, default=0.3, help="пауза между сообщениями серии, с")
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--run-latency', type=float, default=1.0, help="время ответа подставного ассистента, с")
+    args = parser.parse_args()
+
+    for window in (0.0, args.window):
+        calls, replies, elapsed = asyncio.run(run(window, args))
+        messages = args.users * args.burst
+        print(f"окно {window:.1f} с: сообщений {messages}, запусков {calls.get('runs.stream', 0)}, "
+              f"ответов {replies}, вызовов API {sum(calls.values())}, время {elapsed:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
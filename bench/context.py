@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import sys
+
+from session_store import SessionStore
+from tg_bot import TelegramBot
+from bench.fakes import FakeAsyncOpenAI, FakeTelegramBot, make_update
+
+
+# Один длинный разговор: размер запроса к модели на каждом запуске с переносом потока и без него
+async def run(context_max_tokens, args):
+    reply = " ".join(["Ответ консультанта по кузовному ремонту."] * args.reply_words)
+    client = FakeAsyncOpenAI(reply=reply)
+    config = {
+        'name': 'bench', 'token': '1:bench', 'assistant_id': 'asst_bench', 'instructions': '',
+        'context_max_tokens': context_max_tokens, 'context_max_messages': args.max_messages,
+        'send_rate': 10000, 'chat_send_rate': 10000,
+    }
+    bot = TelegramBot(config, client, SessionStore().view('bench'))
+    bot.telegram_bot = FakeTelegramBot()
+    for n in range(args.messages):
+        await bot.handle_telegram_message(make_update(1, f"Сообщение {n}: сколько стоит покраска двери?"))
+    if bot.context:
+        await asyncio.gather(*bot.context.tasks)
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер контекста запуска в длинном разговоре")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--reply-words', type=int, default=10)
+    parser.add_argument('--max-tokens', type=int, default=2000)
+    parser.add_argument('--max-messages', type=int, default=40)
+    args = parser.parse_args()
+
+    unbounded = asyncio.run(run(0, args))
+    bounded = asyncio.run(run(args.max_tokens, args))
+
+    step = max(1, args.messages // 10)
+    print(f"{'запуск':>7} {'без переноса':>14} {'с переносом':>13}")
+    for n in range(0, args.messages, step):
+        print(f"{n + 1:>7} {unbounded.prompt_sizes[n]:>14} {bounded.prompt_sizes[n]:>13}")
+    print(f"Максимум символов в запросе: без переноса {max(unbounded.prompt_sizes)}, с переносом {max(bounded.prompt_sizes)}")
+    print(f"Вызовы API с переносом: {bounded.calls}")
+    print(f"Потоков осталось: {len(bounded.threads)}")
+
+    # Размер запроса не должен зависеть от длины разговора: во второй половине он не больше, чем в первой
+    # (с запасом 10% на разную длину пересказов), и старые потоки удалены
+    half = args.messages // 2
+    if max(bounded.prompt_sizes[half:]) > 1.1 * max(bounded.prompt_sizes[:half]) or len(bounded.threads) != 1:
+        sys.exit("Размер контекста растёт вместе с разговором")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import sys
+import time
+
+from dispatcher import ChatDispatcher
+from bench.fakes import FakeAssistant, FakeTelegramBot, make_update
+
+
+# Повторяет цикл start_telegram_bot на подставных Telegram и OpenAI
+async def run(chats, messages_per_chat, max_concurrency, latency):
+    updates = [make_update(chat_id, f"сообщение {n}") for n in range(messages_per_chat) for chat_id in range(chats)]
+    bot = FakeTelegramBot(updates)
+    assistant = FakeAssistant(latency)
+
+    async def handle_telegram_message(update):
+        response_text = await assistant.reply(update.message.text)
+        await bot.send_message(update.message.chat.id, response_text)
+
+    dispatcher = ChatDispatcher(handle_telegram_message, max_concurrency=max_concurrency)
+    update_id = None
+    started = time.perf_counter()
+    while len(bot.sent) < len(updates):
+        for update in await bot.get_updates(offset=update_id, timeout=0):
+            dispatcher.submit(update.message.chat.id, update)
+            update_id = update.update_id + 1
+        await asyncio.sleep(0)
+    await dispatcher.join()
+    elapsed = time.perf_counter() - started
+
+    # Внутри одного чата ответы должны идти в порядке сообщений
+    for chat_id in range(chats):
+        texts = [text for sent_chat, text in bot.sent if sent_chat == chat_id]
+        assert texts == [f"Ответ на: сообщение {n}" for n in range(messages_per_chat)], texts
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время обработки N чатов диспетчером против одного чата")
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--max-concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    single = asyncio.run(run(1, args.messages, args.max_concurrency, args.latency))
+    many = asyncio.run(run(args.chats, args.messages, args.max_concurrency, args.latency))
+    serial = asyncio.run(run(args.chats, args.messages, 1, args.latency))
+    print(f"1 чат: {single:.2f} с")
+    print(f"{args.chats} чатов, max_concurrency={args.max_concurrency}: {many:.2f} с")
+    print(f"{args.chats} чатов, max_concurrency=1: {serial:.2f} с")
+
+    if args.max_concurrency >= args.chats and many > single * 1.5:
+        print("Параллельная обработка чатов не работает")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import json
+import socket
+import time
+import threading
+import itertools
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+
+from bench.fakes import delay
+
+
+# Локальный подставной api.vk.ru: messages.send и execute с задержкой ответа latency.
+# handshake_delay имитирует установку TCP+TLS соединения и платится один раз на соединение
+class FakeVkServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.02, handshake_delay=0.05):
+        super().__init__(('127.0.0.1', 0), FakeVkHandler)
+        self.latency = latency
+        self.handshake_delay = handshake_delay
+        self.message_ids = itertools.count(1)
+        self.requests = 0
+        self.connections = 0
+        self.sent = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class FakeVkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake_delay)
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        values = {key: value[0] for key, value in parse_qs(self.rfile.read(length).decode()).items()}
+        method = self.path.rsplit("/", 1)[-1]
+        time.sleep(delay(self.server.latency))
+        with self.server.lock:
+            self.server.requests += 1
+            if method == 'execute':
+                count = max(1, values['code'].count('user_id'))
+                response = [next(self.server.message_ids) for _ in range(count)]
+                self.server.sent.extend(['execute'] * count)
+            else:
+                response = next(self.server.message_ids)
+                self.server.sent.append(values.get('user_id'))
+        body = json.dumps({'response': response}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Переадресует запросы к https://api.vk.ru на подставной сервер
+class RedirectAdapter(HTTPAdapter):
+    def __init__(self, target, **kwargs):
+        self.target = urlsplit(target)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = urlunsplit((self.target.scheme, self.target.netloc, url.path, url.query, url.fragment))
+        return super().send(request, **kwargs)
+
+
+def redirect_to(session, server, pool_size=10):
+    session.mount("https://", RedirectAdapter(server.url, pool_connections=1, pool_maxsize=pool_size))
@@ -0,0 +1,276 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+# Задержка подставного сервиса: число или функция без аргументов, которая возвращает очередную задержку
+def delay(latency):
+    return latency() if callable(latency) else latency
+
+
+# Распределение задержки из строки: "0.5" или "const:0.5", "uniform:0.2,1.5", "lognormal:0.8,0.5"
+# (медиана и сигма), "exp:0.5" (среднее)
+def parse_latency(spec):
+    kind, _, params = spec.partition(':') if ':' in spec else ('const', '', spec)
+    values = [float(value) for value in params.split(',')]
+    if kind == 'const':
+        return values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(*values)
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: random.lognormvariate(0, sigma) * median
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+# Подставной Telegram бот: отдаёт заранее заготовленные обновления и запоминает отправленные сообщения
+class FakeTelegramBot:
+    def __init__(self, updates=(), send_latency=0.0):
+        self.pending = list(updates)
+        self.sent = []
+        self.edited = []
+        self.send_latency = send_latency
+        self.polls = 0
+
+    # Как и Bot API, отдаёт не больше limit обновлений за запрос
+    async def get_updates(self, offset=None, timeout=10, limit=100, **kwargs):
+        self.polls += 1
+        if offset is not None:
+            self.pending = [u for u in self.pending if u.update_id >= offset]
+        if not self.pending:
+            await asyncio.sleep(min(timeout, 0.01))
+            return []
+        return self.pending[:limit]
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(delay(self.send_latency))
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent), chat=SimpleNamespace(id=chat_id), text=text)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        await asyncio.sleep(delay(self.send_latency))
+        self.edited.append((chat_id, message_id, text))
+
+
+_update_ids = itertools.count(1)
+
+
+# Обновление в том же виде, в каком его возвращает telegram.Bot.get_updates
+def make_update(chat_id, text, update_id=None):
+    message = SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text, photo=[])
+    return SimpleNamespace(update_id=update_id or next(_update_ids), message=message)
+
+
+# Подставной ассистент: ответ приходит через generation_latency секунд, не блокируя цикл событий
+class FakeAssistant:
+    def __init__(self, generation_latency=0.5):
+        self.generation_latency = generation_latency
+        self.calls = 0
+
+    async def reply(self, text):
+        self.calls += 1
+        await asyncio.sleep(self.generation_latency)
+        return f"Ответ на: {text}"
+
+    # Так вёл себя синхронный OpenAI клиент внутри async обработчика: цикл событий стоит всё время генерации
+    async def reply_blocking(self, text):
+        self.calls += 1
+        time.sleep(self.generation_latency)
+        return f"Ответ на: {text}"
+
+
+# Подставной AsyncOpenAI с той же формой client.beta.threads...; поток ответа выдаёт
+# первый кусок через ttft секунд, остальные - через token_interval секунд каждый.
+# Доля run_errors запусков падает до первого куска, chat.completions отвечает ещё через completion_latency секунд
+class FakeAsyncOpenAI:
+    def __init__(self, reply="Здравствуйте! Чем могу помочь?", ttft=0.0, token_interval=0.0, latency=0.0,
+                 run_errors=0.0, completion_latency=0.0):
+        self.reply = reply
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.latency = latency
+        self.run_errors = run_errors
+        self.completion_latency = completion_latency
+        self.calls = {}
+        self.threads = {}
+        # Сколько символов было в потоке на момент каждого запуска - размер запроса к модели
+        self.prompt_sizes = []
+        # Активный запуск потока. Как и в OpenAI, обрыв потока ответа запуск не останавливает:
+        # пока его не отменили, сообщения в поток не добавляются
+        self.active = {}
+        self.runs = itertools.count(1)
+        messages = SimpleNamespace(create=self._create_message, list=self._list_messages)
+        runs = SimpleNamespace(stream=self._stream, cancel=self._cancel_run, retrieve=self._retrieve_run)
+        threads = SimpleNamespace(create=self._create_thread, delete=self._delete_thread, messages=messages, runs=runs)
+        assistants = SimpleNamespace(retrieve=self._retrieve_assistant)
+        self.beta = SimpleNamespace(threads=threads, assistants=assistants)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    async def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(delay(self.latency))
+
+    async def _retrieve_assistant(self, assistant_id):
+        await self._call('assistants.retrieve')
+        return SimpleNamespace(id=assistant_id, tools=[])
+
+    async def _create_thread(self, **kwargs):
+        # Номер берётся до ожидания, чтобы одновременные вызовы не получили один поток
+        thread_id = f"thread_{self.calls.get('threads.create', 0) + 1}"
+        await self._call('threads.create')
+        self.threads[thread_id] = [(message['role'], message['content']) for message in kwargs.get('messages', [])]
+        return SimpleNamespace(id=thread_id)
+
+    async def _delete_thread(self, thread_id):
+        await self._call('threads.delete')
+        self.threads.pop(thread_id, None)
+
+    async def _create_message(self, thread_id, role, content):
+        await self._call('messages.create')
+        if thread_id in self.active:
+            raise RuntimeError(f"Can't add messages to {thread_id} while a run {self.active[thread_id].id} is active.")
+        self.threads[thread_id].append((role, content))
+
+    # Отмена занимает ещё один вызов API, до тех пор запуск в состоянии cancelling
+    async def _cancel_run(self, run_id, thread_id):
+        await self._call('runs.cancel')
+        run = self.active.get(thread_id)
+        if run and run.id == run_id:
+            run.status = "cancelling"
+            asyncio.get_running_loop().call_later(delay(self.latency), self._finish_run, thread_id, run, "cancelled")
+        return run
+
+    async def _retrieve_run(self, run_id, thread_id):
+        await self._call('runs.retrieve')
+        run = self.active.get(thread_id)
+        return run if run and run.id == run_id else SimpleNamespace(id=run_id, status="cancelled", usage=None)
+
+    def _finish_run(self, thread_id, run, status):
+        run.status = status
+        if self.active.get(thread_id) is run:
+            del self.active[thread_id]
+
+    async def _create_completion(self, model, messages, **kwargs):
+        await self._call('chat.completions.create')
+        await asyncio.sleep(delay(self.completion_latency))
+        size = sum(len(m['content']) for m in messages)
+        message = SimpleNamespace(content=f"Пересказ {size} символов")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(total_tokens=size // 3 + 10))
+
+    # Как AsyncPaginator в SDK: результат можно и дождаться через await, и перебрать через async for
+    def _list_messages(self, thread_id, **kwargs):
+        self.calls['messages.list'] = self.calls.get('messages.list', 0) + 1
+        messages = self.threads[thread_id]
+        if kwargs.get('order') != 'asc':
+            messages = messages[::-1]
+        return FakePage([
+            SimpleNamespace(role=role, content=[SimpleNamespace(type="text", text=SimpleNamespace(value=content))])
+            for role, content in messages
+        ])
+
+    def _stream(self, thread_id, event_handler, **kwargs):
+        return FakeRunStream(self, thread_id, event_handler)
+
+
+class FakeRunStream:
+    def __init__(self, client, thread_id, event_handler):
+        self.client = client
+        self.thread_id = thread_id
+        self.event_handler = event_handler
+
+    async def __aenter__(self):
+        await self.client._call('runs.stream')
+        if self.thread_id in self.client.active:
+            raise RuntimeError(f"Thread {self.thread_id} already has an active run.")
+        self.client.prompt_sizes.append(sum(len(content) for _, content in self.client.threads[self.thread_id]))
+        self.run = SimpleNamespace(id=f"run_{next(self.client.runs)}", status="in_progress", usage=None)
+        self.client.active[self.thread_id] = self.run
+        # SDK запоминает запуск из события thread.run.created; подставной поток событий не шлёт
+        self.event_handler._AsyncAssistantEventHandler__current_run = self.run
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def until_done(self):
+        try:
+            await self._generate()
+        except asyncio.CancelledError:
+            # Клиент перестал читать поток, а запуск дорабатывает в OpenAI
+            loop = asyncio.get_running_loop()
+            loop.call_later(delay(self.client.ttft), self.client._finish_run, self.thread_id, self.run, "completed")
+            raise
+
+    async def _generate(self):
+        tokens = self.client.reply.split(" ")
+        await asyncio.sleep(delay(self.client.ttft))
+        if random.random() < self.client.run_errors:
+            self.client._finish_run(self.thread_id, self.run, "failed")
+            raise RuntimeError("run failed")
+        for n, token in enumerate(tokens):
+            if n:
+                await asyncio.sleep(delay(self.client.token_interval))
+            value = token if n == len(tokens) - 1 else token + " "
+            await self.event_handler.on_text_delta(SimpleNamespace(value=value), None)
+        self.client.threads[self.thread_id].append(("assistant", self.client.reply))
+        self.client._finish_run(self.thread_id, self.run, "completed")
+
+
+# Страница списка как у SDK: есть .data, await и асинхронный перебор
+class FakePage:
+    def __init__(self, data):
+        self.data = data
+
+    def __await__(self):
+        yield from asyncio.sleep(0).__await__()
+        return self
+
+    async def __aiter__(self):
+        for item in self.data:
+            yield item
+
+
+# Синхронный подставной OpenAI для play.py: chat.completions.create отвечает через latency секунд
+class FakeOpenAI:
+    def __init__(self, reply="Здравствуйте! Чем могу помочь?", latency=0.0):
+        self.reply = reply
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+
+    def _create_completion(self, **kwargs):
+        with self.lock:
+            self.calls['chat.completions.create'] = self.calls.get('chat.completions.create', 0) + 1
+        time.sleep(delay(self.latency))
+        message = SimpleNamespace(content=self.reply, tool_calls=None)
+        usage = SimpleNamespace(total_tokens=sum(len(m['content']) for m in kwargs['messages']) // 3 + len(self.reply) // 3)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+# ASGI приложение под uvicorn в отдельном потоке со своим циклом событий, на свободном порту
+class LocalServer:
+    def __init__(self, app):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=0, log_level='warning'))
+        self.thread = threading.Thread(target=asyncio.run, args=(self.server.serve(),), daemon=True)
+
+    @property
+    def port(self):
+        return self.server.servers[0].sockets[0].getsockname()[1]
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    # Остановка как у runtime: новые запросы не принимаются, затем выполняются on_shutdown приложения
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import sys
+import time
+
+import metrics
+from play1 import VkBot
+from session_store import SessionStore
+from bench.fakes import FakeAsyncOpenAI, parse_latency
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Пользователи пишут одновременно, запуски ассистента отвечают с тяжёлым хвостом задержки и иногда падают:
+# время ответа пользователю с запасным путём через chat.completions и без него
+async def run(budget, args):
+    client = FakeAsyncOpenAI(
+        ttft=parse_latency(args.ttft),
+        run_errors=args.run_errors,
+        completion_latency=parse_latency(args.completion_latency),
+    )
+    config = {
+        'name': f'bench_{budget}', 'token': 'x', 'assistant_id': 'asst', 'instructions': '', 'transcript': 'off',
+        'price_file': 'missing.xlsx', 'max_concurrency': args.users, 'latency_budget': budget,
+        # Предохранитель в замере не размыкается, чтобы каждое сообщение проходило через гонку
+        'breaker_failures': args.messages + 1,
+    }
+    bot = VkBot(config, client, SessionStore().view('bench'))
+    latencies, errors = [], []
+
+    async def send_vk_message(user_id, text):
+        pass
+
+    async def one(user_id, message):
+        started = time.perf_counter()
+        result = await bot.handle_message_new(message, user_id, {})
+        if result == 'ok':
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(result)
+
+    bot.send_vk_message = send_vk_message
+    for n in range(0, args.messages, args.users):
+        await asyncio.gather(*(one(user_id, f"сообщение {n + user_id}") for user_id in range(min(args.users, args.messages - n))))
+    await asyncio.gather(*bot.hedge.settling.values())
+    # Запасной ответ должен оказаться в потоке сразу после вопроса, на который он отвечал
+    saved = sum(
+        1 for messages in client.threads.values()
+        for (role, _), (next_role, text) in zip(messages, messages[1:])
+        if role == "user" and next_role == "assistant" and text.startswith("Пересказ")
+    )
+    used = sum(value for (bot, _), value in metrics.fallbacks_total.values.items() if bot == config['name'])
+    return latencies, errors, client.calls, used, saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время ответа при медленных и падающих запусках ассистента")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--ttft', default='lognormal:0.5,1.2', help="время до первого куска ответа запуска")
+    parser.add_argument('--run-errors', type=float, default=0.05, help="доля запусков, которые падают")
+    parser.add_argument('--completion-latency', default='uniform:0.3,0.8')
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0, 2.0, 1.0])
+    args = parser.parse_args()
+
+    print(f"{'бюджет':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'макс':>7} {'ошибок':>7} {'запросов':>9} "
+          f"{'ответов':>8} {'в потоке':>9}")
+    lost = 0
+    for budget in args.budgets:
+        latencies, errors, calls, used, saved = asyncio.run(run(budget, args))
+        lost += used - saved
+        print(f"{budget or 'нет':>7} " + " ".join(f"{percentile(latencies, p):>6.2f}с" for p in (50, 95, 99, 100))
+              + f" {len(errors):>7} {calls.get('chat.completions.create', 0):>9} {used:>8} {saved:>9}")
+    if lost:
+        sys.exit(f"Запасных ответов не в потоке или не на своём месте: {lost}")
+
+
+if __name__ == '__main__':
+    main()
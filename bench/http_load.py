@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import http.client
+import json
+import queue
+import sys
+import threading
+import time
+
+import uvicorn
+
+import runtime
+from play1 import VkBot
+from session_store import SessionStore
+from bench.fakes import FakeAsyncOpenAI
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# HTTP сервер runtime с VK ботом в режиме callback на подставных OpenAI и VK, в отдельном потоке со своим циклом
+class Server:
+    def __init__(self, port, latency):
+        self.port = port
+        self.delivered = 0
+        config = {
+            'name': 'vk_load', 'token': 'x', 'assistant_id': 'asst', 'instructions': '',
+            'vk_mode': 'callback', 'max_concurrency': 64, 'transcript': 'off', 'price_file': 'missing.xlsx',
+        }
+        self.bot = VkBot(config, FakeAsyncOpenAI(latency=latency), SessionStore().view('vk_load'))
+        self.bot.send_vk_message = self.send_vk_message
+        runtime.app.add_route(self.bot.webhook_path, self.bot.handle_callback, methods=('POST',))
+        self.server = uvicorn.Server(uvicorn.Config(
+            runtime.app, host='127.0.0.1', port=port, timeout_keep_alive=75, log_level='warning',
+        ))
+        self.thread = threading.Thread(target=asyncio.run, args=(self.server.serve(),), daemon=True)
+
+    async def send_vk_message(self, user_id, text):
+        self.delivered += 1
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+# Отправитель с постоянным соединением (keep-alive). Время считается от момента, когда запрос
+# должен был уйти по расписанию, поэтому очередь на стороне клиента тоже попадает в задержку
+def sender(port, jobs, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        scheduled, body = job
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            connection.request('POST', '/webhook', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            latencies.append(time.perf_counter() - scheduled)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+
+
+def run_step(port, rps, duration, senders, first_event):
+    jobs = queue.Queue()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=sender, args=(port, jobs, latencies, errors)) for _ in range(senders)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter() + 0.1
+    total = int(rps * duration)
+    for n in range(total):
+        event_id = first_event + n
+        body = json.dumps({
+            'type': 'message_new',
+            'event_id': f"load-{event_id}",
+            'object': {'message': {'text': 'че там?', 'from_id': event_id % 1000, 'peer_id': event_id % 1000,
+                                   'conversation_message_id': event_id}},
+        })
+        jobs.put((started + n / rps, body))
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    return latencies, errors, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на вебхук VK: p50/p99 ответа HTTP при растущем RPS")
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--rps', type=int, nargs='+', default=[50, 100, 200, 400, 800])
+    parser.add_argument('--duration', type=float, default=5.0, help="секунд на каждую ступень")
+    parser.add_argument('--senders', type=int, default=32, help="одновременных соединений")
+    parser.add_argument('--latency', type=float, default=0.2, help="задержка каждого вызова подставного OpenAI")
+    parser.add_argument('--max-p99', type=float, help="завершиться с ошибкой, если p99 любой ступени больше, мс")
+    args = parser.parse_args()
+
+    server = Server(args.port, args.latency)
+    server.start()
+    failed = False
+    first_event = 0
+    print(f"{'rps':>6} {'sent':>6} {'errors':>6} {'p50 мс':>8} {'p99 мс':>8} {'max мс':>8}")
+    try:
+        for rps in args.rps:
+            latencies, errors, total = run_step(args.port, rps, args.duration, args.senders, first_event)
+            first_event += total
+            p50, p99 = percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000
+            print(f"{rps:>6} {total:>6} {len(errors):>6} {p50:>8.1f} {p99:>8.1f} {max(latencies) * 1000:>8.1f}")
+            if errors or (args.max_p99 and p99 > args.max_p99):
+                failed = True
+        # Ответы пользователям продолжают уходить после того, как вебхук вернул "ok"
+        deadline = time.time() + 30
+        while server.delivered < first_event and time.time() < deadline:
+            time.sleep(0.1)
+        print(f"Отправлено ответов пользователям: {server.delivered} из {first_event}")
+    finally:
+        server.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
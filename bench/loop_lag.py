@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+
+from dispatcher import ChatDispatcher
+from loop_lag import LoopLagMonitor
+from bench.fakes import FakeAssistant, FakeTelegramBot, make_update
+
+
+# Задержка цикла событий при блокирующей и асинхронной генерации ответа
+async def run(chats, latency, blocking):
+    bot = FakeTelegramBot()
+    assistant = FakeAssistant(latency)
+    reply = assistant.reply_blocking if blocking else assistant.reply
+
+    async def handle_telegram_message(update):
+        response_text = await reply(update.message.text)
+        await bot.send_message(update.message.chat.id, response_text)
+
+    monitor = LoopLagMonitor(interval=0.01, report_every=0)
+    lag_task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    dispatcher = ChatDispatcher(handle_telegram_message, max_concurrency=chats)
+    for chat_id in range(chats):
+        dispatcher.submit(chat_id, make_update(chat_id, "привет"))
+    await dispatcher.join()
+    await asyncio.sleep(0.05)
+    lag_task.cancel()
+    return monitor.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка цикла событий во время генерации ответов")
+    parser.add_argument('--chats', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.2)
+    args = parser.parse_args()
+
+    for blocking in (True, False):
+        stats = asyncio.run(run(args.chats, args.latency, blocking))
+        mode = "синхронный клиент" if blocking else "асинхронный клиент"
+        print(f"{mode}: средняя задержка {stats['avg_ms']:.1f} мс, максимум {stats['max_ms']:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
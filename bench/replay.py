@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from http.client import HTTPConnection
+
+import runtime
+from play1 import VkBot
+from tg_bot import TelegramBot
+from session_store import SessionStore
+from bench.fakes import FakeAsyncOpenAI, FakeOpenAI, FakeTelegramBot, LocalServer, make_update, parse_latency
+from bench.fake_vk import FakeVkServer, redirect_to
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Записанный трафик: список (секунда от начала, user_id, текст). Понимает три формата:
+# JSONL журнала диалогов (history.HistorySink пишет именно его), app.log и istoria_dialogov.txt
+def load_traffic(path, interval):
+    with open(path, encoding="utf-8", errors="replace") as file:
+        text = file.read()
+
+    if path.endswith(".jsonl"):
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        messages = [(record['ts'], record['user_id'], record['question']) for record in records]
+    elif "Вопрос:" in text:
+        # Один записанный разговор без времени: сообщения идут раз в interval секунд
+        questions = re.findall(r"^Вопрос: (.*)$", text, re.M)
+        messages = [(n * interval, 0, question) for n, question in enumerate(questions)]
+    else:
+        # app.log: "Пришло сообщение от X: текст", в старых логах только "... поток для пользователя X"
+        messages = []
+        for ts, user_id, question in re.findall(
+            r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d+) - INFO - Пришло сообщение от (\d+): (.*)$", text, re.M
+        ):
+            messages.append((ts, user_id, question))
+        if not messages:
+            for ts, user_id in re.findall(
+                r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d+) - INFO - (?:Создан новый|Используется существующий) "
+                r"поток для пользователя (\d+)$", text, re.M
+            ):
+                messages.append((ts, user_id, "че там?"))
+        messages = [
+            (datetime.strptime(ts, "%Y-%m-%d %H:%M:%S,%f").timestamp(), user_id, question)
+            for ts, user_id, question in messages
+        ]
+
+    if not messages:
+        sys.exit(f"В {path} не найдено сообщений")
+    messages.sort(key=lambda message: message[0])
+    start = messages[0][0]
+    return [(ts - start, user_id, question) for ts, user_id, question in messages]
+
+
+# Каждый записанный пользователь повторяется users раз под разными id; паузы длиннее max_gap сжимаются
+def expand(traffic, users, max_gap):
+    ids = {}
+    for _, user_id, _ in traffic:
+        ids.setdefault(user_id, len(ids))
+    result = []
+    shift = 0.0
+    previous = 0.0
+    for ts, user_id, question in traffic:
+        shift += max(0.0, ts - previous - max_gap)
+        previous = ts
+        for copy in range(users):
+            result.append((ts - shift, 1000 + copy * len(ids) + ids[user_id], question))
+    return result
+
+
+# Время ответа: сообщение считается отвеченным первым сообщением бота этому пользователю после него.
+# Боты склеивают серии сообщений, поэтому при coalesced один ответ закрывает все ожидающие сообщения
+# пользователя; play.py отвечает на каждое сообщение отдельно
+class Tracker:
+    def __init__(self, coalesced=True):
+        self.coalesced = coalesced
+        self.pending = defaultdict(deque)
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.expected = 0
+
+    def sent(self, user_id):
+        with self.lock:
+            self.pending[user_id].append(time.perf_counter())
+
+    def replied(self, user_id):
+        now = time.perf_counter()
+        with self.lock:
+            queue = self.pending.get(user_id)
+            while queue:
+                self.latencies.append(now - queue.popleft())
+                if not self.coalesced:
+                    break
+            if len(self.latencies) >= self.expected:
+                self.done.set()
+
+
+def bot_config(args):
+    config = runtime.load_config(args.config)
+    bot = next((bot for bot in config['bots'] if bot['name'] == args.bot), None)
+    if bot is None:
+        sys.exit(f"Бот {args.bot} не найден в {args.config}")
+    bot.update(token='replay', assistant_id='asst_replay', notify_token=None, history_dir=None)
+    for item in args.set:
+        key, _, value = item.partition('=')
+        try:
+            bot[key] = json.loads(value)
+        except ValueError:
+            bot[key] = value
+    return bot
+
+
+async def replay_bot(args, traffic, tracker):
+    config = bot_config(args)
+    client = FakeAsyncOpenAI(ttft=args.openai_ttft, token_interval=args.openai_token_interval, latency=args.openai_latency)
+    sessions = SessionStore().view(config['name'])
+    calls = {}
+
+    if config['platform'] == 'vk':
+        server = FakeVkServer(latency=args.platform_latency, handshake_delay=0.0)
+        bot = VkBot(config, client, sessions)
+        redirect_to(bot.vk_client.vk_session.http, server)
+        send = bot.send_vk_message
+
+        async def send_vk_message(user_id, text):
+            result = await send(user_id, text)
+            tracker.replied(user_id)
+            return result
+
+        bot.send_vk_message = send_vk_message
+        submit = lambda user_id, text: bot.dispatcher.submit(user_id, _VkEvent(text, user_id))
+        platform_calls = lambda: {'vk.requests': server.requests}
+    else:
+        bot = TelegramBot(config, client, sessions)
+        bot.telegram_bot = fake = FakeTelegramBot(send_latency=args.platform_latency)
+        send = bot.send_telegram_message
+
+        async def send_telegram_message(chat_id, text):
+            result = await send(chat_id, text)
+            tracker.replied(chat_id)
+            return result
+
+        bot.send_telegram_message = send_telegram_message
+        submit = lambda user_id, text: bot.dispatcher.submit(user_id, make_update(user_id, text))
+        platform_calls = lambda: {'telegram.send': len(fake.sent), 'telegram.edit': len(fake.edited)}
+
+    started = time.perf_counter()
+    for ts, user_id, text in traffic:
+        if args.speed:
+            await asyncio.sleep(max(0.0, started + ts / args.speed - time.perf_counter()))
+        tracker.sent(user_id)
+        submit(user_id, text)
+    await asyncio.wait_for(bot.dispatcher.join(), args.timeout)
+    elapsed = time.perf_counter() - started
+    calls.update(client.calls)
+    calls.update(platform_calls())
+    return elapsed, calls
+
+
+class _VkEvent:
+    def __init__(self, text, user_id):
+        self.text = text
+        self.user_id = user_id
+        self.attachments = {}
+
+
+# play.py: POST /webhook на uvicorn с приложением play.py, ответы генерирует пул потоков вебхука
+def replay_webhook(args, traffic, tracker):
+    os.environ.setdefault('VK_API_TOKEN', 'replay')
+    import play
+    from work_queue import WorkerPool
+
+    server = FakeVkServer(latency=args.platform_latency, handshake_delay=0.0)
+    redirect_to(play.vk_client().vk_session.http, server)
+    play.client = client = FakeOpenAI(latency=args.openai_latency)
+    send = play.send_vk_message
+
+    def send_vk_message(user_id, text):
+        send(user_id, text)
+        tracker.replied(user_id)
+
+    play.send_vk_message = send_vk_message
+    play.recent_events = play.RecentIds()
+    play.worker_pool = WorkerPool(play.process_message_new, workers=play.webhook_workers, maxsize=0)
+    local = LocalServer(play.app).start()
+    http = HTTPConnection('127.0.0.1', local.port, timeout=10)
+
+    started = time.perf_counter()
+    for n, (ts, user_id, text) in enumerate(traffic):
+        if args.speed:
+            time.sleep(max(0.0, started + ts / args.speed - time.perf_counter()))
+        tracker.sent(user_id)
+        http.request('POST', '/webhook', headers={'Content-Type': 'application/json'}, body=json.dumps({
+            'type': 'message_new',
+            'event_id': f"replay-{n}",
+            'object': {'message': {'text': text, 'from_id': user_id, 'peer_id': user_id, 'conversation_message_id': n}},
+        }))
+        http.getresponse().read()
+    tracker.done.wait(args.timeout)
+    elapsed = time.perf_counter() - started
+    local.stop()
+    return elapsed, {**client.calls, 'vk.requests': server.requests}
+
+
+def compare(result, baseline, tolerance):
+    failures = []
+    if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+        failures.append(f"пропускная способность {result['throughput']:.1f} < {baseline['throughput']:.1f}")
+    if result['p99_ms'] > baseline['p99_ms'] * (1 + tolerance):
+        failures.append(f"p99 {result['p99_ms']:.0f} мс > {baseline['p99_ms']:.0f} мс")
+    if result['calls_per_message'] > baseline['calls_per_message'] * (1 + tolerance):
+        failures.append(f"вызовов API на сообщение {result['calls_per_message']:.2f} > {baseline['calls_per_message']:.2f}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон записанного трафика через обработчики ботов на подставных сервисах")
+    parser.add_argument('traffic', help="JSONL журнала диалогов, app.log или istoria_dialogov.txt")
+    parser.add_argument('--target', choices=['bot', 'webhook'], default='bot',
+                        help="bot - бот из bots.json (VkBot или TelegramBot), webhook - play.py")
+    parser.add_argument('--config', default='bots.json')
+    parser.add_argument('--bot', default='vk_kuzov')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help="переопределить настройку бота")
+    parser.add_argument('--users', type=int, default=50, help="копий каждого записанного пользователя")
+    parser.add_argument('--speed', type=float, default=0.0, help="ускорение записи; 0 - всё сразу")
+    parser.add_argument('--interval', type=float, default=5.0, help="пауза между сообщениями в файлах без времени")
+    parser.add_argument('--max-gap', type=float, default=5.0, help="паузы длиннее сжимаются до этой")
+    parser.add_argument('--openai-latency', type=parse_latency, default=parse_latency('lognormal:0.3,0.5'))
+    parser.add_argument('--openai-ttft', type=parse_latency, default=parse_latency('lognormal:1.0,0.5'))
+    parser.add_argument('--openai-token-interval', type=parse_latency, default=parse_latency('0.02'))
+    parser.add_argument('--platform-latency', type=parse_latency, default=parse_latency('uniform:0.02,0.1'))
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--baseline', metavar='PATH', help="завершиться с ошибкой при регрессии относительно базы")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    traffic = expand(load_traffic(args.traffic, args.interval), args.users, args.max_gap)
+    tracker = Tracker(coalesced=args.target == 'bot')
+    tracker.expected = len(traffic)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.target == 'webhook':
+        elapsed, calls = replay_webhook(args, traffic, tracker)
+    else:
+        elapsed, calls = asyncio.run(replay_bot(args, traffic, tracker))
+
+    latencies = tracker.latencies or [float('nan')]
+    result = {
+        'messages': len(traffic),
+        'answered': len(tracker.latencies),
+        'elapsed_s': elapsed,
+        'throughput': len(tracker.latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'calls': calls,
+        'calls_per_message': sum(calls.values()) / len(traffic),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }
+
+    print(f"Сообщений: {result['messages']}, отвечено: {result['answered']} за {elapsed:.1f} с "
+          f"({result['throughput']:.1f} в секунду)")
+    print(f"Время ответа: p50 {result['p50_ms']:.0f} мс, p90 {result['p90_ms']:.0f} мс, "
+          f"p99 {result['p99_ms']:.0f} мс, максимум {result['max_ms']:.0f} мс")
+    print(f"Вызовов API на сообщение: {result['calls_per_message']:.2f} {calls}")
+    print(f"Память: пик {result['peak_rss_mb']:.0f} МБ, рост за прогон {result['rss_growth_mb']:.0f} МБ")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    failures = []
+    if result['answered'] < result['messages']:
+        failures.append(f"без ответа осталось {result['messages'] - result['answered']} сообщений")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            failures += compare(result, json.load(file), args.tolerance)
+    if failures:
+        sys.exit("Регрессия: " + "; ".join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import sys
+import time
+import random
+import argparse
+
+from response_cache import ResponseCache
+
+# Первые вопросы разговоров и их варианты с опечатками, другим порядком слов и окончаниями.
+# Вопросы одной группы можно отвечать одним ответом, вопросы разных групп - нельзя
+QUESTIONS = {
+    'greeting': ["Здравствуйте", "здравствуйте!", "Здравствуйте.", "здраствуйте", "Здраствуйте!"],
+    'good_day': ["добрый день", "Добрый день!"],
+    'sill_price': ["сколько стоит порог", "Сколько стоит порог?", "сколько стоит порог??", "сколько стоит пороги",
+                   "сколько стоят пороги", "цена порога"],
+    'arch_price': ["сколько стоит арка", "Сколько стоит арка?", "сколько стоят арки", "цена арки", "цена на арку"],
+    'paint_price': ["а покраска сколько", "покраска сколько стоит?", "сколько стоит покраска"],
+    'sill_turnkey': ["замена порога под ключ цена", "Замена порога под ключ, цена?", "сколько стоит замена порога"],
+    'arch_turnkey': ["замена арки под ключ цена", "Замена арки под ключ цена", "сколько стоит замена арки"],
+    'saturday': ["можно записаться на субботу", "Можно записаться на субботу?"],
+    'friday': ["можно записаться на пятницу"],
+}
+
+
+def read_dialog_questions(path):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return [line[len("Вопрос: "):].strip() for line in file if line.startswith("Вопрос: ")]
+    except FileNotFoundError:
+        return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Доля попаданий и сэкономленное время кэша ответов")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--generation', type=float, default=4.0, help="среднее время генерации ответа, с")
+    parser.add_argument('--threshold', type=float, default=0.7)
+    parser.add_argument('--dialogs', default="istoria_dialogov.txt")
+    args = parser.parse_args()
+
+    # Вопросы из истории диалогов - каждый сам себе группа
+    questions = [(question, intent) for intent, variants in QUESTIONS.items() for question in variants]
+    questions += [(question, question) for question in read_dialog_questions(args.dialogs)]
+    cache = ResponseCache(threshold=args.threshold, report_every=0)
+    random.seed(1)
+    lookup_time = 0.0
+    wrong = []
+    for _ in range(args.requests):
+        question, intent = random.choice(questions)
+        started = time.perf_counter()
+        response = cache.get(question, "instructions")
+        lookup_time += time.perf_counter() - started
+        if response is None:
+            cache.put(question, intent, random.expovariate(1 / args.generation), "instructions")
+        elif response != intent:
+            wrong.append((question, response))
+
+    stats = cache.stats
+    print(f"Запросов {stats['lookups']}, попаданий {cache.hit_rate():.1%} "
+          f"(точных {stats['exact']}, нечётких {stats['fuzzy']}), записей в кэше {len(cache.entries)}")
+    print(f"Поиск в кэше в среднем {lookup_time / stats['lookups'] * 1e6:.0f} мкс, "
+          f"сэкономлено {stats['saved_seconds'] / stats['lookups']:.2f} с генерации на запрос")
+    if not stats['fuzzy']:
+        sys.exit("Нечёткий уровень не дал ни одного попадания: проверьте threshold и наличие numpy")
+    if wrong:
+        sys.exit(f"Чужих ответов: {len(wrong)}, например {sorted(set(wrong))[:5]}")
+
+
+if __name__ == '__main__':
+    main()
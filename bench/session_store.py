@@ -0,0 +1,61 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from session_store import SqliteSessionStore
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def measure(name, func, keys):
+    timings = []
+    for key in keys:
+        started = time.perf_counter()
+        func(key)
+        timings.append(time.perf_counter() - started)
+    print(f"{name}: p50 {percentile(timings, 50) * 1e6:.1f} мкс, p99 {percentile(timings, 99) * 1e6:.1f} мкс, "
+          f"{len(keys) / sum(timings):.0f} оп/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка поиска thread_id в SqliteSessionStore")
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--cache', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        store = SqliteSessionStore(path, capacity=args.cache)
+        now = time.time()
+        started = time.perf_counter()
+        store.conn.execute("BEGIN")
+        store.conn.executemany(
+            "INSERT INTO sessions (bot, chat_id, thread_id, last_used) VALUES (?, ?, ?, ?)",
+            (("bench", str(n), f"thread_{n}", now) for n in range(args.users))
+        )
+        store.conn.execute("COMMIT")
+        print(f"Загружено {args.users} пользователей за {time.perf_counter() - started:.1f} с, "
+              f"база {os.path.getsize(path) / 2 ** 20:.0f} МБ")
+
+        # Первое обращение к пользователю читает базу, повторные попадают в LRU кэш
+        hot = random.sample(range(args.users), min(args.cache, args.lookups))
+        measure("промах кэша (SQLite)", lambda n: store.get("bench", n), hot)
+        measure("попадание в кэш", lambda n: store.get("bench", n), hot)
+        measure("запись нового потока", lambda n: store.set("bench", args.users + n, f"thread_new_{n}"),
+                range(min(args.lookups, 10000)))
+        cold = [random.randrange(args.users) for _ in range(args.lookups)]
+        measure("случайные пользователи", lambda n: store.get("bench", n), cold)
+
+        sessions = store.view("bench")
+        assert sessions[hot[0]] == f"thread_{hot[0]}"
+        assert args.users + args.lookups * 10 not in sessions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+from supervisor import Supervisor, consume
+
+
+def burn(seconds):
+    deadline = time.process_time() + seconds
+    while time.process_time() < deadline:
+        pass
+
+
+# Рабочий процесс с настоящим VkBot на подставном OpenAI; отправка в VK заменена работой процессора
+# длительностью cpu секунд (разбор JSON, TLS и прочее, что в одном процессе упирается в GIL)
+def worker(index, queue, progress, results, cpu, latency):
+    from play1 import VkBot
+    from session_store import SessionStore
+    from bench.fakes import FakeAsyncOpenAI
+
+    config = {
+        'name': 'bench', 'token': f'bench{index}', 'assistant_id': 'asst', 'instructions': '', 'transcript': 'off',
+        'price_file': 'missing.xlsx', 'max_concurrency': 64, 'context_max_tokens': 0,
+        # Все сообщения приходят сразу; замер пропускной способности не должен упираться в допуск
+        'bot_max_queued': 10 ** 9,
+    }
+    bot = VkBot(config, FakeAsyncOpenAI(latency=latency), SessionStore().view('bench'))
+    handled = []
+
+    async def send_vk_message(user_id, text):
+        burn(cpu)
+
+    # Склеенные сообщения одного пользователя обрабатываются одним запуском; считаем исходные сообщения
+    handle_event = bot.dispatcher.handler
+
+    async def counted(event):
+        await handle_event(event)
+        handled.append(event.text.count("\n") + 1)
+
+    bot.send_vk_message = send_vk_message
+    bot.dispatcher.handler = counted
+    results.put(('ready', index))
+    asyncio.run(consume(index, queue, progress, {'bench': bot}))
+    results.put(('done', sum(handled)))
+
+
+def run(workers, args):
+    results = multiprocessing.get_context('spawn').Queue()
+    supervisor = Supervisor(workers, worker, args=(results, args.cpu, args.latency))
+    supervisor.start()
+    for _ in range(workers):
+        results.get()
+
+    started = time.perf_counter()
+    for n in range(args.messages):
+        user_id = n % args.users
+        supervisor.submit('bench', user_id, {'text': f"сообщение {n}", 'user_id': user_id, 'attachments': {}})
+    supervisor.stop(timeout=args.timeout)
+    elapsed = time.perf_counter() - started
+    handled = [results.get()[1] for _ in range(workers)]
+    return elapsed, handled
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность в зависимости от числа рабочих процессов")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--cpu', type=float, default=0.002, help="процессорное время на сообщение, с")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка каждого вызова подставного OpenAI, с")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}")
+    base = None
+    for workers in args.workers:
+        elapsed, handled = run(workers, args)
+        throughput = sum(handled) / elapsed
+        base = base or throughput
+        print(f"процессов {workers}: {throughput:.0f} сообщений в секунду, ускорение {throughput / base:.2f}, "
+              f"по процессам {handled}")
+        if sum(handled) != args.messages:
+            sys.exit(f"Обработано {sum(handled)} сообщений из {args.messages}")
+        # На одном ядре процессы делят его между собой, и ускорения ждать неоткуда
+        if workers > 1 and os.cpu_count() > 1 and throughput <= base:
+            sys.exit(f"{workers} процессов не быстрее одного: {throughput:.0f} против {base:.0f} сообщений в секунду")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_POLL = re.compile(r"Опрос \w+ запущен")
+OPENAI_READY = "Модули OpenAI загружены"
+
+
+# Конфиг с одним ботом: секреты из *_env заменены заглушками, состояние и журналы - во временной папке
+def bot_config(config, bot, directory):
+    bot = {key: value for key, value in bot.items() if key != 'log_file'}
+    for key in [key for key in bot if key.endswith('_env')]:
+        bot.pop(key)
+        bot.setdefault(key[:-4], "123456:bench" if key[:-4].endswith('token') else "bench")
+    return dict(
+        config,
+        bots=[bot],
+        http_port=0,
+        session_db=os.path.join(directory, "sessions.db"),
+        history_dir=os.path.join(directory, "history"),
+    )
+
+
+# Строки -X importtime: (уровень вложенности, модуль, собственное время, полное время) в микросекундах
+def parse_importtime(lines):
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, total, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((level, name.strip(), int(own), int(total)))
+    return imports
+
+
+# Запускает runtime с одним ботом и ждёт в stderr первого запроса опроса и загрузки openai
+def measure(path, name, timeout):
+    env = dict(os.environ, OPENAI_API_KEY="bench", PYTHONDONTWRITEBYTECODE="")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "runtime.py", "--config", path, "--only", name],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True,
+    )
+    lines, result = [], {}
+
+    def read():
+        for line in process.stderr:
+            if 'first_poll' not in result and FIRST_POLL.search(line):
+                result['first_poll'] = time.perf_counter() - started
+                result['imports'] = parse_importtime(lines)
+            if OPENAI_READY in line:
+                result['openai_ready'] = time.perf_counter() - started
+                break
+            lines.append(line)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(timeout)
+    process.kill()
+    process.wait()
+    if 'first_poll' not in result:
+        sys.exit(f"{name}: опрос не начался за {timeout} с\n" + "".join(lines[-20:]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время от запуска процесса до первого запроса опроса для каждого бота")
+    parser.add_argument('--config', default=os.path.join(ROOT, 'bots.json'))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help="сколько самых долгих импортов показать")
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as file:
+        config = json.load(file)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for bot in config['bots']:
+            path = os.path.join(directory, f"{bot['name']}.json")
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(bot_config(config, bot, directory), file, ensure_ascii=False)
+            runs = [measure(path, bot['name'], args.timeout) for _ in range(args.runs)]
+
+            first_poll = statistics.median(run['first_poll'] for run in runs)
+            ready = [run['openai_ready'] for run in runs if 'openai_ready' in run]
+            imports = runs[-1]['imports']
+            print(f"{bot['name']} ({bot['platform']}): первый опрос через {first_poll * 1000:.0f} мс, "
+                  f"импорты до него {sum(own for _, _, own, _ in imports) / 1000:.0f} мс"
+                  + (f", openai готов через {statistics.median(ready) * 1000:.0f} мс" if ready else ""))
+            top = min(level for level, _, _, _ in imports)
+            heaviest = sorted((item for item in imports if item[0] == top), key=lambda item: -item[3])
+            for _, module, _, total in heaviest[:args.top]:
+                print(f"    {total / 1000:7.1f} мс  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import time
+import asyncio
+import argparse
+
+from session_store import SessionStore
+from tg_bot import TelegramBot
+from bench.fakes import FakeAsyncOpenAI, FakeTelegramBot, make_update
+
+
+# Время до первого видимого текста и до полного ответа, с потоковой доставкой и без неё
+async def run(stream_replies, args):
+    reply = " ".join(f"слово{n}" for n in range(args.tokens))
+    client = FakeAsyncOpenAI(reply=reply, ttft=args.ttft, token_interval=args.token_interval)
+    config = {
+        'name': 'bench', 'token': '1:bench', 'assistant_id': 'asst_bench', 'instructions': '',
+        'stream_replies': stream_replies, 'stream_edit_interval': args.edit_interval,
+    }
+    bot = TelegramBot(config, client, SessionStore().view('bench'))
+    bot.telegram_bot = fake = FakeTelegramBot(send_latency=args.send_latency)
+
+    visible = []
+    send_message = fake.send_message
+
+    async def timed_send_message(chat_id, text, **kwargs):
+        message = await send_message(chat_id, text, **kwargs)
+        visible.append(time.perf_counter())
+        return message
+
+    fake.send_message = timed_send_message
+    started = time.perf_counter()
+    await bot.handle_telegram_message(make_update(1, "привет"))
+    total = time.perf_counter() - started
+    final = fake.edited[-1][2] if fake.edited else fake.sent[-1][1]
+    assert final == reply, final
+    return visible[0] - started, total, len(fake.edited)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFT и полная задержка ответа в Telegram")
+    parser.add_argument('--tokens', type=int, default=300)
+    parser.add_argument('--ttft', type=float, default=0.8, help="задержка первого куска от OpenAI, с")
+    parser.add_argument('--token-interval', type=float, default=0.02)
+    parser.add_argument('--send-latency', type=float, default=0.1)
+    parser.add_argument('--edit-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    for stream_replies in (False, True):
+        ttft, total, edits = asyncio.run(run(stream_replies, args))
+        mode = "потоковая доставка" if stream_replies else "ответ целиком"
+        print(f"{mode}: первый текст через {ttft:.2f} с, полный ответ через {total:.2f} с, правок {edits}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import vk_api
+
+from vk_client import VkClient
+from bench.fake_vk import FakeVkServer, redirect_to
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Как раньше в play.py: новая сессия VK на каждый ответ
+def per_request_send(server):
+    def send(user_id):
+        vk_session = vk_api.VkApi(token="bench")
+        redirect_to(vk_session.http, server)
+        vk_session.get_api().messages.send(user_id=user_id, message="ответ", random_id=0)
+    return send
+
+
+def shared_send(server, batch_window):
+    client = VkClient("bench", batch_window=batch_window, rps=1000)
+    redirect_to(client.vk_session.http, server)
+    return lambda user_id: client.send_message(user_id, "ответ")
+
+
+def run(name, send, messages, threads, server):
+    requests_before, connections_before = server.requests, server.connections
+    timings = []
+
+    def timed(user_id):
+        started = time.perf_counter()
+        send(user_id)
+        timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(timed, range(messages)))
+    elapsed = time.perf_counter() - started
+    print(f"{name}: p50 {percentile(timings, 50) * 1000:.0f} мс, p99 {percentile(timings, 99) * 1000:.0f} мс, "
+          f"{messages / elapsed:.0f} сообщений/с, HTTP запросов {server.requests - requests_before}, "
+          f"новых соединений {server.connections - connections_before}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка messages.send: новая сессия, общая сессия, пакеты execute")
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1, help="одновременных отправителей")
+    parser.add_argument('--latency', type=float, default=0.02, help="время ответа VK, с")
+    parser.add_argument('--handshake', type=float, default=0.05, help="цена нового соединения, с")
+    parser.add_argument('--batch-window', type=float, default=0.01)
+    args = parser.parse_args()
+
+    server = FakeVkServer(latency=args.latency, handshake_delay=args.handshake)
+    # vk_api между запросами одной сессии ждёт RPS_DELAY, в бенчмарке это не нужно
+    vk_api.VkApi.RPS_DELAY = 0
+    run("новая сессия на запрос", per_request_send(server), args.messages, args.threads, server)
+    run("общая keep-alive сессия", shared_send(server, 0), args.messages, args.threads, server)
+    run(f"общая сессия + execute (окно {args.batch_window * 1000:.0f} мс)", shared_send(server, args.batch_window),
+        args.messages, max(args.threads, 25), server)
+
+
+if __name__ == '__main__':
+    main()
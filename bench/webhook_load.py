@@ -0,0 +1,91 @@
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import play
+from work_queue import WorkerPool
+from bench.fakes import LocalServer
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+# Подставной отправитель VK: шлёт события message_new и повторяет их, если не дождался ответа
+def send_event(url, event_id, user_id, timeout, retries):
+    body = json.dumps({
+        'type': 'message_new',
+        'event_id': event_id,
+        'object': {'message': {'text': 'че там?', 'from_id': user_id, 'peer_id': user_id,
+                               'conversation_message_id': event_id}},
+    }).encode()
+    attempts = 0
+    started = time.perf_counter()
+    while attempts <= retries:
+        attempts += 1
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                return time.perf_counter() - started, attempts
+        except (urllib.error.URLError, TimeoutError):
+            continue
+    return time.perf_counter() - started, attempts
+
+
+def run(mode, events, senders, latency, timeout, retries):
+    generations = []
+    delivered = []
+
+    def generate_openai_response(message, user_id=None):
+        generations.append(message)
+        time.sleep(latency)
+        return "Ответ"
+
+    def send_vk_message(user_id, text):
+        delivered.append(user_id)
+
+    play.generate_openai_response = generate_openai_response
+    play.send_vk_message = send_vk_message
+    play.recent_events = play.RecentIds()
+    play.worker_pool = WorkerPool(play.process_message_new, workers=4) if mode == 'async' else None
+
+    server = LocalServer(play.app).start()
+    url = f"http://127.0.0.1:{server.port}/webhook"
+
+    prefix = int(time.time() * 1000)
+    with ThreadPoolExecutor(senders) as pool:
+        results = list(pool.map(
+            lambda n: send_event(url, prefix + n, n, timeout, retries), range(events)
+        ))
+    if play.worker_pool:
+        play.worker_pool.join()
+    server.stop()
+
+    acks = [elapsed for elapsed, _ in results]
+    sent_twice = sum(1 for _, attempts in results if attempts > 1)
+    print(f"{mode}: ack p50 {percentile(acks, 50) * 1000:.0f} мс, p99 {percentile(acks, 99) * 1000:.0f} мс, "
+          f"среднее {statistics.mean(acks) * 1000:.0f} мс; повторных отправок VK {sent_twice}, "
+          f"генераций {len(generations)} на {events} событий, доставлено {len(delivered)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /webhook с подставным отправителем VK")
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--senders', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=1.0, help="время генерации ответа, с")
+    parser.add_argument('--timeout', type=float, default=0.5, help="через сколько VK повторяет событие, с")
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args()
+
+    for mode in ('sync', 'async'):
+        run(mode, args.events, args.senders, args.latency, args.timeout, args.retries)
+
+
+if __name__ == '__main__':
+    main()
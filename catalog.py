@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+
+# Полнотекстовый индекс FTS5 по названию и описанию и триггеры, которые поддерживают его при изменении
+# таблицы products. Строится отдельным шагом: python catalog.py products.db
+def build_index(path):
+    conn = sqlite3.connect(path)
+    try:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone()
+        if exists:
+            return
+        conn.executescript("""
+            CREATE VIRTUAL TABLE products_fts USING fts5(
+                name, description, content='products', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+            );
+            INSERT INTO products_fts(products_fts) VALUES ('rebuild');
+            CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts(rowid, name, description) VALUES (new.rowid, new.name, new.description);
+            END;
+            CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description)
+                VALUES ('delete', old.rowid, old.name, old.description);
+            END;
+            CREATE TRIGGER products_fts_update AFTER UPDATE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description)
+                VALUES ('delete', old.rowid, old.name, old.description);
+                INSERT INTO products_fts(rowid, name, description) VALUES (new.rowid, new.name, new.description);
+            END;
+        """)
+        logging.info(f"Построен полнотекстовый индекс товаров в {path}")
+    finally:
+        conn.close()
+
+
+# Каталог товаров из products.db. Поиск идёт по индексу из build_index; соединения только на чтение,
+# по одному на поток, и базу каталог не меняет. Пока индекс не построен, поиск идёт по LIKE.
+# Результаты частых запросов держатся в памяти, пока файл базы не изменится
+class ProductCatalog:
+    def __init__(self, path="products.db", cache_size=1000, limit=3):
+        self.path = path
+        self.cache_size = cache_size
+        self.limit = limit
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.mtime = None
+        self.checked = 0.0
+        self.indexed = self._has_index()
+        if not self.indexed:
+            logging.error(f"В {path} нет полнотекстового индекса, поиск идёт по LIKE. "
+                          f"Постройте его: python catalog.py {path}")
+
+    def _has_index(self):
+        return self._connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone() is not None
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self.local.conn = conn
+        return conn
+
+    # Кэш сбрасывается, если файл базы изменился (проверка не чаще раза в секунду)
+    def _check_changed(self):
+        now = time.monotonic()
+        if now - self.checked < 1:
+            return
+        self.checked = now
+        mtime = os.path.getmtime(self.path)
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.cache.clear()
+            self.indexed = self._has_index()
+
+    # Каждое слово запроса ищется как префикс: "порог" найдёт "пороги" и "порогов"
+    @staticmethod
+    def _match_expression(query, operator):
+        words = re.findall(r"\w+", query.lower())
+        return f" {operator} ".join(f'"{word}"*' for word in words)
+
+    def search(self, query):
+        key = " ".join(query.lower().split())
+        with self.lock:
+            self._check_changed()
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        conn = self._connection()
+        products = self._search_indexed(conn, query) if self.indexed else conn.execute(
+            "SELECT name, price, description FROM products WHERE name LIKE ? LIMIT ?", (f"%{query}%", self.limit)
+        ).fetchall()
+
+        with self.lock:
+            self.cache[key] = products
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return products
+
+    def _search_indexed(self, conn, query):
+        products = []
+        # Сначала товары, где есть все слова запроса, если таких нет - хотя бы одно
+        for operator in ("AND", "OR"):
+            expression = self._match_expression(query, operator)
+            if not expression:
+                break
+            products = conn.execute(
+                "SELECT p.name, p.price, p.description FROM products_fts "
+                "JOIN products p ON p.rowid = products_fts.rowid "
+                "WHERE products_fts MATCH ? ORDER BY bm25(products_fts) LIMIT ?",
+                (expression, self.limit)
+            ).fetchall()
+            if products:
+                break
+        return products
+
+    def get_product_info(self, product_name):
+        try:
+            products = self.search(product_name)
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка базы данных: {e}")
+            return f"Ошибка базы данных: {e}"
+        if not products:
+            return "Извините, такой товар не найден."
+        return "\n\n".join(
+            f"Название: {name}\nЦена: {price} руб.\nОписание: {description}"
+            for name, price, description in products
+        )
+
+
+# Описание инструмента для модели: она сама решает, когда искать товар в каталоге
+PRODUCT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_product_info",
+        "description": "Найти товар в каталоге магазина и узнать его цену и описание",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "product_name": {"type": "string", "description": "Название или описание товара, например 'порог ваз 2110'"},
+            },
+            "required": ["product_name"],
+        },
+    },
+}
+
+
+def call_product_tool(catalog, arguments):
+    return catalog.get_product_info(json.loads(arguments)["product_name"])
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    build_index(sys.argv[1] if len(sys.argv) > 1 else os.getenv('PRODUCTS_DB', 'products.db'))
@@ -0,0 +1,168 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+
+
+# Когда было получено сообщение, которое сейчас обрабатывается (time.monotonic()); у склеенного - первое из группы.
+# Диспетчер выставляет его перед вызовом обработчика, метрики считают от него время ответа
+received_at = contextvars.ContextVar("received_at", default=None)
+
+
+# Склеивает подряд идущие элементы, для которых mergeable истинно, с помощью combine(группа);
+# остальные элементы остаются как есть и на своих местах
+def coalesce(items, mergeable, combine):
+    result = []
+    group = []
+    for item in items + [None]:
+        if item is not None and mergeable(item):
+            group.append(item)
+            continue
+        if group:
+            result.append(combine(group) if len(group) > 1 else group[0])
+            group = []
+        if item is not None:
+            result.append(item)
+    return result
+
+
+# Семафор, который освободившееся место отдаёт ожидающему с наименьшим priority(key), при равных - первому пришедшему.
+# Без priority работает как обычный asyncio.Semaphore
+class FairSemaphore:
+    def __init__(self, value, priority=None):
+        self.value = value
+        self.priority = priority
+        self.waiters = []
+        self.order = itertools.count()
+
+    async def acquire(self, key=None):
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        rank = self.priority(key) if self.priority else 0
+        heapq.heappush(self.waiters, (rank, next(self.order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Место могли отдать этому ожидающему в тот же момент - возвращаем его следующему
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+
+# Диспетчер обновлений: у каждого чата своя упорядоченная очередь,
+# разные чаты обрабатываются параллельно, но не больше max_concurrency одновременно.
+# С merge сообщения, пришедшие пока чат обрабатывался, и серия сообщений с паузами меньше window секунд
+# (но не дольше max_window) передаются в merge(список) -> список и обрабатываются как один запуск.
+# С priority(chat_id) свободное место получает ожидающий чат с наименьшим значением, а не первый пришедший.
+# Время получения ставится при submit, если его не передали (например, из другого процесса)
+class ChatDispatcher:
+    def __init__(self, handler, max_concurrency=8, merge=None, window=0.0, max_window=None, priority=None):
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.merge = merge
+        self.window = window
+        self.max_window = max_window if max_window is not None else window * 3
+        self.semaphore = FairSemaphore(max_concurrency, priority)
+        self.queues = {}
+        self.workers = {}
+        # Сообщения, ещё не переданные обработчику: в очереди чата, в окне склейки и в ожидании места.
+        # Обработчик чата забирает сообщение из очереди до ожидания семафора, поэтому qsize() их не видит
+        self.waiting = {}
+        self.queued = 0
+        # Сообщения, которые сейчас у обработчика
+        self.running = 0
+
+    # Ставит сообщение в очередь чата; обработчик чата запускается, если ещё не работает
+    def submit(self, chat_id, item, received=None):
+        queue = self.queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.Queue()
+            self.queues[chat_id] = queue
+            self.workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+        queue.put_nowait((time.monotonic() if received is None else received, item))
+        self._count(chat_id, 1)
+
+    def _count(self, chat_id, delta):
+        self.waiting[chat_id] = self.waiting.get(chat_id, 0) + delta
+        self.queued += delta
+
+    async def _worker(self, chat_id, queue):
+        try:
+            while not queue.empty():
+                entries = [queue.get_nowait()]
+                if self.merge:
+                    collected = await self._collect(queue, entries)
+                    entries = self._merged(collected)
+                    self._count(chat_id, len(entries) - len(collected))
+                for received, item in entries:
+                    await self.semaphore.acquire(chat_id)
+                    self._count(chat_id, -1)
+                    received_at.set(received)
+                    self.running += 1
+                    try:
+                        await self.handler(item)
+                    except Exception as e:
+                        logging.error(f"Ошибка при обработке сообщения для чата {chat_id}: {e}")
+                    finally:
+                        self.running -= 1
+                        self.semaphore.release()
+        finally:
+            # Между проверкой пустой очереди и удалением нет await, поэтому submit не потеряет сообщение
+            del self.queues[chat_id]
+            del self.workers[chat_id]
+            self.queued -= self.waiting.pop(chat_id, 0)
+
+    # Забирает всё, что уже в очереди, и ждёт продолжения серии сообщений
+    async def _collect(self, queue, items):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_window
+        while True:
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            timeout = min(self.window, deadline - loop.time())
+            if timeout <= 0:
+                return items
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return items
+
+    # merge получает только сообщения. Несклеенные он возвращает теми же объектами, и они сохраняют своё время;
+    # склеенное получает время первого ещё не разобранного сообщения, то есть первого в своей группе
+    def _merged(self, entries):
+        result = []
+        position = 0
+        for item in self.merge([item for _, item in entries]):
+            own = next((n for n in range(position, len(entries)) if entries[n][1] is item), None)
+            if own is None:
+                result.append((entries[min(position, len(entries) - 1)][0], item))
+            else:
+                result.append((entries[own][0], item))
+                position = own + 1
+        return result
+
+    # Количество чатов, у которых есть необработанные сообщения
+    @property
+    def active_chats(self):
+        return len(self.workers)
+
+    # Сообщения одного чата, которые ещё не начали обрабатываться
+    def pending(self, chat_id):
+        return self.waiting.get(chat_id, 0)
+
+    # Ждёт, пока все очереди будут обработаны
+    async def join(self):
+        while self.workers:
+            await asyncio.gather(*list(self.workers.values()), return_exceptions=True)
@@ -0,0 +1,99 @@
+import time
+import asyncio
+from openai import AsyncAssistantEventHandler
+
+# Класс обработчика событий для работы с потоковой передачей ответов от Assistant
+# Куски ответа копятся в списке и склеиваются один раз; on_text получает каждый кусок сразу.
+# tools - локальные функции ассистента: имя -> функция от строки JSON с аргументами
+class EventHandler(AsyncAssistantEventHandler):
+    def __init__(self, on_text=None, client=None, tools=None):
+        super().__init__()
+        self.chunks = []
+        self.on_text = on_text
+        self.client = client
+        self.tools = tools or {}
+        # Обработчик продолжения запуска после передачи результатов функций
+        self.continuation = None
+        # Вызовы инструментов и их вывод за этот запуск, для транскрипта
+        self.tool_log = []
+        # time.monotonic() первого куска текста, для замера времени до первого токена
+        self.first_text_at = None
+        # Устанавливается с первым куском текста, в том числе в продолжении
+        self.first_text = asyncio.Event()
+
+    @property
+    def response_text(self):
+        return "".join(self.chunks)
+
+    # Если текст пошёл только после вызова функций, первый кусок пришёл в продолжение
+    @property
+    def first_token_at(self):
+        if self.first_text_at is None and self.continuation:
+            return self.continuation.first_token_at
+        return self.first_text_at
+
+    # Сколько токенов потратил запуск, известно после его завершения
+    @property
+    def total_tokens(self):
+        if self.continuation:
+            return self.continuation.total_tokens
+        run = self.current_run
+        return run.usage.total_tokens if run and run.usage else 0
+
+    @property
+    def prompt_tokens(self):
+        if self.continuation:
+            return self.continuation.prompt_tokens
+        run = self.current_run
+        return run.usage.prompt_tokens if run and run.usage else 0
+
+    # Ассистент вызвал функцию: выполняем её локально и продолжаем запуск с результатом
+    async def on_event(self, event):
+        if event.event == 'thread.run.requires_action':
+            await self.submit_tool_outputs(event.data)
+
+    # Функции синхронные и могут читать файлы, поэтому выполняются в потоке, а не в цикле событий
+    async def submit_tool_outputs(self, run):
+        tool_outputs = []
+        for tool_call in run.required_action.submit_tool_outputs.tool_calls:
+            name, arguments = tool_call.function.name, tool_call.function.arguments
+            function = self.tools.get(name)
+            try:
+                output = await asyncio.to_thread(function, arguments) if function else f"Функция {name} недоступна."
+            except Exception as e:
+                output = f"Ошибка при выполнении функции {name}: {e}"
+            self.tool_log.append(f"{name}({arguments}) -> {output}")
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": output})
+
+        # Продолжение пишет текст в те же chunks и tool_log
+        handler = EventHandler(on_text=self.on_text, client=self.client, tools=self.tools)
+        handler.chunks = self.chunks
+        handler.tool_log = self.tool_log
+        handler.first_text = self.first_text
+        self.continuation = handler
+        async with self.client.beta.threads.runs.submit_tool_outputs_stream(
+            thread_id=run.thread_id,
+            run_id=run.id,
+            tool_outputs=tool_outputs,
+            event_handler=handler,
+        ) as stream:
+            await stream.until_done()
+
+    async def on_text_created(self, text) -> None:
+        pass
+
+    async def on_text_delta(self, delta, snapshot):
+        if self.first_text_at is None:
+            self.first_text_at = time.monotonic()
+            self.first_text.set()
+        self.chunks.append(delta.value)
+        if self.on_text:
+            self.on_text(delta.value)
+
+    # Код и вывод code_interpreter попадают в tool_log и оттуда в транскрипт бота, а не в stdout
+    async def on_tool_call_done(self, tool_call):
+        if tool_call.type == 'code_interpreter':
+            self.tool_log.append(f"code_interpreter({tool_call.code_interpreter.input})")
+            for output in tool_call.code_interpreter.outputs or []:
+                if output.type == "logs":
+                    self.tool_log.append(f"code_interpreter > {output.logs}")
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+
+# Журнал диалогов: записи копятся в очереди и пишутся фоновым потоком пачками
+# в JSONL файлы history_dir/dialogs-ГГГГ-ММ-ДД.jsonl (новый файл каждый день и при
+# превышении max_bytes). Дата в имени файла служит индексом для запросов за период.
+# suffix отделяет файлы разных процессов: dialogs-ГГГГ-ММ-ДД.w1.jsonl
+class HistorySink:
+    def __init__(self, directory="history", batch_size=100, flush_interval=1.0, max_bytes=64 * 2 ** 20, suffix=""):
+        self.directory = directory
+        self.suffix = suffix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._writer, name="history", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Не блокирует: запись только кладётся в очередь
+    def record(self, bot, user_id, question, answer, latency=0.0, tokens=0, **extra):
+        self.queue.put({
+            'ts': time.time(), 'bot': bot, 'user_id': user_id, 'question': question,
+            'answer': answer, 'latency': round(latency, 3), 'tokens': tokens, **extra,
+        })
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _path(self, ts):
+        day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        path = os.path.join(self.directory, f"dialogs-{day}{self.suffix}.jsonl")
+        part = 0
+        while os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+            part += 1
+            path = os.path.join(self.directory, f"dialogs-{day}{self.suffix}.{part}.jsonl")
+        return path
+
+    def _write(self, batch):
+        files = {}
+        for record in batch:
+            files.setdefault(self._path(record['ts']), []).append(
+                json.dumps(record, ensure_ascii=False) + "\n"
+            )
+        for path, lines in files.items():
+            with open(path, "a", encoding="utf-8") as file:
+                file.writelines(lines)
+
+    # Пачка пишется, когда набралось batch_size записей или прошло flush_interval секунд
+    # с первой записи пачки; None в очереди означает завершение работы
+    def _writer(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = False
+            if record:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+            if batch and (not record or len(batch) >= self.batch_size):
+                try:
+                    self._write(batch)
+                except OSError as e:
+                    logging.error(f"Ошибка при записи истории диалогов: {e}")
+                batch = []
+                deadline = None
+            if record is None:
+                return
+
+
+# Файлы журнала, которые могут содержать записи за период [since, until]
+def history_files(directory, since=None, until=None):
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("dialogs-") and name.endswith(".jsonl")):
+            continue
+        day = name[len("dialogs-"):len("dialogs-") + 10]
+        if since and day < since.strftime("%Y-%m-%d"):
+            continue
+        if until and day > until.strftime("%Y-%m-%d"):
+            continue
+        yield os.path.join(directory, name)
+
+
+def query(directory, user_id=None, bot=None, since=None, until=None, text=None):
+    # Строки чужих пользователей отбрасываются до разбора JSON
+    marker = f'"user_id": {json.dumps(user_id)},' if user_id is not None else None
+    for path in history_files(directory, since, until):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if marker and marker not in line:
+                    continue
+                if text and text.lower() not in line.lower():
+                    continue
+                record = json.loads(line)
+                if bot and record['bot'] != bot:
+                    continue
+                if since and record['ts'] < since.timestamp():
+                    continue
+                if until and record['ts'] >= until.timestamp():
+                    continue
+                yield record
+
+
+def print_stats(records):
+    latencies = sorted(record['latency'] for record in records)
+    if not latencies:
+        print("Записей не найдено.")
+        return
+    users = {(record['bot'], record['user_id']) for record in records}
+    tokens = sum(record.get('tokens') or 0 for record in records)
+    print(f"Диалогов: {len(records)}, пользователей: {len(users)}, токенов: {tokens}")
+    print(f"Задержка ответа: p50 {latencies[len(latencies) // 2]:.2f} с, "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:.2f} с, максимум {latencies[-1]:.2f} с")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск по журналу диалогов")
+    parser.add_argument('--dir', default="history")
+    parser.add_argument('--user', type=int, help="id пользователя")
+    parser.add_argument('--bot', help="имя бота из bots.json")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="начало периода, ГГГГ-ММ-ДД")
+    parser.add_argument('--until', type=datetime.fromisoformat, help="конец периода включительно, ГГГГ-ММ-ДД")
+    parser.add_argument('--grep', help="подстрока в вопросе или ответе")
+    parser.add_argument('--stats', action='store_true', help="вывести сводку вместо записей")
+    args = parser.parse_args(argv)
+
+    until = args.until + timedelta(days=1) if args.until else None
+    records = query(args.dir, args.user, args.bot, args.since, until, args.grep)
+    if args.stats:
+        print_stats(list(records))
+        return
+    for record in records:
+        when = datetime.fromtimestamp(record['ts']).strftime("%Y-%m-%d %H:%M:%S")
+        sys.stdout.write(f"{when} {record['bot']} {record['user_id']} ({record['latency']} с)\n"
+                         f"Вопрос: {record['question']}\nОтвет: {record['answer']}\n\n")
+
+
+if __name__ == '__main__':
+    main()
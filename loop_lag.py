@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+
+# Замер задержки цикла событий: корутина засыпает на interval секунд и считает,
+# насколько позже она проснулась. Если что-то блокирует цикл, задержка растёт.
+class LoopLagMonitor:
+    def __init__(self, interval=0.25, report_every=60):
+        self.interval = interval
+        self.report_every = report_every
+        self.reset()
+
+    def reset(self):
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.count = 0
+
+    def record(self, lag):
+        self.last = lag
+        self.max = max(self.max, lag)
+        self.total += lag
+        self.count += 1
+
+    def snapshot(self):
+        return {
+            'last_ms': self.last * 1000,
+            'max_ms': self.max * 1000,
+            'avg_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'samples': self.count,
+        }
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self.record(max(0.0, now - started - self.interval))
+            if self.report_every and now - last_report >= self.report_every:
+                stats = self.snapshot()
+                logging.info(
+                    f"Задержка цикла событий: последняя {stats['last_ms']:.1f} мс, "
+                    f"средняя {stats['avg_ms']:.1f} мс, максимум {stats['max_ms']:.1f} мс"
+                )
+                self.reset()
+                last_report = now
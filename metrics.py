@@ -0,0 +1,247 @@
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+
+from dispatcher import received_at
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+# Снимки метрик рабочих процессов supervisor: номер процесса -> {имя метрики: {метки: значение}}.
+# /metrics показывает их вместе с метриками своего процесса
+remote = {}
+
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    # Значения этого процесса в виде, который можно передать другому процессу
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    # Значения этого процесса вместе со снимками рабочих процессов
+    def collect(self):
+        values = self.snapshot()
+        for snapshot in list(remote.values()):
+            for key, value in snapshot.get(self.name, {}).items():
+                values[key] = self.merge(values[key], value) if key in values else value
+        return values
+
+    def merge(self, a, b):
+        return a + b
+
+    def render(self):
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in self.collect().items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+
+# Значение считается в момент запроса /metrics: callback возвращает {метки: значение}.
+# Значения процессов складываются (очереди, активные чаты) или, с aggregate="max", берётся наибольшее
+# (задержка цикла событий, разомкнутый предохранитель)
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=(), callback=None, aggregate="sum"):
+        super().__init__(name, description, labels)
+        self.callbacks = [callback] if callback else []
+        self.aggregate = aggregate
+
+    def set(self, *labels, value):
+        with self.lock:
+            self.values[labels] = value
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def snapshot(self):
+        values = super().snapshot()
+        for callback in self.callbacks:
+            values.update(callback())
+        return values
+
+    def merge(self, a, b):
+        return max(a, b) if self.aggregate == "max" else a + b
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][n] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {key: (list(buckets), count, total) for key, (buckets, count, total) in self.values.items()}
+
+    def merge(self, a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]
+
+    def render(self):
+        lines = self.header()
+        for key, (buckets, count, total) in self.collect().items():
+            for bound, bucket in zip(self.buckets, buckets):
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), key + (bound,))} {bucket}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+        return lines
+
+
+registry = []
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in registry}
+
+
+# Рабочий процесс supervisor отправляет снимок своих метрик в queue раз в interval секунд
+# и последний раз при остановке, чтобы счётчики не потерялись
+async def publish(queue, index, interval=5.0):
+    try:
+        while True:
+            queue.put((index, snapshot()))
+            await asyncio.sleep(interval)
+    finally:
+        queue.put((index, snapshot()))
+
+
+# Процесс с /metrics принимает снимки рабочих процессов в фоновом потоке
+def listen(queue):
+    def receive():
+        while True:
+            index, values = queue.get()
+            remote[index] = values
+
+    threading.Thread(target=receive, name="metrics", daemon=True).start()
+
+
+# Время ответа по шагам: получение -> thread_create -> message_create -> run_stream -> send.
+# total и ttft считаются от получения сообщения, run_ttft - от начала запуска ассистента
+reply_seconds = register(Histogram(
+    "bot_reply_step_seconds", "Время шагов обработки сообщения от получения до ответа", ("bot", "step"),
+))
+tokens_total = register(Counter("openai_tokens_total", "Токены OpenAI, потраченные ботом", ("bot",)))
+queue_depth = register(Gauge("bot_queue_depth", "Сообщения в очередях бота", ("bot", "queue")))
+active_chats = register(Gauge("bot_active_chats", "Чаты, у которых сейчас есть необработанные сообщения", ("bot",)))
+fallbacks_total = register(Counter(
+    "bot_fallback_replies_total", "Ответы через chat.completions вместо запуска ассистента", ("bot", "reason"),
+))
+circuit_open = register(Gauge(
+    "openai_circuit_open", "Разомкнут ли предохранитель API OpenAI", ("bot", "endpoint"), aggregate="max",
+))
+admission_total = register(Counter(
+    "bot_admission_total", "Решения о допуске сообщений к запуску: admitted или причина отказа", ("bot", "result"),
+))
+# Процессы читают расход бота из общей базы, поэтому складывать их значения нельзя
+window_tokens = register(Gauge("bot_window_tokens", "Токены, потраченные ботом за окно бюджета", ("bot",), aggregate="max"))
+loop_lag_seconds = register(Gauge("event_loop_lag_seconds", "Задержка цикла событий", ("stat",), aggregate="max"))
+
+
+# Замер одного шага: with metrics.timed(bot, "thread_create"): ...
+@contextmanager
+def timed(bot, step):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        reply_seconds.observe(bot, step, value=time.monotonic() - started)
+
+
+# Когда получено обрабатываемое сообщение; вне диспетчера - default
+def received(default):
+    value = received_at.get()
+    return default if value is None else value
+
+
+# Время от получения сообщения до конца его обработки методом бота, включая ожидание в очереди;
+# имя бота берётся из self.name
+def traced(step):
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            started = received(time.monotonic())
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                reply_seconds.observe(self.name, step, value=time.monotonic() - started)
+        return wrapper
+    return decorator
+
+
+# После запуска ассистента: время до первого токена от получения сообщения и от начала запуска, потраченные токены
+def observe_run(bot, event_handler, started):
+    if event_handler.first_token_at is not None:
+        reply_seconds.observe(bot, "ttft", value=event_handler.first_token_at - received(started))
+        reply_seconds.observe(bot, "run_ttft", value=event_handler.first_token_at - started)
+    tokens_total.inc(bot, value=event_handler.total_tokens)
+
+
+# Очереди и активные чаты бота читаются при каждом запросе /metrics
+def watch_bot(bot):
+    queue_depth.add_callback(lambda: {
+        (bot.name, "dispatcher"): bot.dispatcher.queued,
+        (bot.name, "outbound"): bot.sender.queue_depth,
+    })
+    active_chats.add_callback(lambda: {(bot.name,): bot.dispatcher.active_chats})
+    window_tokens.add_callback(lambda: {(bot.name,): bot.admission.usage()})
+    circuit_open.add_callback(lambda: {
+        (bot.name, endpoint): int(breaker.state != "closed")
+        for endpoint, breaker in (("assistants", bot.hedge.assistants), ("chat", bot.hedge.chat))
+    })
+
+
+def watch_loop_lag(monitor):
+    loop_lag_seconds.add_callback(lambda: {
+        (stat,): monitor.snapshot()[f"{stat}_ms"] / 1000 for stat in ("last", "max", "avg")
+    })
@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from collections import Counter
+
+
+# Уведомления оператору о присланных файлах. Уведомления копятся window секунд и уходят одним
+# сообщением-сводкой, поэтому десяток фото подряд не упирается в лимит Telegram в 1 сообщение в секунду на чат.
+# add() не ждёт отправки и не блокирует обработку сообщений
+class NotifyDigest:
+    def __init__(self, send, window=2.0, max_items=50):
+        # send(text) отправляет одно сообщение оператору
+        self.send = send
+        self.window = window
+        self.max_items = max_items
+        self.pending = Counter()
+        self.task = None
+        self.flushed = asyncio.Event()
+
+    def add(self, user_id):
+        self.pending[user_id] += 1
+        if sum(self.pending.values()) >= self.max_items:
+            self.flushed.set()
+        if self.task is None:
+            self.flushed.clear()
+            self.task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.wait_for(self.flushed.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        pending, self.pending, self.task = self.pending, Counter(), None
+        try:
+            await self.send(self.format(pending))
+        except Exception as e:
+            logging.error(f"Ошибка при отправке уведомления в Telegram: {e}")
+
+    @staticmethod
+    def format(pending):
+        if len(pending) == 1:
+            (user_id, count), = pending.items()
+            files = f" ({count} шт.)" if count > 1 else ""
+            return f"Пользователь отправил файл или фото{files}. User ID: {user_id}"
+        lines = [f"{user_id}" + (f" ({count} шт.)" if count > 1 else "") for user_id, count in pending.items()]
+        return f"Пользователи отправили файлы или фото ({len(pending)}). User ID:\n" + "\n".join(lines)
+
+    # Отправляет накопленное сразу, при остановке
+    async def close(self):
+        if self.task:
+            self.flushed.set()
+            await self.task
@@ -0,0 +1,138 @@
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+
+
+# Ведро токенов: в среднем rate операций в секунду, всплеск до capacity
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Разбивает длинный ответ на части не длиннее limit, по абзацам, строкам, предложениям или словам
+def split_message(text, limit):
+    chunks = []
+    while len(text) > limit:
+        cut = -1
+        for separator in ("\n\n", "\n", ". ", " "):
+            cut = text.rfind(separator, limit // 2, limit)
+            if cut != -1:
+                cut += len(separator)
+                break
+        if cut == -1:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+# Через сколько секунд повторить запрос после ошибки, или None, если повторять не нужно.
+# Повторяются только отказы из-за частоты: Telegram RetryAfter, коды VK 6 и 9, HTTP 429
+def retry_delay(exc, attempt, base=1.0, cap=30.0):
+    retry_after = getattr(exc, 'retry_after', None)
+    if retry_after is not None:
+        return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+    if getattr(exc, 'code', None) in (6, 9) or getattr(exc, 'status_code', None) == 429:
+        return min(cap, base * 2 ** attempt)
+    return None
+
+
+# Отправка сообщений с учётом ограничений платформы: общий лимит и лимит на чат,
+# разбиение длинных ответов, повтор при флуд-контроле и приоритет коротких ответов
+class OutboundSender:
+    def __init__(self, send, max_length=4096, global_rate=25, chat_rate=1, chat_burst=3,
+                 retries=5, workers=4, max_chats=10000):
+        # send(chat_id, text) отправляет одно сообщение и возвращает его id
+        self.send = send
+        self.max_length = max_length
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = OrderedDict()
+        self.max_chats = max_chats
+        self.retries = retries
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+        self.seq = itertools.count()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self.chat_buckets) > self.max_chats:
+                self.chat_buckets.popitem(last=False)
+        self.chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _start(self):
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue()
+            self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    # Отправляет ответ целиком, при необходимости частями; возвращает id отправленных сообщений
+    async def deliver(self, chat_id, text):
+        # Чем короче ответ, тем раньше он уходит
+        priority = len(text)
+        return [
+            await self.call(chat_id, lambda chunk=chunk: self.send(chat_id, chunk), priority)
+            for chunk in split_message(text, self.max_length)
+        ]
+
+    # Выполняет один запрос к платформе (отправку или правку) с ограничением частоты и повторами
+    async def call(self, chat_id, func, priority=0):
+        self._start()
+        attempt = 0
+        while True:
+            # Лимит чата ждёт сам обработчик чата, поэтому он не занимает общих воркеров
+            await self._chat_bucket(chat_id).acquire()
+            future = asyncio.get_running_loop().create_future()
+            self.queue.put_nowait((priority, next(self.seq), func, future))
+            try:
+                return await future
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt >= self.retries:
+                    raise
+                attempt += 1
+                logging.warning(f"Ограничение частоты для чата {chat_id}, повтор {attempt} через {delay:.1f} с: {e}")
+                await asyncio.sleep(delay)
+
+    async def _worker(self):
+        while True:
+            _, _, func, future = await self.queue.get()
+            if future.done():
+                continue
+            await self.global_bucket.acquire()
+            try:
+                result = await func()
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
@@ -1,60 +1,230 @@
 import os
 import vk_api
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
-from flask import Flask, request
+import openai
 from openai import OpenAI
 from dotenv import load_dotenv
 import time
+import asyncio
 import logging
+import threading
+import web
+from work_queue import WorkerPool, RecentIds
+from response_cache import ResponseCache
+from session_store import SessionStore, SqliteSessionStore
+from admission import Admission
+import metrics
+from vk_client import get_vk_client
+from catalog import ProductCatalog, PRODUCT_TOOL, call_product_tool
 
 # Загрузка переменных окружения из файла .env
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Клиент OpenAI создаётся при первом запросе, поэтому импорт play.py не требует ключа
+client = None
+client_lock = threading.Lock()
 
-app = Flask(__name__)
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    return client
+
+# Вебхук обслуживает uvicorn (см. конец файла): запросы принимаются в цикле событий,
+# а генерация ответов идёт в потоках пула
+app = web.App()
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
-# Установите ваш API-ключ OpenAI
+# Режим вебхука: async - сразу отвечаем VK "ok", а сообщение обрабатывается пулом потоков;
+# sync - ответ генерируется прямо в запросе, как раньше
+webhook_mode = os.getenv('VK_WEBHOOK_MODE', 'async')
+webhook_workers = int(os.getenv('VK_WEBHOOK_WORKERS', '4'))
+webhook_queue_size = int(os.getenv('VK_WEBHOOK_QUEUE_SIZE', '1000'))
+
+# VK повторяет событие, если не получил ответ вовремя, поэтому помним уже принятые
+recent_events = RecentIds()
+
+# Допуск к генерации ответа: не больше VK_USER_MAX_QUEUED сообщений пользователя в работе, очередь пула
+# не длиннее VK_WEBHOOK_QUEUE_SIZE и бюджеты токенов за TOKEN_WINDOW секунд (0 - без ограничения).
+# Расход хранится в SESSION_DB, если она задана, иначе в памяти
+session_store = SqliteSessionStore(os.getenv('SESSION_DB')) if os.getenv('SESSION_DB') else SessionStore()
+admission = Admission(
+    'play',
+    session_store.view('play'),
+    user_max_queued=int(os.getenv('VK_USER_MAX_QUEUED', '3')),
+    bot_max_queued=webhook_queue_size,
+    user_token_budget=int(os.getenv('USER_TOKEN_BUDGET', '0')),
+    bot_token_budget=int(os.getenv('BOT_TOKEN_BUDGET', '0')),
+    window=float(os.getenv('TOKEN_WINDOW', '3600')),
+)
+# Сообщения пользователей, которые приняты, но ещё не получили ответ
+in_flight = {}
+in_flight_lock = threading.Lock()
+# Ответы об отказе отправляет отдельный поток, чтобы VK получил "ok" сразу и при перегрузке
+reply_pool = WorkerPool(lambda item: send_vk_message(*item), workers=1, maxsize=webhook_queue_size)
+
+system_prompt = "Обращаться всегда на вы.Вы консультант по кузовному ремонту порогов и арок автомобилей,замена/покраска делатей авто в цвет.Вам нужно узнать что ремонтировать по кузову, добиться фото битых делатей. Если человеку нужны ремонтные пороги либо арки, то предложить купить у нас. Порог 1600 за один, арка 2500"
+
+# Кэш ответов на частые вопросы, включается переменной RESPONSE_CACHE=1. Здесь каждый вопрос
+# отправляется модели без истории разговора, поэтому ответ зависит только от текста вопроса
+response_cache = ResponseCache(
+    max_size=int(os.getenv('RESPONSE_CACHE_SIZE', '500')),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', '86400')),
+    threshold=float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.7')),
+) if os.getenv('RESPONSE_CACHE') == '1' else None
+# Вебхуки обрабатываются в нескольких потоках, а кэш не потокобезопасен
+cache_lock = threading.Lock()
+
+# Каталог товаров с полнотекстовым поиском; модель обращается к нему через инструмент get_product_info.
+# База открывается только на чтение, индекс строится заранее: python catalog.py products.db
+products_db = os.getenv('PRODUCTS_DB', 'products.db')
+catalog = ProductCatalog(products_db) if os.path.exists(products_db) else None
+
+# Сколько раз подряд модель может обратиться к каталогу, и что отвечать, если текста от неё так и не пришло
+TOOL_ROUNDS = 3
+NO_ANSWER_REPLY = "Не удалось подготовить ответ, менеджер скоро свяжется с вами."
 
 # Функция для получения информации о продукте из базы данных
 def get_product_info(product_name):
-    try:
-        conn = sqlite3.connect('products.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, price, description FROM products WHERE name LIKE ?", (f"%{product_name}%",))
-        product = cursor.fetchone()
-        conn.close()
-        if product:
-            return f"Название: {product[0]}\nЦена: {product[1]} руб.\nОписание: {product[2]}"
-        else:
-            return "Извините, такой товар не найден."
-    except sqlite3.Error as e:
-        logging.error(f"Ошибка базы данных: {e}")
-        return f"Ошибка базы данных: {e}"
+    if catalog is None:
+        return "Каталог товаров недоступен."
+    return catalog.get_product_info(product_name)
+
+# Функция для генерации ответа с помощью OpenAI GPT-4; потраченные токены записываются в бюджет user_id
+def generate_openai_response(message, user_id=None):
+    if response_cache:
+        with cache_lock:
+            cached = response_cache.get(message, system_prompt)
+        if cached:
+            return cached
 
-# Функция для генерации ответа с помощью OpenAI GPT-4
-def generate_openai_response(message):
+    started = time.monotonic()
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": message}]
+    tools = {'tools': [PRODUCT_TOOL]} if catalog else {}
+    tokens = 0
     try:
-        response = client.chat.completions.create(model="gpt-4o",
-                                messages=[
-            {"role": "system", "content": "Обращаться всегда на вы.Вы консультант по кузовному ремонту порогов и арок автомобилей,замена/покраска делатей авто в цвет.Вам нужно узнать что ремонтировать по кузову, добиться фото битых делатей. Если человеку нужны ремонтные пороги либо арки, то предложить купить у нас. Порог 1600 за один, арка 2500"},
-            {"role": "user", "content": message}],
-        temperature=1,
-        max_tokens=256,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0)
-        return response.choices[0].message.content
+        # Если модель запросила товар из каталога, отдаём ей результат и спрашиваем снова. После TOOL_ROUNDS
+        # раундов инструменты запрещаются (tool_choice="none"), и модель должна ответить текстом
+        for attempt in range(TOOL_ROUNDS + 1):
+            choice = {'tool_choice': 'none'} if tools and attempt == TOOL_ROUNDS else {}
+            response = get_client().chat.completions.create(model="gpt-4o",
+                                    messages=messages,
+            temperature=1,
+            max_tokens=256,
+            top_p=1,
+            frequency_penalty=0,
+            presence_penalty=0,
+            **tools, **choice)
+            tokens += response.usage.total_tokens if response.usage else 0
+            reply = response.choices[0].message
+            if not reply.tool_calls or choice:
+                break
+            messages.append(reply.model_dump(exclude_none=True))
+            for tool_call in reply.tool_calls:
+                # Модель может прислать неверные аргументы: ошибка уходит ей как результат функции
+                try:
+                    output = call_product_tool(catalog, tool_call.function.arguments)
+                except Exception as e:
+                    output = f"Ошибка при выполнении функции {tool_call.function.name}: {e}"
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": output,
+                })
+        if user_id is not None:
+            admission.record(user_id, tokens)
+        if not reply.content:
+            logging.error(f"Модель не ответила текстом на сообщение пользователя {user_id}.")
+            return NO_ANSWER_REPLY
+        response_text = reply.content
+        if response_cache:
+            with cache_lock:
+                response_cache.put(message, response_text, time.monotonic() - started, system_prompt)
+        return response_text
     except openai.OpenAIError as e:
         logging.error(f"Ошибка OpenAI: {e}")
         return f"Ошибка OpenAI: {e}"
 
+# Один клиент VK на процесс: соединение не открывается заново на каждый ответ, а отправки
+# из разных рабочих потоков в пределах VK_BATCH_WINDOW секунд уходят одним запросом execute
+def vk_client():
+    return get_vk_client(os.getenv('VK_API_TOKEN'), batch_window=float(os.getenv('VK_BATCH_WINDOW', '0.01')))
+
+def send_vk_message(user_id, text):
+    vk_client().send_message(user_id, text)
+
+# Ключи для поиска повторов: event_id и номер сообщения в беседе
+def event_keys(data):
+    keys = []
+    if data.get('event_id'):
+        keys.append(('event', data['event_id']))
+    message = data['object']['message']
+    if message.get('conversation_message_id'):
+        keys.append(('message', message.get('peer_id'), message['conversation_message_id']))
+    return keys
+
+def is_duplicate(data):
+    keys = event_keys(data)
+    # Все ключи нужно добавить, поэтому без короткого замыкания any()
+    new = [recent_events.add(key) for key in keys]
+    return bool(keys) and not all(new)
+
+# Решение о допуске сообщения; при отказе пользователь сразу получает короткий ответ вместо очереди
+def admit(user_id):
+    with in_flight_lock:
+        user_queued = in_flight.get(user_id, 0)
+        bot_queued = worker_pool.queue.qsize() if worker_pool else sum(in_flight.values())
+        reason = admission.check(user_id, user_queued, bot_queued)
+        if not reason:
+            in_flight[user_id] = user_queued + 1
+    if reason:
+        reject(user_id, reason)
+    return not reason
+
+def reject(user_id, reason):
+    logging.info(f"Сообщение пользователя {user_id} отклонено ({reason})")
+    text = admission.reply(user_id, reason)
+    if text and not reply_pool.submit((user_id, text)):
+        logging.error(f"Очередь ответов об отказе переполнена, пользователь {user_id} остался без ответа.")
+
+def done(user_id):
+    with in_flight_lock:
+        if in_flight.get(user_id, 0) <= 1:
+            in_flight.pop(user_id, None)
+        else:
+            in_flight[user_id] -= 1
+
+def process_message_new(data):
+    message = data['object']['message']['text']
+    user_id = data['object']['message']['from_id']
+
+    try:
+        # Используем OpenAI для генерации ответа
+        response_text = generate_openai_response(message, user_id)
+
+        try:
+            send_vk_message(user_id, response_text)
+        except vk_api.VkApiError as e:
+            logging.error(f"Ошибка VK API: {e}")
+    finally:
+        done(user_id)
+
+# Из очереди первым берётся сообщение пользователя, потратившего меньше токенов за окно
+worker_pool = WorkerPool(
+    process_message_new,
+    workers=webhook_workers,
+    maxsize=webhook_queue_size,
+    priority=lambda data: admission.usage(data['object']['message']['from_id']),
+) if webhook_mode == 'async' else None
+
 # Обработка входящих запросов
-@app.route('/webhook', methods=['GET', 'POST'])
-def webhook():
+@app.route('/webhook', methods=('GET', 'POST'))
+async def webhook(request):
     if request.method == 'GET':
         # Подтверждение адреса сервера для получения уведомлений от VK
         return '5efebf00'
@@ -66,20 +236,30 @@ def webhook():
                 if data['type'] == 'confirmation':
                     return '5efebf00'
                 if data['type'] == 'message_new':
+                    if is_duplicate(data):
+                        logging.info(f"Повтор события от VK пропущен: {event_keys(data)}")
+                        return 'ok'
+
                     message = data['object']['message']['text']
                     user_id = data['object']['message']['from_id']
+                    if not admit(user_id):
+                        return 'ok'
 
-                    # Используем OpenAI для генерации ответа
-                    response_text = generate_openai_response(message)
+                    if worker_pool:
+                        if not worker_pool.submit(data):
+                            logging.error("Очередь обработки вебхуков переполнена.")
+                            done(user_id)
+                            reject(user_id, "bot_queued")
+                        return 'ok'
 
                     try:
-                        vk_session = vk_api.VkApi(token=os.getenv('VK_API_TOKEN'))
-                        vk = vk_session.get_api()
-                        vk.messages.send(
-                            user_id=user_id,
-                            message=response_text,
-                            random_id=0
-                        )
+                        # Используем OpenAI для генерации ответа; синхронный клиент не должен останавливать цикл событий
+                        response_text = await asyncio.to_thread(generate_openai_response, message, user_id)
+                    finally:
+                        done(user_id)
+
+                    try:
+                        await asyncio.to_thread(send_vk_message, user_id, response_text)
                     except vk_api.VkApiError as e:
                         logging.error(f"Ошибка VK API: {e}")
                         return f"Ошибка VK API: {e}", 500
@@ -89,5 +269,36 @@ def webhook():
         else:
             return 'Unsupported Media Type: Content is not application/json', 415
 
+# Счётчики допуска в формате Prometheus
+@app.route('/metrics')
+async def metrics_endpoint(request):
+    return web.Response(metrics.render(), content_type='text/plain; version=0.0.4')
+
+@app.route('/health')
+async def health(request):
+    return "ok"
+
+# Остановка по SIGTERM/SIGINT: uvicorn перестаёт принимать запросы и дожидается открытых,
+# затем пулы дорабатывают принятые сообщения и ответы об отказе не дольше SHUTDOWN_TIMEOUT секунд
+async def drain():
+    pools = [pool for pool in (worker_pool, reply_pool) if pool]
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*(asyncio.to_thread(pool.join) for pool in pools)),
+            timeout=float(os.getenv('SHUTDOWN_TIMEOUT', '60')),
+        )
+    except asyncio.TimeoutError:
+        logging.error("Не все сообщения обработаны до остановки")
+
+app.on_shutdown.append(drain)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=80)
+    import uvicorn
+    uvicorn.run(
+        app,
+        host=os.getenv('HTTP_HOST', '0.0.0.0'),
+        port=int(os.getenv('HTTP_PORT', '80')),
+        timeout_keep_alive=int(os.getenv('HTTP_KEEP_ALIVE', '75')),
+        log_config=None,
+        access_log=False,
+    )
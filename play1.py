@@ -1,182 +1,457 @@
 import os
+import time
 import vk_api
 from vk_api.longpoll import VkLongPoll, VkEventType
-from flask import Flask
-from openai import OpenAI, AssistantEventHandler
-from dotenv import load_dotenv
 import logging
-import telegram
 import asyncio
-
-load_dotenv()
-
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-assistant_id = os.getenv('ASSISTANT_KUZOVNOI_REMONT')
+from types import SimpleNamespace
+import metrics
+from assistant import thread_messages
+from dispatcher import ChatDispatcher, coalesce
+from thread_context import ThreadContext, estimate_tokens
+from resilience import HedgedRun
+from admission import Admission, OVERLOAD_REPLY, QUOTA_REPLY
+from response_cache import ResponseCache
+from outbound import OutboundSender
+from vk_client import get_vk_client
+from work_queue import RecentIds
+from poller import Backoff, wait_for_capacity
+from notify import NotifyDigest
+from prices import PriceCatalog, PRICE_TOOL, price_tool
 
 data_file_path = os.path.join(os.path.dirname(__file__), "porogi_arki.xlsx")
 
-telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
-telegram_chat_id = os.getenv('TELEGRAM_CHAT_ID')
-telegram_bot = telegram.Bot(token=telegram_bot_token)
-
-vk_session = vk_api.VkApi(token=os.getenv('VK_API_TOKEN'))
-vk = vk_session.get_api()
-
-app = Flask(__name__)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
-
-user_threads = {}
-
-class EventHandler(AssistantEventHandler):
-    def __init__(self):
-        super().__init__()
-        self.response_text = ""
-        self.photo_received = False
-
-    def on_text_created(self, text) -> None:
-        pass
-
-    def on_text_delta(self, delta, snapshot):
-        self.response_text += delta.value
 
-    def on_tool_call_created(self, tool_call):
-        print(f"\nassistant > {tool_call.type}\n", flush=True)
+# VK бот-консультант по кузовному ремонту. Запросы к VK API синхронные (vk_api),
+# поэтому они выполняются в потоках, а цикл событий остаётся свободным
+class VkBot:
+    def __init__(self, config, client, sessions, notify_bot=None, history=None):
+        self.name = config['name']
+        self.client = client
+        self.assistant_id = config['assistant_id']
+        self.instructions = config['instructions']
+        # Что писать в лог после каждого ответа: delta - только новый вопрос, ответ и вызовы инструментов,
+        # full - весь поток (лишний запрос к OpenAI на каждый ответ, в фоне после отправки), off - ничего
+        self.transcript = config.get('transcript', 'delta')
+        # Фоновые дампы потоков при transcript='full'
+        self.dumps = set()
+        # Логгер транскрипта пишет через очередь в отдельном потоке (см. runtime.setup_logging)
+        self.transcript_log = logging.getLogger(f"{self.name}.transcript")
+
+        # Журнал диалогов HistorySink, общий для всех ботов процесса
+        self.history = history
+        self.max_concurrency = int(config.get('max_concurrency', 8))
+        self.log = logging.getLogger(self.name)
+
+        # Уведомления оператору о присланных файлах уходят в Telegram сводками раз в notify_digest_window секунд
+        self.telegram_bot = notify_bot
+        self.telegram_chat_id = config.get('notify_chat_id')
+        self.notify_digest = NotifyDigest(
+            self.send_telegram_notification,
+            window=float(config.get('notify_digest_window', 2.0)),
+        )
 
-    def on_tool_call_delta(self, delta, snapshot):
-        if delta.type == 'code_interpreter':
-            if delta.code_interpreter.input:
-                print(delta.code_interpreter.input, end="", flush=True)
-            if delta.code_interpreter.outputs:
-                print(f"\n\noutput >", flush=True)
-                for output in delta.code_interpreter.outputs:
-                    if output.type == "logs":
-                        print(f"\n{output.logs}", flush=True)
+        # Общий для процесса клиент VK на keep-alive сессии; при vk_batch_window > 0
+        # одновременные отправки объединяются в один запрос execute
+        self.vk_client = get_vk_client(config['token'], batch_window=float(config.get('vk_batch_window', 0.0)))
+        self.vk_session = self.vk_client.vk_session
+        self.vk = self.vk_client.vk
+
+        # Исходящие сообщения VK: ключ сообщества допускает 20 запросов в секунду, сообщение - до 4096 символов
+        self.sender = OutboundSender(
+            self._send_message,
+            max_length=4096,
+            global_rate=float(config.get('send_rate', 15)),
+            chat_rate=float(config.get('chat_send_rate', 1)),
+        )
 
-async def send_telegram_notification(user_id):
-    await telegram_bot.send_message(chat_id=telegram_chat_id, text=f"Пользователь отправил файл или фото. User ID: {user_id}")
+        self.user_threads = sessions
+
+        # Длинные разговоры переносятся в новый поток с пересказом; context_max_tokens = 0 выключает
+        self.context = None
+        if int(config.get('context_max_tokens', 8000)):
+            self.context = ThreadContext(
+                client,
+                max_messages=int(config.get('context_max_messages', 40)),
+                max_tokens=int(config.get('context_max_tokens', 8000)),
+                keep_messages=int(config.get('context_keep_messages', 4)),
+                summary_model=config.get('summary_model', 'gpt-4o-mini'),
+            )
+
+        # Запасной путь: если запуск ассистента не дал текста за latency_budget секунд или упал, ответ
+        # запрашивается у chat.completions с теми же инструкциями; предохранители отключают упавший API
+        self.hedge = HedgedRun(
+            self.name,
+            client,
+            self.instructions,
+            model=config.get('fallback_model', 'gpt-4o-mini'),
+            budget=float(config.get('latency_budget', 10.0)),
+            failure_threshold=int(config.get('breaker_failures', 5)),
+            reset_timeout=float(config.get('breaker_reset', 30.0)),
+        )
 
-def write_dialog_to_file(user_question, assistant_response):
-    with open("istoria_dialogov.txt", "a", encoding="utf-8") as file:
-        file.write(f"Вопрос: {user_question}\nОтвет: {assistant_response}\n\n")
+        # Допуск к запуску ассистента: лимиты очередей и бюджеты токенов за token_window секунд; при перегрузке
+        # пользователь сразу получает короткий ответ. Освободившееся место диспетчера получает чат, потративший меньше токенов
+        self.admission = Admission(
+            self.name,
+            sessions,
+            user_max_queued=int(config.get('user_max_queued', 10)),
+            bot_max_queued=int(config.get('bot_max_queued', config.get('max_pending', 1000))),
+            user_token_budget=int(config.get('user_token_budget', 0)),
+            bot_token_budget=int(config.get('bot_token_budget', 0)),
+            window=float(config.get('token_window', 3600)),
+            overload_reply=config.get('overload_reply', OVERLOAD_REPLY),
+            quota_reply=config.get('quota_reply', QUOTA_REPLY),
+        )
 
-def handle_file_submission(user_id):
-    if user_id in user_threads:
+        # Сообщения одного пользователя обрабатываются по порядку, разные пользователи - параллельно. Текстовые
+        # сообщения, пришедшие во время ответа или с паузой меньше coalesce_window секунд, склеиваются в одно
+        self.dispatcher = ChatDispatcher(
+            self.handle_event,
+            max_concurrency=self.max_concurrency,
+            merge=self.merge_events,
+            window=float(config.get('coalesce_window', 0.0)),
+            priority=self.admission.usage,
+        )
+        # По backlog опрос решает, когда забирать новые события и когда подтверждать их при ack='after';
+        # в режиме нескольких процессов supervisor подменяет его очередью рабочих процессов
+        self.backlog = self.dispatcher
+
+        # Откуда приходят события: longpoll - бот сам опрашивает VK, callback - VK присылает их
+        # POST-запросами на webhook_path HTTP сервера runtime
+        self.vk_mode = config.get('vk_mode', 'longpoll')
+        self.webhook_path = config.get('webhook_path', '/webhook')
+        self.confirmation = config.get('confirmation')
+        self.callback_secret = config.get('callback_secret')
+        # VK повторяет событие, если не получил ответ вовремя, поэтому помним уже принятые
+        self.recent_events = RecentIds()
+        # Long poll: сервер держит запрос до poll_timeout секунд (VK допускает до 90). ack как у TelegramBot:
+        # before - ts сохраняется сразу после получения событий, after - после их обработки
+        self.poll_timeout = int(config.get('poll_timeout', 50))
+        self.ack = config.get('ack', 'before')
+        self.max_pending = int(config.get('max_pending', 1000))
+
+        # Цены ассистент узнаёт функцией find_price из прайс-листа, а не из текста инструкций.
+        # Инструменты запуска заменяют инструменты ассистента, поэтому к find_price добавляются настроенные
+        # у ассистента в OpenAI (см. get_run_tools) или перечисленные в assistant_tools
+        self.prices = PriceCatalog(config.get('price_file') or data_file_path)
+        self.tools = price_tool(self.prices)
+        self.run_tools = config['assistant_tools'] + [PRICE_TOOL] if 'assistant_tools' in config else None
+        self.run_tools_lock = asyncio.Lock()
+        self.run_tools_retry_at = 0.0
+
+        # Кэш ответов на частые вопросы включается секцией response_cache в bots.json
+        self.response_cache = None
+        if config.get('response_cache'):
+            self.response_cache = ResponseCache(**config['response_cache'])
+
+    async def send_telegram_notification(self, text):
+        if self.telegram_bot:
+            await self.telegram_bot.send_message(chat_id=self.telegram_chat_id, text=text)
+
+    async def _send_message(self, user_id, text):
+        return await asyncio.to_thread(self.vk_client.send_message, user_id, text)
+
+    async def send_vk_message(self, user_id, text):
+        return await self.sender.deliver(user_id, text)
+
+    def write_dialog(self, user_id, user_question, assistant_response, latency=0.0, tokens=0, **extra):
+        if self.history:
+            self.history.record(self.name, user_id, user_question, assistant_response, latency, tokens, **extra)
+
+    async def end_thread(self, user_id, thread_id):
         try:
-            client.beta.threads.delete(thread_id=user_threads[user_id])
-            del user_threads[user_id]
-            logging.info(f"Поток для пользователя {user_id} завершен из-за отправки файла.")
+            await self.client.beta.threads.delete(thread_id=thread_id)
+            self.log.info(f"Поток для пользователя {user_id} завершен из-за отправки файла.")
         except Exception as e:
-            logging.error(f"Ошибка при завершении потока для пользователя {user_id}: {e}")
-
-    loop = asyncio.get_event_loop()
-    if loop.is_closed():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    loop.run_until_complete(send_telegram_notification(user_id))
-
-    try:
-        vk.messages.send(user_id=user_id, message="Мне нужно до 30 минут чтобы ответить вам.", random_id=0)
-    except vk_api.VkApiError as e:
-        logging.error(f"Ошибка VK API при отправке сообщения: {e}")
-
-    return "Мне нужно до 30 минут чтобы ответить вам."
+            self.log.error(f"Ошибка при завершении потока для пользователя {user_id}: {e}")
 
-def handle_message_new(message, user_id, attachments):
-    logging.info(f"Пришло сообщение от {user_id}: {message}")
-    logging.info(f"Вложения: {attachments}")
-
-    if attachments:
-        return handle_file_submission(user_id)
-
-    if not message:
-        logging.error("Получено пустое сообщение. Пропускаем отправку в OpenAI.")
-        return "Сообщение без текста пропущено."
-
-    if user_id not in user_threads:
+    async def acknowledge_file(self, user_id):
+        try:
+            await self.send_vk_message(user_id, "Мне нужно до 30 минут чтобы ответить вам.")
+        except vk_api.VkApiError as e:
+            self.log.error(f"Ошибка VK API при отправке сообщения: {e}")
+
+    # Файл от пользователя: поток забывается сразу, чтобы следующее сообщение начало новый разговор,
+    # а удаление потока в OpenAI и ответ пользователю идут одновременно. Оператор узнаёт о файле из сводки
+    async def handle_file_submission(self, user_id):
+        self.notify_digest.add(user_id)
+        thread_id = self.user_threads.get(user_id)
+        jobs = [self.acknowledge_file(user_id)]
+        if thread_id:
+            del self.user_threads[user_id]
+            jobs.append(self.end_thread(user_id, thread_id))
+        await asyncio.gather(*jobs)
+
+        return "Мне нужно до 30 минут чтобы ответить вам."
+
+    # Контекст для запасного ответа через chat.completions: последние сообщения потока или только текущее
+    def recent_messages(self, thread_id, message):
+        recent = self.context.recent(thread_id) if self.context else []
+        return recent or [{"role": "user", "content": message}]
+
+    @metrics.traced("total")
+    async def handle_message_new(self, message, user_id, attachments):
+        self.log.info(f"Пришло сообщение от {user_id}: {message}")
+        self.log.info(f"Вложения: {attachments}")
+
+        if attachments:
+            return await self.handle_file_submission(user_id)
+
+        if not message:
+            self.log.error("Получено пустое сообщение. Пропускаем отправку в OpenAI.")
+            return "Сообщение без текста пропущено."
+
+        # Кэш знает только текст вопроса, поэтому отвечает лишь на первое сообщение разговора: "да" или
+        # "устраивает такая запись?" в чужом разговоре значат другое, а ответ может содержать чужие данные
+        first_message = user_id not in self.user_threads
+        if self.response_cache and first_message:
+            cached = self.response_cache.get(message, self.instructions)
+            if cached:
+                return await self.send_cached_reply(message, user_id, cached)
+
+        if first_message:
+            try:
+                with metrics.timed(self.name, "thread_create"):
+                    thread = await self.client.beta.threads.create()
+                self.user_threads[user_id] = thread.id
+                self.log.info(f"Создан новый поток для пользователя {user_id}")
+            except Exception as e:
+                self.log.error(f"Ошибка при создании нового потока: {e}")
+                return "Ошибка при создании нового потока.", 500
+        else:
+            self.log.info(f"Используется существующий поток для пользователя {user_id}")
+            await self.hedge.settled(self.user_threads[user_id])
+            if self.context:
+                await self.context.trim(self.user_threads, user_id)
+
+        started = time.monotonic()
         try:
-            thread = client.beta.threads.create()
-            user_threads[user_id] = thread.id
-            logging.info(f"Создан новый поток для пользователя {user_id}")
+            with metrics.timed(self.name, "message_create"):
+                await self.client.beta.threads.messages.create(
+                    thread_id=self.user_threads[user_id],
+                    role="user",
+                    content=message
+                )
         except Exception as e:
-            logging.error(f"Ошибка при создании нового потока: {e}")
-            return "Ошибка при создании нового потока.", 500
-    else:
-        logging.info(f"Используется существующий поток для пользователя {user_id}")
-
-    try:
-        client.beta.threads.messages.create(
-            thread_id=user_threads[user_id],
-            role="user",
-            content=message
-        )
-    except Exception as e:
-        logging.error(f"Ошибка при создании сообщения в OpenAI: {e}")
-        return "Ошибка при создании сообщения в OpenAI.", 500
-
-    event_handler = EventHandler()
-
-    try:
-        with client.beta.threads.runs.stream(
-            thread_id=user_threads[user_id],
-            assistant_id=assistant_id,
-            instructions="""Ты консультант по кузовному ремонту авто. Твоя цель:
-    1. Помочь клиенту с консультацией по кузовным работам.
-    2. Предложить услуги автосервиса, включая замену порогов и арок, покраску элементов авто.
-    3. Всегда спрашивай у клиента фото повреждений.
-    4. Запрашивай контактные данные для записи на осмотр.
-    5. Если клиент хочет купить отдельно ремонтные элементы, можешь предложить купить ремонтный порог за 1800 рублей за один, ремонтную арку за 2500 за одну.
-    6. Покраска одного элемента авто от 10000 рублей.
-    7. Замена порога под ключ от 20000 рублей (входит ремонтный порог, снятие дверей и элементов кузова, покраска в цвет).
-    8. Замена арки под ключ от 25000 рублей (входит ремонтная арка, снятие элементов кузова, покраска в цвет крыла).""",
-            event_handler=event_handler,
-        ) as stream:
-            stream.until_done()
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении команды с помощником: {e}")
-        return "Ошибка при выполнении команды с помощником.", 500
-
-    get_thread_messages(client, user_threads[user_id])
-
-    response_text = event_handler.response_text.strip()
-
-    if response_text:
+            self.log.error(f"Ошибка при создании сообщения в OpenAI: {e}")
+            return "Ошибка при создании сообщения в OpenAI.", 500
+        if self.context:
+            self.context.add(self.user_threads[user_id], message)
+
+        # openai импортируется при первом сообщении, если assistant.preload ещё не успел
+        from event_handler import EventHandler
+        event_handler = EventHandler(client=self.client, tools=self.tools)
+
+        thread_id = self.user_threads[user_id]
+        run_tools = await self.get_run_tools()
+
+        async def stream_run():
+            async with self.client.beta.threads.runs.stream(
+                thread_id=thread_id,
+                assistant_id=self.assistant_id,
+                instructions=self.instructions,
+                event_handler=event_handler,
+                **({'tools': run_tools} if run_tools else {}),
+            ) as stream:
+                await stream.until_done()
+
+        run_started = time.monotonic()
+        try:
+            with metrics.timed(self.name, "run_stream"):
+                fallback_text = await self.hedge.run(stream_run, event_handler, thread_id, self.recent_messages(thread_id, message))
+        except Exception as e:
+            self.log.error(f"Ошибка при выполнении команды с помощником: {e}")
+            return "Ошибка при выполнении команды с помощником.", 500
+
+        metrics.observe_run(self.name, event_handler, run_started)
+        response_text = fallback_text or event_handler.response_text.strip()
+        self.admission.record(user_id, event_handler.total_tokens or estimate_tokens(message + response_text))
+        if self.context:
+            self.context.record_run(thread_id, response_text, event_handler.prompt_tokens)
+
+        if self.transcript == 'delta':
+            self.log_transcript(user_id, message, response_text, event_handler.tool_log)
+        latency = time.monotonic() - started
+
+        if response_text and self.response_cache and first_message:
+            self.response_cache.put(message, response_text, latency, self.instructions)
+
+        if response_text:
+            try:
+                with metrics.timed(self.name, "send"):
+                    await self.send_vk_message(user_id, response_text)
+                self.write_dialog(user_id, message, response_text, time.monotonic() - started, event_handler.total_tokens)
+            except vk_api.VkApiError as e:
+                self.log.error(f"Ошибка VK API: {e}")
+                return f"Ошибка VK API: {e}", 500
+        else:
+            self.log.error("Ответ от OpenAI не был получен.")
+            return "Ответ от OpenAI не был получен.", 500
+
+        # Полный дамп потока - ещё один запрос к OpenAI, поэтому он идёт в фоне после ответа пользователю
+        if self.transcript == 'full':
+            task = asyncio.create_task(self.get_thread_messages(thread_id))
+            self.dumps.add(task)
+            task.add_done_callback(self.dumps.discard)
+
+        return 'ok'
+
+    # Ответ из кэша без запуска ассистента на первое сообщение разговора. После отправки поток создаётся
+    # сразу с вопросом и ответом, чтобы следующий запуск видел весь разговор
+    async def send_cached_reply(self, message, user_id, response_text):
         try:
-            vk.messages.send(user_id=user_id, message=response_text, random_id=0)
-            write_dialog_to_file(message, response_text)
+            await self.send_vk_message(user_id, response_text)
+            self.write_dialog(user_id, message, response_text, cached=True)
         except vk_api.VkApiError as e:
-            logging.error(f"Ошибка VK API: {e}")
+            self.log.error(f"Ошибка VK API: {e}")
             return f"Ошибка VK API: {e}", 500
-    else:
-        logging.error("Ответ от OpenAI не был получен.")
-        return "Ответ от OpenAI не был получен.", 500
-
-    return 'ok'
-
-def get_thread_messages(client, thread_id):
-    try:
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        for message in messages.data:
-            logging.info(f"Message: {message.content[0].text.value}")
-    except Exception as e:
-        logging.error(f"An error occurred while retrieving messages: {e}")
-
-def start_vk_longpoll():
-    longpoll = VkLongPoll(vk_session)
-
-    for event in longpoll.listen():
-        if event.type == VkEventType.MESSAGE_NEW and event.to_me:
-            user_id = event.user_id
-            message = event.text
-            attachments = event.attachments
-            handle_message_new(message, user_id, attachments)
+
+        try:
+            thread = await self.client.beta.threads.create(messages=[
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": response_text},
+            ])
+            self.user_threads[user_id] = thread.id
+            if self.context:
+                self.context.add(thread.id, message)
+                self.context.add(thread.id, response_text, role="assistant")
+        except Exception as e:
+            self.log.error(f"Ошибка при создании потока для ответа из кэша: {e}")
+
+        return 'ok'
+
+    def log_transcript(self, user_id, message, response_text, tool_log):
+        self.transcript_log.info(f"Message ({user_id}, user): {message}")
+        for line in tool_log:
+            self.transcript_log.info(f"Tool ({user_id}): {line}")
+        self.transcript_log.info(f"Message ({user_id}, assistant): {response_text}")
+
+    # Инструменты ассистента запрашиваются в OpenAI один раз. Пока запрос не удался (повтор не чаще раза
+    # в минуту), запуск идёт без своих инструментов: у ассистента остаются его code_interpreter и file_search,
+    # но нет find_price
+    async def get_run_tools(self):
+        async with self.run_tools_lock:
+            if self.run_tools is None and time.monotonic() >= self.run_tools_retry_at:
+                try:
+                    assistant = await self.client.beta.assistants.retrieve(self.assistant_id)
+                except Exception as e:
+                    self.log.error(f"Не удалось получить инструменты ассистента {self.assistant_id}: {e}")
+                    self.run_tools_retry_at = time.monotonic() + 60
+                    return None
+                tools = [
+                    tool.model_dump(exclude_none=True) for tool in assistant.tools
+                    if not (tool.type == 'function' and tool.function.name == PRICE_TOOL['function']['name'])
+                ]
+                self.run_tools = tools + [PRICE_TOOL]
+        return self.run_tools
+
+    # Полный дамп потока, для отладки
+    async def get_thread_messages(self, thread_id):
+        try:
+            async for role, text in thread_messages(self.client, thread_id):
+                self.log.info(f"Message ({role}): {text}")
+        except Exception as e:
+            self.log.error(f"An error occurred while retrieving messages: {e}")
+
+    # "э", "че там?" подряд - один вопрос ассистенту; сообщения с вложениями обрабатываются отдельно
+    def merge_events(self, events):
+        return coalesce(
+            events,
+            lambda event: bool(event.text) and not event.attachments,
+            lambda group: SimpleNamespace(
+                text="\n".join(event.text for event in group),
+                user_id=group[-1].user_id,
+                attachments=[],
+            ),
+        )
+
+    # Событие проходит допуск и ставится в очередь диспетчера; supervisor подменяет submit, чтобы отправить
+    # событие процессу, который обслуживает этого пользователя
+    def submit(self, user_id, event, received=None):
+        reason = self.admission.check(user_id, self.dispatcher.pending(user_id), self.dispatcher.queued)
+        if reason:
+            self.admission.reject(user_id, reason, self.send_vk_message)
+            return
+        self.dispatcher.submit(user_id, event, received)
+
+    # Между процессами передаются только поля, которые нужны обработчику
+    def encode_event(self, event):
+        return {'text': event.text, 'user_id': event.user_id, 'attachments': event.attachments}
+
+    def decode_event(self, data):
+        return SimpleNamespace(**data)
+
+    async def handle_event(self, event):
+        await self.handle_message_new(event.text, event.user_id, event.attachments)
+
+    # Ключи для поиска повторов: event_id и номер сообщения в беседе
+    def is_duplicate(self, data):
+        message = data['object']['message']
+        keys = [('event', data.get('event_id')), ('message', message.get('peer_id'), message.get('conversation_message_id'))]
+        keys = [key for key in keys if key[-1]]
+        # Все ключи нужно добавить, поэтому без короткого замыкания any()
+        new = [self.recent_events.add(key) for key in keys]
+        return bool(keys) and not all(new)
+
+    # Событие Callback API. VK ждёт ответ "ok" в течение нескольких секунд, поэтому сообщение
+    # только ставится в очередь диспетчера, а ответ пользователю уходит отдельно
+    async def handle_callback(self, request):
+        if not request.is_json:
+            return 'Unsupported Media Type: Content is not application/json', 415
+        data = request.get_json()
+        if self.callback_secret and data.get('secret') != self.callback_secret:
+            return 'Forbidden', 403
+        if data.get('type') == 'confirmation':
+            return self.confirmation or ''
+        if data.get('type') == 'message_new':
+            if self.is_duplicate(data):
+                self.log.info(f"Повтор события от VK пропущен: {data.get('event_id')}")
+                return 'ok'
+            message = data['object']['message']
+            self.submit(message['from_id'], SimpleNamespace(
+                text=message.get('text', ''),
+                user_id=message['from_id'],
+                attachments=message.get('attachments', []),
+            ))
+        return 'ok'
+
+    # Номер последнего события (ts) хранится в SessionStore: после перезапуска опрос продолжается с него,
+    # если VK ещё хранит эти события, иначе check() сам переходит на актуальный ts
+    async def start_vk_longpoll(self):
+        backoff = Backoff()
+        longpoll = None
+        self.log.info("Опрос VK запущен")
+
+        while True:
+            await wait_for_capacity(self.backlog, self.max_pending)
+            try:
+                if longpoll is None:
+                    longpoll = await asyncio.to_thread(VkLongPoll, self.vk_session, wait=self.poll_timeout)
+                    if self.user_threads.offset:
+                        longpoll.ts = int(self.user_threads.offset)
+                # check() ждёт события до poll_timeout секунд, поэтому выполняется в отдельном потоке
+                events = await asyncio.to_thread(longpoll.check)
+            except Exception as e:
+                self.log.error(f"Ошибка при получении событий от VK: {e}")
+                await backoff.wait(e)
+                continue
+            backoff.reset()
+
+            for event in events:
+                if event.type == VkEventType.MESSAGE_NEW and event.to_me:
+                    self.submit(event.user_id, event)
+            if events and self.ack == 'after':
+                await self.backlog.join()
+            self.user_threads.offset = longpoll.ts
+
+    async def run(self):
+        if self.vk_mode == 'callback':
+            # События приходят через handle_callback, опрашивать VK не нужно
+            await asyncio.Event().wait()
+        await self.start_vk_longpoll()
+
 
 if __name__ == '__main__':
-    start_vk_longpoll()
+    import runtime
+    runtime.main(['--platform', 'vk'])
@@ -0,0 +1,33 @@
+import random
+import asyncio
+from outbound import retry_delay
+
+
+# Пауза перед повтором опроса после ошибки: 1, 2, 4... секунд до cap со случайным разбросом,
+# а если платформа сама сказала, сколько ждать (RetryAfter, HTTP 429), - столько
+class Backoff:
+    def __init__(self, base=1.0, cap=60.0):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def delay(self, exc=None):
+        delay = retry_delay(exc, self.attempt, self.base, self.cap) if exc else None
+        if delay is None:
+            delay = min(self.cap, self.base * 2 ** self.attempt) * random.uniform(0.5, 1.0)
+        return delay
+
+    async def wait(self, exc=None):
+        delay = self.delay(exc)
+        self.attempt += 1
+        await asyncio.sleep(delay)
+
+    def reset(self):
+        self.attempt = 0
+
+
+# Не забирать новые события, пока в очередях диспетчера (или рабочих процессов, см. supervisor.RemoteBacklog)
+# больше max_pending необработанных: при перегрузке события остаются у платформы, а не копятся в памяти
+async def wait_for_capacity(backlog, max_pending, interval=0.1):
+    while max_pending and backlog.queued >= max_pending:
+        await asyncio.sleep(interval)
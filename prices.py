@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import time
+import pickle
+import logging
+import threading
+
+
+# Прайс-лист ремонтных элементов из таблицы Excel. Таблица разбирается один раз и хранится
+# по столбцам; рядом с ней кладётся pickle-снимок, помеченный временем изменения и размером
+# файла, поэтому после перезапуска openpyxl не нужен. Если файл поменялся, прайс перечитывается
+# в фоновом потоке, а поиск до конца перечитывания идёт по старому индексу
+class PriceCatalog:
+    def __init__(self, path, check_interval=5.0, limit=5):
+        self.path = path
+        self.snapshot_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.pickle")
+        self.check_interval = check_interval
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = 0.0
+        self.columns = {}
+        # Названия, цены и нормализованные названия заменяются одним присваиванием
+        self.entries = ([], [], [])
+        self.reload()
+
+    @property
+    def names(self):
+        return self.entries[0]
+
+    def _file_version(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        try:
+            version = self._file_version()
+        except FileNotFoundError:
+            logging.error(f"Прайс-лист {self.path} не найден.")
+            return
+        if version == self.version:
+            return
+        columns = self._load_snapshot(version)
+        if columns is None:
+            columns = self._parse()
+            self._save_snapshot(version, columns)
+        self._index(columns)
+        self.version = version
+        logging.info(f"Прайс-лист {self.path} загружен: {len(self.names)} позиций")
+
+    def _load_snapshot(self, version):
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                snapshot = pickle.load(file)
+            if snapshot['version'] == version:
+                return snapshot['columns']
+        except (OSError, pickle.PickleError, EOFError, KeyError):
+            pass
+        return None
+
+    def _save_snapshot(self, version, columns):
+        try:
+            with open(self.snapshot_path, "wb") as file:
+                pickle.dump({'version': version, 'columns': columns}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logging.error(f"Не удалось сохранить снимок прайс-листа: {e}")
+
+    # Первая строка - заголовки; все листы книги складываются в одни столбцы
+    def _parse(self):
+        import openpyxl
+
+        columns = {}
+        rows = 0
+        book = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            for sheet in book.worksheets:
+                values = sheet.iter_rows(values_only=True)
+                header = next(values, None)
+                if not header:
+                    continue
+                header = [str(cell).strip() if cell is not None else f"столбец {n + 1}" for n, cell in enumerate(header)]
+                for row in values:
+                    if all(cell is None for cell in row):
+                        continue
+                    for name, cell in zip(header, row):
+                        columns.setdefault(name, [None] * rows).append(cell)
+                    rows += 1
+                    # Столбцы, которых нет на этом листе, дополняются пустыми значениями
+                    for column in columns.values():
+                        if len(column) < rows:
+                            column.append(None)
+        finally:
+            book.close()
+        return columns
+
+    # Столбец с названием и столбец с ценой ищутся по заголовкам
+    def _index(self, columns):
+        def find(*stems):
+            for name in columns:
+                if any(stem in name.lower() for stem in stems):
+                    return name
+            return None
+
+        name_column = find("наимен", "назван", "товар", "деталь") or next(iter(columns), None)
+        price_column = find("цена", "стоим", "руб")
+        names = [str(value).strip() for value in columns.get(name_column, [])]
+        prices = columns.get(price_column, [None] * len(names))
+        self.columns = columns
+        # Пробел перед каждым словом: начало слова ищется как " " + основа
+        self.entries = (names, prices, [" " + normalize(name) for name in names])
+
+    # Проверка и перечитывание уходят в поток; пока он работает, новый не запускается
+    def _check_changed(self):
+        now = time.monotonic()
+        if now - self.checked < self.check_interval:
+            return
+        self.checked = now
+        if self.lock.acquire(blocking=False):
+            threading.Thread(target=self._reload_in_background, name="price-reload", daemon=True).start()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logging.error(f"Не удалось перечитать прайс-лист {self.path}: {e}")
+        finally:
+            self.lock.release()
+
+    # Позиции, в названии которых есть все слова запроса (сравниваются основы с началами слов). Если таких нет,
+    # слова, которых нет ни в одном названии ("ремонтные", "сколько стоит"), отбрасываются и поиск повторяется
+    def find(self, query):
+        self._check_changed()
+        names, prices, search_names = self.entries
+        stems = [" " + stem(word) for word in normalize(query).split()]
+        found = self._match(names, prices, search_names, stems)
+        if not found:
+            known = [part for part in stems if any(part in name for name in search_names)]
+            if known and len(known) < len(stems):
+                found = self._match(names, prices, search_names, known)
+        return found
+
+    def _match(self, names, prices, search_names, stems):
+        found = []
+        for n, name in enumerate(search_names):
+            if all(part in name for part in stems):
+                found.append((names[n], prices[n]))
+                if len(found) >= self.limit:
+                    break
+        return found
+
+    def find_price(self, query):
+        if not self.names:
+            return "Прайс-лист недоступен, уточните цену у менеджера."
+        found = self.find(query)
+        if not found:
+            return "В прайс-листе такой позиции нет."
+        return "\n".join(f"{name}: {price} руб." for name, price in found)
+
+
+def normalize(text):
+    text = text.lower().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", text))
+
+
+# Основа слова без окончания, чтобы "арку" и "ремонтные арки" нашли "Арка задняя": у слов из 4-5 букв
+# отбрасывается последняя, у длинных - последние две, но остаётся не больше 5 букв. Короткие слова
+# и числа (модель, год) сравниваются целиком
+def stem(word):
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if len(word) <= 5:
+        return word[:-1]
+    return word[:min(5, len(word) - 2)]
+
+
+# Описание функции для ассистента: цены берутся из прайса, а не из текста инструкций
+PRICE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "find_price",
+        "description": "Найти цену ремонтного элемента (порога, арки и т.п.) в прайс-листе",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Что ищем, например 'порог ваз 2110' или 'арка задняя'"},
+            },
+            "required": ["query"],
+        },
+    },
+}
+
+
+def price_tool(catalog):
+    return {"find_price": lambda arguments: catalog.find_price(json.loads(arguments)["query"])}
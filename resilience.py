@@ -0,0 +1,183 @@
+import time
+import asyncio
+import logging
+import metrics
+
+
+# Предохранитель для одного API: после failure_threshold ошибок подряд запросы не отправляются
+# reset_timeout секунд, затем пропускается один пробный запрос; удачный закрывает предохранитель
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    # Пробный запрос отменили, не дождавшись ответа: следующий запрос снова может стать пробным
+    def cancel(self):
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logging.error(f"Предохранитель {self.name} разомкнут после {self.failures} ошибок подряд")
+            self.opened_at = time.monotonic()
+
+
+# Запуск ассистента с запасным путём. Если за budget секунд запуск не выдал ни одного куска текста или упал,
+# параллельно запрашивается chat.completions с теми же инструкциями и последними сообщениями разговора;
+# используется тот ответ, что пришёл первым. Пока предохранитель Assistants API разомкнут, запуск не делается вовсе.
+# budget = 0 выключает запасной путь по времени, остаётся только запасной путь при ошибке
+class HedgedRun:
+    def __init__(self, bot, client, instructions, model="gpt-4o-mini", budget=8.0,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.bot = bot
+        self.client = client
+        self.instructions = instructions
+        self.model = model
+        self.budget = budget
+        self.assistants = CircuitBreaker(f"{bot}:assistants", failure_threshold, reset_timeout)
+        self.chat = CircuitBreaker(f"{bot}:chat", failure_threshold, reset_timeout)
+        # Фоновое завершение проигравших запусков по потокам, см. settled
+        self.settling = {}
+
+    # messages - последние сообщения разговора вместе с текущим, в формате chat.completions
+    async def fallback(self, messages):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": self.instructions}] + messages,
+        )
+        return response.choices[0].message.content.strip()
+
+    # Запасной ответ дописывается в поток в фоне, чтобы следующий запуск видел весь разговор
+    async def _fallback(self, messages, reason, event_handler, thread_id):
+        try:
+            text = await self.fallback(messages)
+        except asyncio.CancelledError:
+            self.chat.cancel()
+            raise
+        except Exception:
+            self.chat.failure()
+            raise
+        self.chat.success()
+        metrics.fallbacks_total.inc(self.bot, reason)
+        self._spawn(thread_id, self._settle(event_handler, thread_id, text))
+        return text
+
+    # stream_run() - корутина с runs.stream, которая пишет ответ в event_handler.
+    # Возвращает текст запасного ответа или None, если ответил сам запуск
+    async def run(self, stream_run, event_handler, thread_id, messages):
+        if not self.assistants.allow():
+            # Разомкнуты оба предохранителя: запросов не отправляем, обработчик ответит ошибкой
+            if not self.chat.allow():
+                raise RuntimeError(f"Предохранители {self.assistants.name} и {self.chat.name} разомкнуты")
+            return await self._fallback(messages, "circuit_open", event_handler, thread_id)
+
+        run_task = asyncio.create_task(stream_run())
+        first_text = asyncio.create_task(event_handler.first_text.wait())
+        await asyncio.wait({run_task, first_text}, timeout=self.budget or None, return_when=asyncio.FIRST_COMPLETED)
+
+        if run_task.done() or first_text.done():
+            first_text.cancel()
+            try:
+                await run_task
+            except Exception as e:
+                self.assistants.failure()
+                if event_handler.first_token_at is not None or not self.chat.allow():
+                    raise
+                logging.error(f"Ошибка запуска ассистента, отвечаем через chat.completions: {e}")
+                return await self._fallback(messages, "run_error", event_handler, thread_id)
+            self.assistants.success()
+            return None
+
+        # Запуск не уложился в бюджет: считаем это отказом и запускаем запасной путь параллельно.
+        # Если запуск всё же ответит первым, отказ снимается: медленный, но рабочий API не должен
+        # размыкать предохранитель
+        self.assistants.failure()
+        if not self.chat.allow():
+            first_text.cancel()
+            await run_task
+            self.assistants.success()
+            return None
+        fallback = asyncio.create_task(self._fallback(messages, "budget", event_handler, thread_id))
+        pending = {run_task, first_text, fallback}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if fallback in done and not fallback.exception():
+                first_text.cancel()
+                run_task.cancel()
+                return fallback.result()
+            if first_text in done or (run_task in done and not run_task.exception()):
+                fallback.cancel()
+                first_text.cancel()
+                await run_task
+                self.assistants.success()
+                return None
+            if run_task in done:
+                first_text.cancel()
+                pending.discard(first_text)
+        # Упали оба пути
+        await run_task
+        return None
+
+    def _spawn(self, thread_id, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.settling[thread_id] = task
+        task.add_done_callback(lambda _: self._forget(thread_id, task))
+
+    def _forget(self, thread_id, task):
+        if self.settling.get(thread_id) is task:
+            del self.settling[thread_id]
+
+    # Ответ пользователю уходит сразу, а следующее сообщение потока ждёт, пока проигравший запуск отменён
+    # и запасной ответ дописан: иначе messages.create упадёт с "run is active", а запасной ответ окажется
+    # в потоке после нового вопроса
+    async def settled(self, thread_id):
+        task = self.settling.get(thread_id)
+        if task:
+            await asyncio.shield(task)
+
+    # Новое сообщение нельзя добавить в поток, пока запуск активен: проигравший гонку запуск сначала
+    # отменяется в OpenAI. Упавший запуск уже завершён, и его отмена просто не удастся
+    async def _settle(self, event_handler, thread_id, text):
+        run = event_handler.current_run
+        try:
+            if run:
+                try:
+                    await self.client.beta.threads.runs.cancel(run_id=run.id, thread_id=thread_id)
+                except Exception as e:
+                    logging.info(f"Запуск {run.id} не отменён: {e}")
+                for _ in range(20):
+                    run = await self.client.beta.threads.runs.retrieve(run_id=run.id, thread_id=thread_id)
+                    if run.status not in ("queued", "in_progress", "cancelling", "requires_action"):
+                        break
+                    await asyncio.sleep(0.5)
+            await self.client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=text)
+        except Exception as e:
+            logging.error(f"Ошибка при сохранении запасного ответа в поток {thread_id}: {e}")
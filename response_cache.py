@@ -0,0 +1,173 @@
+import re
+import time
+import zlib
+import hashlib
+import logging
+import importlib.util
+from collections import OrderedDict
+
+# numpy нужен только нечёткому поиску и импортируется при первом его использовании
+has_numpy = importlib.util.find_spec("numpy") is not None
+
+
+# Приведение вопроса к каноническому виду: регистр, ё, пунктуация и лишние пробелы не важны
+def normalize(text):
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+# Расстояние Левенштейна между двумя словами
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+# Одни и те же слова в любом порядке с точностью до опечатки или окончания: в коротких словах ошибок
+# не допускается, в словах от 4 букв - одна, от 8 букв - две
+def same_words(a, b):
+    words_a, words_b = a.split(), b.split()
+    if len(words_a) != len(words_b):
+        return False
+    for word in words_a:
+        allowed = 0 if len(word) < 4 else 1 if len(word) < 8 else 2
+        match = next((other for other in words_b if edit_distance(word, other) <= allowed), None)
+        if match is None:
+            return False
+        words_b.remove(match)
+    return True
+
+
+class CacheEntry:
+    def __init__(self, key, response, latency):
+        self.key = key
+        self.response = response
+        # Сколько секунд заняла генерация: столько экономит каждое попадание
+        self.latency = latency
+        self.created = time.time()
+        self.hits = 0
+
+
+# Кэш ответов на повторяющиеся вопросы. Два уровня: точное совпадение нормализованного
+# текста и нечёткое - косинусная близость TF-IDF векторов символьных триграмм (нужен numpy).
+# Одна близость не разделяет вопросы: у "замена порога под ключ цена" и "замена арки под ключ цена"
+# она выше, чем у "здраствуйте" и "здравствуйте" (около 0.7), поэтому из кандидатов с близостью
+# от threshold берётся первый, у которого те же слова (same_words). Кэш сбрасывается, если поменялись instructions,
+# с которыми генерировались ответы
+class ResponseCache:
+    def __init__(self, max_size=500, ttl=24 * 3600, threshold=0.7, dim=2048, candidates=5, report_every=100):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.dim = dim
+        self.candidates = candidates
+        self.report_every = report_every
+        self.fuzzy = has_numpy and threshold < 1
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.stats = {'lookups': 0, 'exact': 0, 'fuzzy': 0, 'saved_seconds': 0.0}
+        self._index = None
+
+    def _check_instructions(self, instructions):
+        fingerprint = hashlib.sha1(instructions.encode("utf-8")).hexdigest()
+        if fingerprint != self.fingerprint:
+            if self.entries:
+                logging.info("Инструкции изменились, кэш ответов сброшен.")
+            self.entries.clear()
+            self._index = None
+            self.fingerprint = fingerprint
+
+    def _expire(self):
+        deadline = time.time() - self.ttl
+        while self.entries:
+            entry = next(iter(self.entries.values()))
+            if entry.created >= deadline:
+                break
+            self.entries.popitem(last=False)
+            self._index = None
+
+    # Частоты символьных триграмм, разложенные по dim корзинам
+    def _vector(self, key):
+        import numpy as np
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = f" {key} "
+        for n in range(len(text) - 2):
+            vector[zlib.crc32(text[n:n + 3].encode("utf-8")) % self.dim] += 1
+        return vector
+
+    # Матрица TF-IDF всех записей; пересчитывается только после изменения кэша
+    def _build_index(self):
+        import numpy as np
+        keys = list(self.entries)
+        counts = np.stack([self._vector(key) for key in keys])
+        documents = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(keys)) / (1 + documents)).astype(np.float32) + 1
+        matrix = counts * idf
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+        self._index = (keys, idf, matrix)
+
+    def _fuzzy_lookup(self, key):
+        import numpy as np
+        if self._index is None:
+            self._build_index()
+        keys, idf, matrix = self._index
+        query = self._vector(key) * idf
+        query /= np.linalg.norm(query) + 1e-9
+        scores = matrix @ query
+        for index in np.argsort(-scores)[:self.candidates]:
+            if scores[index] < self.threshold:
+                break
+            if same_words(key, keys[index]):
+                return self.entries[keys[index]], float(scores[index])
+        return None, float(scores.max())
+
+    # Возвращает закэшированный ответ или None
+    def get(self, question, instructions=""):
+        self._check_instructions(instructions)
+        self._expire()
+        self.stats['lookups'] += 1
+        key = normalize(question)
+        entry = self.entries.get(key)
+        tier, similarity = 'exact', 1.0
+        if entry is None and self.fuzzy and self.entries and key:
+            entry, similarity = self._fuzzy_lookup(key)
+            tier = 'fuzzy'
+        if entry is not None:
+            entry.hits += 1
+            self.entries.move_to_end(entry.key)
+            self.stats[tier] += 1
+            self.stats['saved_seconds'] += entry.latency
+            logging.info(
+                f"Ответ из кэша ({tier}, сходство {similarity:.2f}) на вопрос {question!r}, "
+                f"сэкономлено {entry.latency:.1f} с"
+            )
+        self._report()
+        return entry.response if entry is not None else None
+
+    def put(self, question, response, latency=0.0, instructions=""):
+        self._check_instructions(instructions)
+        key = normalize(question)
+        if not key:
+            return
+        self.entries[key] = CacheEntry(key, response, latency)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self._index = None
+
+    def hit_rate(self):
+        hits = self.stats['exact'] + self.stats['fuzzy']
+        return hits / self.stats['lookups'] if self.stats['lookups'] else 0.0
+
+    def _report(self):
+        if self.report_every and self.stats['lookups'] % self.report_every == 0:
+            logging.info(
+                f"Кэш ответов: {self.stats['lookups']} запросов, попаданий {self.hit_rate():.0%} "
+                f"(точных {self.stats['exact']}, нечётких {self.stats['fuzzy']}), "
+                f"сэкономлено {self.stats['saved_seconds']:.0f} с генерации"
+            )
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import queue
+import signal
+import logging
+import logging.handlers
+import asyncio
+import argparse
+import importlib
+from dotenv import load_dotenv
+import web
+import metrics
+from assistant import get_openai_client, thread_messages, preload
+from loop_lag import LoopLagMonitor
+from session_store import SessionStore, SqliteSessionStore, cleanup_sessions
+from history import HistorySink
+
+# SDK платформ (telegram, vk_api), uvicorn и multiprocessing импортируются там, где нужны: перезапуск
+# через start.sh не платит за то, чем процесс не пользуется, а первый запрос опроса уходит раньше
+
+# Загрузка переменных окружения из файла .env
+load_dotenv()
+
+# HTTP сервер (вебхук VK, проверка работы, метрики) работает в цикле событий ботов под uvicorn
+app = web.App()
+
+# Замер задержки цикла событий, пишется в лог раз в минуту
+loop_lag = LoopLagMonitor()
+metrics.watch_loop_lag(loop_lag)
+
+# Загрузка списка ботов. Секреты в файле не хранятся: ключ "token_env" означает,
+# что значение "token" берётся из переменной окружения с этим именем
+def load_config(path):
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+    for bot in config['bots']:
+        for key, value in list(bot.items()):
+            if key.endswith('_env') and key[:-4] not in bot:
+                bot[key[:-4]] = os.getenv(value)
+        bot.setdefault('openai_api_key', os.getenv('OPENAI_API_KEY'))
+    return config
+
+# Общий лог в консоль и отдельный файл для каждого бота
+def setup_logging(bots):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler()]
+    )
+    for bot in bots:
+        handlers = list(logging.getLogger().handlers)
+        if bot.get('log_file'):
+            handler = logging.FileHandler(bot['log_file'])
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            logging.getLogger(bot['name']).addHandler(handler)
+            handlers.append(handler)
+
+        # Транскрипт разговоров пишется в те же логи через очередь, чтобы запись не задерживала ответ
+        transcript_queue = queue.Queue()
+        transcript = logging.getLogger(f"{bot['name']}.transcript")
+        transcript.addHandler(logging.handlers.QueueHandler(transcript_queue))
+        transcript.propagate = False
+        logging.handlers.QueueListener(transcript_queue, *handlers).start()
+
+# Печатает все сообщения потока OpenAI
+async def dump_thread(thread_id):
+    client = get_openai_client(os.getenv('OPENAI_API_KEY'))
+    async for role, text in thread_messages(client, thread_id):
+        print(f"{role}: {text}\n")
+
+# Хранилище thread_id пользователей: SQLite, если в конфиге указан session_db, иначе только память
+def build_session_store(config):
+    capacity = int(config.get('session_cache_size', 100000))
+    ttl = float(config.get('session_ttl_days', 30)) * 24 * 3600
+    if config.get('session_db'):
+        return SqliteSessionStore(config['session_db'], capacity=capacity, ttl=ttl)
+    return SessionStore(capacity=capacity, ttl=ttl)
+
+def build_bots(config, bots, store):
+    # Общие пулы соединений с Telegram: один для обычных запросов, второй для long polling.
+    # Создаются при первом Telegram боте или уведомлениях в Telegram
+    telegram_requests = []
+
+    def telegram_request(polling=False):
+        if not telegram_requests:
+            from telegram.request import HTTPXRequest
+            telegram_requests.append(HTTPXRequest(connection_pool_size=int(config.get('telegram_pool_size', 32))))
+            telegram_requests.append(HTTPXRequest(connection_pool_size=len(bots) + 1))
+        return telegram_requests[polling]
+
+    # Журнал диалогов пишется фоновым потоком в history_dir
+    history = None
+    if config.get('history_dir'):
+        history = HistorySink(config['history_dir'], suffix=config.get('history_suffix', ''))
+
+    instances = []
+    for bot in bots:
+        client = get_openai_client(bot['openai_api_key'])
+        sessions = store.view(bot['name'])
+        if bot['platform'] == 'telegram':
+            from tg_bot import TelegramBot
+            instances.append(TelegramBot(
+                bot, client, sessions, request=telegram_request(), get_updates_request=telegram_request(polling=True),
+            ))
+        elif bot['platform'] == 'vk':
+            from play1 import VkBot
+            notify_bot = None
+            if bot.get('notify_token'):
+                import telegram
+                notify_bot = telegram.Bot(token=bot['notify_token'], request=telegram_request())
+            instances.append(VkBot(bot, client, sessions, notify_bot=notify_bot, history=history))
+        else:
+            raise ValueError(f"Неизвестная платформа {bot['platform']} у бота {bot['name']}")
+        metrics.watch_bot(instances[-1])
+    return instances
+
+@app.route('/')
+async def index(request):
+    return "Сервер работает!"
+
+@app.route('/health')
+async def health(request):
+    return "ok"
+
+# Метрики в формате Prometheus: время шагов ответа, токены, очереди, активные чаты, задержка цикла
+@app.route('/metrics')
+async def metrics_endpoint(request):
+    return web.Response(metrics.render(), content_type='text/plain; version=0.0.4')
+
+# Фоновые задачи процесса, который обрабатывает сообщения
+def start_background(instances, store, config):
+    return [
+        asyncio.create_task(loop_lag.run()),
+        # Потоки пользователей, которые давно не писали, удаляются в OpenAI пачками в фоне
+        asyncio.create_task(cleanup_sessions(
+            store,
+            {bot.name: bot.client for bot in instances},
+            interval=float(config.get('session_cleanup_interval', 3600)),
+        )),
+    ]
+
+async def close_bots(instances):
+    for bot in instances:
+        if getattr(bot, 'notify_digest', None):
+            await bot.notify_digest.close()
+    for history in {id(bot.history): bot.history for bot in instances if getattr(bot, 'history', None)}.values():
+        history.close()
+
+# С supervisor этот процесс только опрашивает платформы и принимает вебхуки,
+# а сообщения обрабатывают рабочие процессы run_worker
+async def run_bots(instances, store, config, supervisor=None):
+    background = [] if supervisor else start_background(instances, store, config)
+    for bot in instances:
+        if supervisor:
+            supervisor.attach(bot)
+        if getattr(bot, 'vk_mode', None) == 'callback':
+            app.add_route(bot.webhook_path, bot.handle_callback, methods=('POST',))
+    polls = [asyncio.create_task(bot.run()) for bot in instances]
+    # Опрос начинается до импорта uvicorn и openai: они грузятся в потоках, пока цикл ждёт ответа платформ
+    await asyncio.sleep(0)
+    preload()
+    uvicorn = await asyncio.to_thread(importlib.import_module, 'uvicorn')
+
+    # Остановка по SIGTERM/SIGINT: uvicorn перестаёт принимать запросы и дожидается открытых,
+    # затем опрос платформ прекращается, а уже принятые сообщения дорабатываются не дольше shutdown_timeout.
+    # Непрочитанные обновления Telegram и VK вернут при следующем запуске
+    async def drain():
+        logging.info("Остановка: дожидаемся обработки принятых сообщений")
+        for task in polls:
+            task.cancel()
+        await asyncio.gather(*polls, return_exceptions=True)
+        timeout = float(config.get('shutdown_timeout', 60))
+        if supervisor:
+            await asyncio.to_thread(supervisor.stop, timeout)
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(bot.dispatcher.join() for bot in instances)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.error("Не все сообщения обработаны до остановки")
+        for task in background:
+            task.cancel()
+        await close_bots(instances)
+    app.on_shutdown.append(drain)
+
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        host=config.get('http_host', '0.0.0.0'),
+        port=int(config.get('http_port', 8080)),
+        timeout_keep_alive=int(config.get('http_keep_alive', 75)),
+        log_config=None,
+        access_log=False,
+    ))
+    await server.serve()
+
+# Рабочий процесс: те же боты, но события приходят из очереди supervisor, а не от платформ.
+# Устаревшие сессии чистит каждый процесс: поток удаляет тот, кто удалил запись о сессии из базы.
+# Метрики обработки отправляются в reports, их показывает /metrics основного процесса
+def run_worker(index, queue, progress, config_path, names, reports):
+    # Сигнал остановки получает вся группа процессов; рабочий процесс останавливает supervisor,
+    # когда перестанет принимать события
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    config = load_config(config_path)
+    config['history_suffix'] = f".w{index}"
+    bots = [bot for bot in config['bots'] if bot['name'] in names]
+    setup_logging(bots)
+    store = build_session_store(config)
+    instances = build_bots(config, bots, store)
+
+    async def work():
+        from supervisor import consume
+        preload()
+        background = start_background(instances, store, config)
+        background.append(asyncio.create_task(
+            metrics.publish(reports, index, interval=float(config.get('metrics_interval', 5))),
+        ))
+        await consume(index, queue, progress, {bot.name: bot for bot in instances})
+        for task in background:
+            task.cancel()
+        await close_bots(instances)
+
+    asyncio.run(work())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запуск всех ботов в одном процессе")
+    parser.add_argument('--config', default=os.getenv('BOTS_CONFIG', 'bots.json'))
+    parser.add_argument('--only', nargs='*', help="имена ботов, которые нужно запустить")
+    parser.add_argument('--platform', help="запустить только ботов этой платформы")
+    parser.add_argument('--workers', type=int, help="число рабочих процессов; по умолчанию workers из конфига или 1")
+    parser.add_argument('--dump-thread', metavar='THREAD_ID', help="вывести все сообщения потока OpenAI и выйти")
+    args = parser.parse_args(argv)
+
+    if args.dump_thread:
+        asyncio.run(dump_thread(args.dump_thread))
+        return
+
+    config = load_config(args.config)
+    bots = [
+        bot for bot in config['bots']
+        if (not args.only or bot['name'] in args.only)
+        and (not args.platform or bot['platform'] == args.platform)
+    ]
+    if not bots:
+        sys.exit("Нет ботов для запуска")
+    setup_logging(bots)
+
+    store = build_session_store(config)
+    supervisor = None
+    workers = args.workers or int(config.get('workers', 1))
+    if workers > 1:
+        import multiprocessing
+        from supervisor import Supervisor
+        reports = multiprocessing.get_context('spawn').Queue()
+        supervisor = Supervisor(workers, run_worker, args=(args.config, [bot['name'] for bot in bots], reports))
+        supervisor.start()
+        metrics.listen(reports)
+    asyncio.run(run_bots(build_bots(config, bots, store), store, config, supervisor))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+
+# Хранилище соответствий чат -> thread_id OpenAI. В памяти держится не больше
+# capacity последних чатов (LRU); чат, в который не писали дольше ttl секунд, считается
+# устаревшим, а его поток удаляется фоновой задачей cleanup_sessions
+class SessionStore:
+    # Время последнего обращения обновляется не чаще раза в touch_interval секунд
+    touch_interval = 60
+
+    def __init__(self, capacity=100000, ttl=30 * 24 * 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        # Потоки, которые больше не нужны и ждут удаления в OpenAI
+        self.stale = []
+        self.offsets = {}
+        # Токены OpenAI по корзинам времени: (бот, чат) -> {начало корзины: токенов}, тоже LRU
+        self.usage = OrderedDict()
+
+    # Представление хранилища для одного бота, работает как словарь chat_id -> thread_id
+    def view(self, bot):
+        return Sessions(self, bot)
+
+    def get(self, bot, chat_id):
+        key = (bot, chat_id)
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                entry = self._load(key)
+                if entry is None:
+                    return None
+                self._remember(key, entry)
+            else:
+                self.cache.move_to_end(key)
+            thread_id, last_used = entry
+            if now - last_used > self.ttl:
+                del self.cache[key]
+                if self._remove(key):
+                    self.stale.append((bot, chat_id, thread_id))
+                return None
+            if now - last_used >= self.touch_interval:
+                self.cache[key] = (thread_id, now)
+                self._touch(key, now)
+            return thread_id
+
+    def set(self, bot, chat_id, thread_id):
+        key = (bot, chat_id)
+        entry = (thread_id, time.time())
+        with self.lock:
+            self._remember(key, entry)
+            self._save(key, entry)
+
+    def pop(self, bot, chat_id):
+        key = (bot, chat_id)
+        with self.lock:
+            entry = self.cache.pop(key, None) or self._load(key)
+            self._remove(key)
+        return entry[0] if entry else None
+
+    # Забирает до batch устаревших сессий ботов bots (всех, если None) и удаляет их из хранилища.
+    # Сессии других ботов не трогаются: их потоки удаляет процесс, у которого есть клиент этих ботов
+    def expire(self, batch=100, bots=None):
+        deadline = time.time() - self.ttl
+        with self.lock:
+            for key, (thread_id, last_used) in list(self.cache.items()):
+                if last_used < deadline and (bots is None or key[0] in bots):
+                    del self.cache[key]
+                    if self._remove(key):
+                        self.stale.append(key + (thread_id,))
+            self.stale.extend(self._expire_stored(deadline, batch, bots))
+            self._expire_usage(deadline)
+            expired, kept = [], []
+            for item in self.stale:
+                mine = len(expired) < batch and (bots is None or item[0] in bots)
+                (expired if mine else kept).append(item)
+            self.stale = kept
+        return expired
+
+    # Смещение опроса платформы (update_id Telegram, ts VK), чтобы после перезапуска продолжить с того же места
+    def get_offset(self, bot):
+        with self.lock:
+            if bot not in self.offsets:
+                self.offsets[bot] = self._load_offset(bot)
+            return self.offsets[bot]
+
+    def set_offset(self, bot, value):
+        with self.lock:
+            if self.offsets.get(bot) != value:
+                self.offsets[bot] = value
+                self._save_offset(bot, value)
+
+    # Расход токенов чата (или всего бота, chat_id="*") в корзинах, начавшихся не раньше since.
+    # shared - расход пишут несколько процессов (весь бот в режиме supervisor): он читается из базы, а не из кэша
+    def get_usage(self, bot, chat_id, since, shared=False):
+        with self.lock:
+            if shared:
+                stored = self._sum_usage((bot, chat_id), since)
+                if stored is not None:
+                    return stored
+            buckets = self._usage_buckets((bot, chat_id))
+            return sum(tokens for start, tokens in buckets.items() if start >= since)
+
+    # Добавляет токены в корзину bucket; корзины старше since больше не нужны и удаляются
+    def add_usage(self, bot, chat_id, bucket, tokens, since):
+        key = (bot, chat_id)
+        with self.lock:
+            buckets = self._usage_buckets(key)
+            old = [start for start in buckets if start < since]
+            for start in old:
+                del buckets[start]
+            if old:
+                self._prune_usage(key, since)
+            buckets[bucket] = buckets.get(bucket, 0) + tokens
+            self._save_usage(key, bucket, tokens)
+
+    def _usage_buckets(self, key):
+        buckets = self.usage.get(key)
+        if buckets is None:
+            buckets = self.usage[key] = self._load_usage(key)
+            while len(self.usage) > self.capacity:
+                self.usage.popitem(last=False)
+        self.usage.move_to_end(key)
+        return buckets
+
+    def __len__(self):
+        return len(self.cache)
+
+    def _remember(self, key, entry):
+        self.cache[key] = entry
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.capacity:
+            evicted, (thread_id, _) = self.cache.popitem(last=False)
+            self._evict(evicted, thread_id)
+
+    # В памяти вытесненный чат забывается навсегда, поэтому его поток тоже нужно удалить
+    def _evict(self, key, thread_id):
+        self.stale.append(key + (thread_id,))
+
+    def _load(self, key):
+        return None
+
+    def _save(self, key, entry):
+        pass
+
+    def _touch(self, key, now):
+        pass
+
+    # Возвращает True, если сессию удалил этот процесс: тогда он же удаляет и её поток
+    def _remove(self, key):
+        return True
+
+    def _expire_stored(self, deadline, batch, bots):
+        return []
+
+    def _load_offset(self, bot):
+        return None
+
+    def _save_offset(self, bot, value):
+        pass
+
+    def _load_usage(self, key):
+        return {}
+
+    # tokens - прибавка к корзине, а не её новое значение: в ту же корзину могут писать другие процессы
+    def _save_usage(self, key, bucket, tokens):
+        pass
+
+    # Сумма расхода из общего хранилища или None, если его нет
+    def _sum_usage(self, key, since):
+        return None
+
+    def _prune_usage(self, key, since):
+        pass
+
+    def _expire_usage(self, deadline):
+        pass
+
+
+# То же хранилище с записью в SQLite: кэш в памяти пишет изменения сразу в базу,
+# поэтому после перезапуска пользователи продолжают разговор в своих потоках
+class SqliteSessionStore(SessionStore):
+    def __init__(self, path, capacity=100000, ttl=30 * 24 * 3600):
+        super().__init__(capacity=capacity, ttl=ttl)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "bot TEXT NOT NULL, chat_id TEXT NOT NULL, thread_id TEXT NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (bot, chat_id)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS poll_offsets (bot TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_usage ("
+            "bot TEXT NOT NULL, chat_id TEXT NOT NULL, bucket INTEGER NOT NULL, tokens INTEGER NOT NULL, "
+            "PRIMARY KEY (bot, chat_id, bucket)) WITHOUT ROWID"
+        )
+
+    def _load(self, key):
+        row = self.conn.execute(
+            "SELECT thread_id, last_used FROM sessions WHERE bot = ? AND chat_id = ?",
+            (key[0], str(key[1]))
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def _save(self, key, entry):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sessions (bot, chat_id, thread_id, last_used) VALUES (?, ?, ?, ?)",
+            (key[0], str(key[1])) + entry
+        )
+
+    def _touch(self, key, now):
+        self.conn.execute(
+            "UPDATE sessions SET last_used = ? WHERE bot = ? AND chat_id = ?",
+            (now, key[0], str(key[1]))
+        )
+
+    # С несколькими процессами на одной базе устаревшую запись мог уже удалить другой процесс
+    def _remove(self, key):
+        cursor = self.conn.execute("DELETE FROM sessions WHERE bot = ? AND chat_id = ?", (key[0], str(key[1])))
+        return cursor.rowcount > 0
+
+    # Из кэша вытесняется только копия, запись в базе остаётся
+    def _evict(self, key, thread_id):
+        pass
+
+    # Выборка и удаление в одной транзакции с блокировкой записи: каждую устаревшую сессию
+    # забирает ровно один процесс, даже если чистку запускают все рабочие процессы
+    def _expire_stored(self, deadline, batch, bots):
+        where, params = "last_used < ?", [deadline]
+        if bots is not None:
+            bots = list(bots)
+            where += f" AND bot IN ({', '.join('?' * len(bots))})"
+            params += bots
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                f"SELECT bot, chat_id, thread_id FROM sessions WHERE {where} LIMIT ?",
+                params + [batch]
+            ).fetchall()
+            self.conn.executemany(
+                "DELETE FROM sessions WHERE bot = ? AND chat_id = ?",
+                [(bot, chat_id) for bot, chat_id, _ in rows]
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _load_offset(self, bot):
+        row = self.conn.execute("SELECT value FROM poll_offsets WHERE bot = ?", (bot,)).fetchone()
+        return row[0] if row else None
+
+    def _save_offset(self, bot, value):
+        self.conn.execute("INSERT OR REPLACE INTO poll_offsets (bot, value) VALUES (?, ?)", (bot, str(value)))
+
+    def _load_usage(self, key):
+        rows = self.conn.execute(
+            "SELECT bucket, tokens FROM token_usage WHERE bot = ? AND chat_id = ?", (key[0], str(key[1]))
+        ).fetchall()
+        return dict(rows)
+
+    def _save_usage(self, key, bucket, tokens):
+        self.conn.execute(
+            "INSERT INTO token_usage (bot, chat_id, bucket, tokens) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (bot, chat_id, bucket) DO UPDATE SET tokens = tokens + excluded.tokens",
+            (key[0], str(key[1]), bucket, tokens)
+        )
+
+    def _sum_usage(self, key, since):
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(tokens), 0) FROM token_usage WHERE bot = ? AND chat_id = ? AND bucket >= ?",
+            (key[0], str(key[1]), since)
+        ).fetchone()
+        return row[0]
+
+    def _prune_usage(self, key, since):
+        self.conn.execute(
+            "DELETE FROM token_usage WHERE bot = ? AND chat_id = ? AND bucket < ?", (key[0], str(key[1]), since)
+        )
+
+    # Расход тех, кто давно не писал, в окна бюджетов уже не попадает
+    def _expire_usage(self, deadline):
+        self.conn.execute("DELETE FROM token_usage WHERE bucket < ?", (deadline,))
+
+
+# Сессии одного бота с интерфейсом словаря, чтобы обработчики работали с ним как с user_threads
+class Sessions:
+    def __init__(self, store, bot):
+        self.store = store
+        self.bot = bot
+
+    def get(self, chat_id, default=None):
+        thread_id = self.store.get(self.bot, chat_id)
+        return default if thread_id is None else thread_id
+
+    def __contains__(self, chat_id):
+        return self.store.get(self.bot, chat_id) is not None
+
+    def __getitem__(self, chat_id):
+        thread_id = self.store.get(self.bot, chat_id)
+        if thread_id is None:
+            raise KeyError(chat_id)
+        return thread_id
+
+    def __setitem__(self, chat_id, thread_id):
+        self.store.set(self.bot, chat_id, thread_id)
+
+    def __delitem__(self, chat_id):
+        self.store.pop(self.bot, chat_id)
+
+    # Смещение опроса этого бота; из SQLite возвращается строкой
+    @property
+    def offset(self):
+        return self.store.get_offset(self.bot)
+
+    @offset.setter
+    def offset(self, value):
+        self.store.set_offset(self.bot, value)
+
+    def usage(self, chat_id, since, shared=False):
+        return self.store.get_usage(self.bot, chat_id, since, shared)
+
+    def add_usage(self, chat_id, bucket, tokens, since):
+        self.store.add_usage(self.bot, chat_id, bucket, tokens, since)
+
+
+# Фоновая задача: раз в interval секунд удаляет в OpenAI потоки устаревших сессий ботов из clients пачками
+async def cleanup_sessions(store, clients, interval=3600, batch=100, concurrency=10):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(bot, chat_id, thread_id):
+        async with semaphore:
+            try:
+                await clients[bot].beta.threads.delete(thread_id=thread_id)
+            except Exception as e:
+                logging.error(f"Ошибка при удалении устаревшего потока {thread_id} ({bot}, {chat_id}): {e}")
+
+    while True:
+        await asyncio.sleep(interval)
+        while True:
+            expired = store.expire(batch, bots=list(clients))
+            if not expired:
+                break
+            await asyncio.gather(*(delete(*item) for item in expired))
+            logging.info(f"Удалено устаревших потоков OpenAI: {len(expired)}")
@@ -1,10 +1,5 @@
 #!/bin/bash
 
-python3 play1.py &
-echo 'Запущен VK'
-
-python3 bot_kostya.py &
-echo 'Запущен мой TG'
-
-python3 bot_danilka.py &
-echo 'Запущен Данилка TG'
+# Все боты из bots.json работают в одном процессе
+python3 runtime.py &
+echo 'Запущены VK и TG боты'
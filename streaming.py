@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+
+# Постепенная доставка ответа: первое сообщение уходит, как только пришли первые куски текста,
+# дальше оно редактируется не чаще раза в interval секунд
+class StreamingReply:
+    def __init__(self, send, edit, interval=1.0, limit=4096):
+        # send(text) отправляет сообщение и возвращает его id, edit(message_id, text) меняет текст
+        self.send = send
+        self.edit = edit
+        self.interval = interval
+        self.limit = limit
+        self.chunks = []
+        self.message_id = None
+        self.shown = ""
+        self.changed = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.task = None
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    # Вызывается из EventHandler.on_text_delta, сеть не трогает
+    def feed(self, text):
+        self.chunks.append(text)
+        self.changed.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while not self.finished.is_set():
+            await self.changed.wait()
+            self.changed.clear()
+            await self._show()
+            # Telegram ограничивает частоту правок, поэтому между ними пауза
+            try:
+                await asyncio.wait_for(self.finished.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _show(self):
+        text = self.text[:self.limit].strip()
+        if not text or text == self.shown:
+            return
+        try:
+            if self.message_id is None:
+                self.message_id = await self.send(text)
+            else:
+                await self.edit(self.message_id, text)
+            self.shown = text
+        except Exception as e:
+            logging.error(f"Ошибка при обновлении потокового ответа: {e}")
+
+    # Дожидается последней правки и возвращает полный текст ответа
+    async def finish(self):
+        self.finished.set()
+        self.changed.set()
+        if self.task:
+            await self.task
+        await self._show()
+        return self.text
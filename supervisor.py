@@ -0,0 +1,127 @@
+import time
+import bisect
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+# Согласованное хеширование: у каждого процесса replicas точек на кольце, чат обслуживает процесс
+# с ближайшей точкой по часовой стрелке. При изменении числа процессов переезжает только часть чатов
+class HashRing:
+    def __init__(self, nodes, replicas=160):
+        self.points = sorted((_hash(f"{node}:{n}"), node) for node in nodes for n in range(replicas))
+        self.keys = [point for point, _ in self.points]
+
+    def node(self, key):
+        index = bisect.bisect(self.keys, _hash(key)) % len(self.keys)
+        return self.points[index][1]
+
+
+# Несколько рабочих процессов за одним опросом платформ. Сообщения одного чата всегда попадают
+# в один процесс, поэтому порядок ответов в чате сохраняется, а сессии чата живут только в нём.
+# target(index, queue, progress, *args) выполняется в каждом процессе, читает из queue кортежи
+# (бот, chat_id, событие, время получения по time.time()) до None и сообщает в progress, сколько событий
+# каждого бота уже обработано (это делает consume)
+class Supervisor:
+    def __init__(self, workers, target, args=()):
+        context = multiprocessing.get_context('spawn')
+        self.ring = HashRing(range(workers))
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.progress = context.Queue()
+        self.processes = [
+            context.Process(
+                target=target, args=(index, queue, self.progress) + tuple(args), name=f"worker-{index}", daemon=True,
+            )
+            for index, queue in enumerate(self.queues)
+        ]
+        # Отправлено событий по ботам и обработано по (процесс, бот)
+        self.sent = {}
+        self.done = {}
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        threading.Thread(target=self._receive_progress, name="supervisor-progress", daemon=True).start()
+
+    def _receive_progress(self):
+        while True:
+            index, bot, done = self.progress.get()
+            self.done[index, bot] = done
+
+    def submit(self, bot, chat_id, payload):
+        self.sent[bot] = self.sent.get(bot, 0) + 1
+        self.queues[self.ring.node(f"{bot}:{chat_id}")].put((bot, chat_id, payload, time.time()))
+
+    # События бота, которые отправлены в процессы, но ещё не обработаны
+    def pending(self, bot):
+        done = sum(count for (index, name), count in list(self.done.items()) if name == bot)
+        return self.sent.get(bot, 0) - done
+
+    # Бот в этом процессе только получает события, а обрабатывают их рабочие процессы. Опрос платформы
+    # ждёт по backlog, поэтому max_pending и ack='after' считаются по событиям в рабочих процессах
+    def attach(self, bot):
+        bot.submit = lambda chat_id, event: self.submit(bot.name, chat_id, bot.encode_event(event))
+        bot.backlog = RemoteBacklog(self, bot.name)
+
+    # Процессы дорабатывают принятые сообщения и завершаются; кто не успел за timeout, завершается принудительно
+    def stop(self, timeout=60):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logging.error(f"{process.name} не завершился за {timeout} с")
+                process.terminate()
+
+
+# Очередь бота в рабочих процессах для опроса платформы: то же, что queued и join() у ChatDispatcher
+class RemoteBacklog:
+    def __init__(self, supervisor, bot, interval=0.05):
+        self.supervisor = supervisor
+        self.bot = bot
+        self.interval = interval
+
+    @property
+    def queued(self):
+        return self.supervisor.pending(self.bot)
+
+    async def join(self):
+        while self.queued > 0:
+            await asyncio.sleep(self.interval)
+
+
+# Цикл рабочего процесса: события из очереди supervisor проходят допуск и уходят в диспетчеры ботов.
+# Время получения переводится в часы этого процесса, чтобы задержка ответа включала путь между процессами
+async def consume(index, queue, progress, bots):
+    received = {name: 0 for name in bots}
+    reporter = asyncio.create_task(report_progress(index, progress, bots, received))
+    while True:
+        item = await asyncio.to_thread(queue.get)
+        if item is None:
+            break
+        name, chat_id, payload, sent = item
+        bot = bots[name]
+        received[name] += 1
+        bot.submit(chat_id, bot.decode_event(payload), time.monotonic() - max(0.0, time.time() - sent))
+    await asyncio.gather(*(bot.dispatcher.join() for bot in bots.values()))
+    reporter.cancel()
+    await asyncio.gather(reporter, return_exceptions=True)
+
+
+# Обработанными считаются полученные события, которых нет ни в очереди диспетчера, ни в работе: отклонённые
+# допуском - сразу, склеенные с предыдущими - при склейке. Ноль необработанных значит, что всё действительно готово
+async def report_progress(index, progress, bots, received, interval=0.05):
+    reported = {}
+    while True:
+        for name, bot in bots.items():
+            done = received[name] - bot.dispatcher.queued - bot.dispatcher.running
+            if reported.get(name) != done:
+                progress.put((index, name, done))
+                reported[name] = done
+        await asyncio.sleep(interval)
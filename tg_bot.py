@@ -0,0 +1,303 @@
+import time
+import logging
+from types import SimpleNamespace
+import telegram
+import metrics
+from dispatcher import ChatDispatcher, coalesce
+from thread_context import ThreadContext, estimate_tokens
+from resilience import HedgedRun
+from admission import Admission, OVERLOAD_REPLY, QUOTA_REPLY
+from streaming import StreamingReply
+from outbound import OutboundSender
+from poller import Backoff, wait_for_capacity
+
+
+# Telegram бот с помощником OpenAI; всё, чем боты отличаются, задаётся в bots.json
+class TelegramBot:
+    def __init__(self, config, client, sessions, request=None, get_updates_request=None):
+        self.name = config['name']
+        self.client = client
+        self.assistant_id = config['assistant_id']
+        self.instructions = config['instructions']
+        self.telegram_bot = telegram.Bot(
+            token=config['token'],
+            request=request,
+            get_updates_request=get_updates_request,
+        )
+        # Максимальное число чатов, которые обрабатываются одновременно
+        self.max_concurrency = int(config.get('max_concurrency', 8))
+        # Показывать ответ по мере генерации, редактируя сообщение не чаще раза в stream_edit_interval секунд
+        self.stream_replies = config.get('stream_replies', False)
+        self.stream_edit_interval = float(config.get('stream_edit_interval', 1.0))
+        self.log = logging.getLogger(self.name)
+        # Long polling: сервер держит запрос до poll_timeout секунд, пока не появится сообщение.
+        # ack = before - обновления подтверждаются сразу после получения (сбой может потерять сообщения в обработке),
+        # after - следующая пачка запрашивается и подтверждается только после обработки текущей (сбой может повторить их)
+        self.poll_timeout = int(config.get('poll_timeout', 50))
+        self.ack = config.get('ack', 'before')
+        self.max_pending = int(config.get('max_pending', 1000))
+
+        # Исходящие сообщения: Telegram допускает около 30 сообщений в секунду на бота и 1 в секунду на чат
+        self.sender = OutboundSender(
+            self._send_message,
+            max_length=4096,
+            global_rate=float(config.get('send_rate', 25)),
+            chat_rate=float(config.get('chat_send_rate', 1)),
+        )
+
+        # thread_id для каждого пользователя, хранится в SessionStore
+        self.user_threads = sessions
+
+        # Длинные разговоры переносятся в новый поток с пересказом; context_max_tokens = 0 выключает
+        self.context = None
+        if int(config.get('context_max_tokens', 8000)):
+            self.context = ThreadContext(
+                client,
+                max_messages=int(config.get('context_max_messages', 40)),
+                max_tokens=int(config.get('context_max_tokens', 8000)),
+                keep_messages=int(config.get('context_keep_messages', 4)),
+                summary_model=config.get('summary_model', 'gpt-4o-mini'),
+            )
+
+        # Запасной путь: если запуск ассистента не дал текста за latency_budget секунд или упал, ответ
+        # запрашивается у chat.completions с теми же инструкциями; предохранители отключают упавший API
+        self.hedge = HedgedRun(
+            self.name,
+            client,
+            self.instructions,
+            model=config.get('fallback_model', 'gpt-4o-mini'),
+            budget=float(config.get('latency_budget', 10.0)),
+            failure_threshold=int(config.get('breaker_failures', 5)),
+            reset_timeout=float(config.get('breaker_reset', 30.0)),
+        )
+
+        # Допуск к запуску ассистента: лимиты очередей и бюджеты токенов за token_window секунд; при перегрузке
+        # пользователь сразу получает короткий ответ. Освободившееся место диспетчера получает чат, потративший меньше токенов
+        self.admission = Admission(
+            self.name,
+            sessions,
+            user_max_queued=int(config.get('user_max_queued', 10)),
+            bot_max_queued=int(config.get('bot_max_queued', config.get('max_pending', 1000))),
+            user_token_budget=int(config.get('user_token_budget', 0)),
+            bot_token_budget=int(config.get('bot_token_budget', 0)),
+            window=float(config.get('token_window', 3600)),
+            overload_reply=config.get('overload_reply', OVERLOAD_REPLY),
+            quota_reply=config.get('quota_reply', QUOTA_REPLY),
+        )
+
+        # Сообщения одного чата обрабатываются по порядку, разные чаты - параллельно. Текстовые сообщения,
+        # пришедшие во время ответа или с паузой меньше coalesce_window секунд, уходят ассистенту одним сообщением
+        self.dispatcher = ChatDispatcher(
+            self.handle_telegram_message,
+            max_concurrency=self.max_concurrency,
+            merge=self.merge_updates,
+            window=float(config.get('coalesce_window', 0.0)),
+            priority=self.admission.usage,
+        )
+        # По backlog опрос решает, когда забирать новые события и когда подтверждать их при ack='after';
+        # в режиме нескольких процессов supervisor подменяет его очередью рабочих процессов
+        self.backlog = self.dispatcher
+
+    async def _send_message(self, chat_id, text):
+        message = await self.telegram_bot.send_message(chat_id=chat_id, text=text)
+        return message.message_id
+
+    # Асинхронная функция для отправки сообщения в Telegram; длинный текст уходит частями,
+    # возвращается id первого сообщения
+    async def send_telegram_message(self, chat_id, text):
+        message_ids = await self.sender.deliver(chat_id, text)
+        return message_ids[0]
+
+    async def edit_telegram_message(self, chat_id, message_id, text):
+        await self.sender.call(
+            chat_id,
+            lambda: self.telegram_bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text),
+        )
+
+    # Серия текстовых сообщений становится одним обновлением того же вида; фото обрабатываются отдельно
+    def merge_updates(self, updates):
+        return coalesce(
+            updates,
+            lambda update: bool(update.message.text) and not update.message.photo,
+            lambda group: SimpleNamespace(message=SimpleNamespace(
+                chat=group[-1].message.chat,
+                text="\n".join(update.message.text for update in group),
+                photo=None,
+            )),
+        )
+
+    # Контекст для запасного ответа через chat.completions: последние сообщения потока или только текущее
+    def recent_messages(self, thread_id, message):
+        recent = self.context.recent(thread_id) if self.context else []
+        return recent or [{"role": "user", "content": message}]
+
+    # Асинхронная функция для обработки сообщений из Telegram
+    @metrics.traced("total")
+    async def handle_telegram_message(self, update):
+        chat_id = update.message.chat.id
+
+        # Проверка, если сообщение содержит фото
+        if update.message.photo:
+            # Завершение потока пользователя, если он существует
+            if chat_id in self.user_threads:
+                try:
+                    await self.client.beta.threads.delete(thread_id=self.user_threads[chat_id])  # Завершаем поток
+                    del self.user_threads[chat_id]  # Удаляем информацию о потоке из словаря
+                    self.log.info(f"Поток для пользователя {chat_id} завершен из-за отправки фото.")
+                except Exception as e:
+                    self.log.error(f"Ошибка при завершении потока для пользователя {chat_id}: {e}")
+
+            # Отправка сообщения в чат о том, что пользователь отправил фото
+            await self.send_telegram_message(chat_id, "Пользователь отправил фото.")
+            return  # Завершаем выполнение функции
+
+        # Обработка текстовых сообщений
+        message = update.message.text
+
+        if not message:
+            self.log.error("Получено пустое сообщение из Telegram.")
+            await self.send_telegram_message(chat_id, "Пустое сообщение.")
+            return
+
+        # Проверка, существует ли поток для данного пользователя
+        if chat_id not in self.user_threads:
+            # Создание нового потока для каждого пользователя
+            try:
+                with metrics.timed(self.name, "thread_create"):
+                    thread = await self.client.beta.threads.create()
+                self.user_threads[chat_id] = thread.id
+                self.log.info(f"Создан новый поток для пользователя {chat_id}")
+            except Exception as e:
+                self.log.error(f"Ошибка при создании нового потока: {e}")
+                await self.send_telegram_message(chat_id, "Ошибка при создании нового потока.")
+                return
+        else:
+            self.log.info(f"Используется существующий поток для пользователя {chat_id}")
+            await self.hedge.settled(self.user_threads[chat_id])
+            if self.context:
+                await self.context.trim(self.user_threads, chat_id)
+
+        # Создание нового сообщения в потоке
+        try:
+            with metrics.timed(self.name, "message_create"):
+                await self.client.beta.threads.messages.create(
+                    thread_id=self.user_threads[chat_id],
+                    role="user",
+                    content=message
+                )
+        except Exception as e:
+            self.log.error(f"Ошибка при создании сообщения в OpenAI: {e}")
+            await self.send_telegram_message(chat_id, "Ошибка при создании сообщения в OpenAI.")
+            return
+        if self.context:
+            self.context.add(self.user_threads[chat_id], message)
+
+        # При stream_replies ответ уходит пользователю по мере генерации
+        reply = None
+        if self.stream_replies:
+            reply = StreamingReply(
+                send=lambda text: self.send_telegram_message(chat_id, text),
+                edit=lambda message_id, text: self.edit_telegram_message(chat_id, message_id, text),
+                interval=self.stream_edit_interval,
+            )
+
+        # Создание экземпляра EventHandler для захвата ответа; openai импортируется при первом сообщении,
+        # если assistant.preload ещё не успел
+        from event_handler import EventHandler
+        event_handler = EventHandler(on_text=reply.feed if reply else None)
+
+        # Использование потоковой передачи для выполнения команды с существующим помощником
+        thread_id = self.user_threads[chat_id]
+
+        async def stream_run():
+            async with self.client.beta.threads.runs.stream(
+                thread_id=thread_id,
+                assistant_id=self.assistant_id,
+                instructions=self.instructions,
+                event_handler=event_handler,
+            ) as stream:
+                await stream.until_done()
+
+        started = time.monotonic()
+        try:
+            with metrics.timed(self.name, "run_stream"):
+                fallback_text = await self.hedge.run(stream_run, event_handler, thread_id, self.recent_messages(thread_id, message))
+        except Exception as e:
+            self.log.error(f"Ошибка при выполнении команды с помощником: {e}")
+            if reply:
+                await reply.finish()
+            await self.send_telegram_message(chat_id, "Ошибка при выполнении команды с помощником.")
+            return
+
+        metrics.observe_run(self.name, event_handler, started)
+        response_text = fallback_text or event_handler.response_text.strip()
+        self.admission.record(chat_id, event_handler.total_tokens or estimate_tokens(message + response_text))
+        if self.context:
+            self.context.record_run(thread_id, response_text, event_handler.prompt_tokens)
+
+        if response_text:
+            with metrics.timed(self.name, "send"):
+                if reply:
+                    await reply.finish()
+                if reply and reply.message_id is not None:
+                    # Что не поместилось в потоковое сообщение, уходит отдельно
+                    rest = reply.text[reply.limit:].strip()
+                    if rest:
+                        await self.send_telegram_message(chat_id, rest)
+                else:
+                    await self.send_telegram_message(chat_id, response_text)
+        else:
+            if reply:
+                await reply.finish()
+            self.log.error("Ответ от OpenAI не был получен.")
+            await self.send_telegram_message(chat_id, "Ответ от OpenAI не был получен.")
+
+    # Обновление проходит допуск и ставится в очередь диспетчера; в режиме нескольких процессов supervisor подменяет
+    # submit, чтобы отправить обновление процессу, который обслуживает этот чат
+    def submit(self, chat_id, update, received=None):
+        reason = self.admission.check(chat_id, self.dispatcher.pending(chat_id), self.dispatcher.queued)
+        if reason:
+            self.admission.reject(chat_id, reason, self.send_telegram_message)
+            return
+        self.dispatcher.submit(chat_id, update, received)
+
+    # Обновления передаются между процессами как словари Bot API
+    def encode_event(self, update):
+        return update.to_dict()
+
+    def decode_event(self, data):
+        return telegram.Update.de_json(data, self.telegram_bot)
+
+    # Асинхронная функция для запуска long polling и получения сообщений.
+    # Смещение хранится в SessionStore, поэтому после перезапуска опрос продолжается с того же места
+    async def start_telegram_bot(self):
+        offset = self.user_threads.offset
+        update_id = int(offset) if offset else None
+        backoff = Backoff()
+        self.log.info("Опрос Telegram запущен")
+
+        while True:
+            await wait_for_capacity(self.backlog, self.max_pending)
+            try:
+                # Получаем обновления от Telegram
+                updates = await self.telegram_bot.get_updates(
+                    offset=update_id,
+                    timeout=self.poll_timeout,
+                    allowed_updates=['message'],
+                )
+            except Exception as e:
+                self.log.error(f"Ошибка при получении обновлений от Telegram: {e}")
+                await backoff.wait(e)
+                continue
+            backoff.reset()
+
+            for update in updates:
+                if update.message:
+                    self.submit(update.message.chat.id, update)
+                update_id = update.update_id + 1
+            if updates:
+                if self.ack == 'after':
+                    await self.backlog.join()
+                self.user_threads.offset = update_id
+
+    run = start_telegram_bot
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from assistant import thread_messages
+
+SUMMARY_PROMPT = (
+    "Кратко перескажи разговор клиента с консультантом: что клиент хочет, какие данные о себе, "
+    "машине и заказе он уже сообщил, что ему ответили и на чём остановились. Не больше 10 предложений."
+)
+
+
+# Грубая оценка числа токенов: для русского текста около трёх символов на токен
+def estimate_tokens(text):
+    return len(text) // 3 + 1
+
+
+# Размер контекста потоков OpenAI. Каждый запуск читает весь поток, поэтому стоимость и задержка
+# растут с длиной разговора. Когда в потоке больше max_messages сообщений или больше max_tokens токенов,
+# разговор переносится в новый поток: краткий пересказ старого и keep_messages последних сообщений.
+# Счётчики живут в памяти; после перезапуска оценку поправляет usage.prompt_tokens первого запуска.
+# Последние recent_messages сообщений потока хранятся для запасных ответов через chat.completions
+class ThreadContext:
+    def __init__(self, client, max_messages=40, max_tokens=8000, keep_messages=4,
+                 summary_model="gpt-4o-mini", capacity=100000, recent_messages=6):
+        self.client = client
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.keep_messages = keep_messages
+        self.summary_model = summary_model
+        self.capacity = capacity
+        self.recent_messages = recent_messages
+        # thread_id -> [сообщений, токенов, последние сообщения]
+        self.threads = OrderedDict()
+        self.tasks = set()
+
+    def _stats(self, thread_id):
+        stats = self.threads.get(thread_id)
+        if stats is None:
+            stats = self.threads[thread_id] = [0, 0, deque(maxlen=self.recent_messages)]
+            if len(self.threads) > self.capacity:
+                self.threads.popitem(last=False)
+        self.threads.move_to_end(thread_id)
+        return stats
+
+    def add(self, thread_id, text, role="user"):
+        stats = self._stats(thread_id)
+        stats[0] += 1
+        stats[1] += estimate_tokens(text)
+        stats[2].append({"role": role, "content": text})
+
+    # Последние сообщения потока в формате chat.completions; после перезапуска список пуст
+    def recent(self, thread_id):
+        stats = self.threads.get(thread_id)
+        return list(stats[2]) if stats else []
+
+    # После запуска: ответ ассистента и фактический размер запроса, если OpenAI его сообщил
+    def record_run(self, thread_id, response_text, prompt_tokens=0):
+        self.add(thread_id, response_text, role="assistant")
+        stats = self._stats(thread_id)
+        stats[1] = max(stats[1], prompt_tokens + estimate_tokens(response_text))
+
+    def over_limit(self, thread_id):
+        messages, tokens, _ = self.threads.get(thread_id, (0, 0, None))
+        return messages >= self.max_messages or tokens >= self.max_tokens
+
+    async def summarize(self, messages):
+        transcript = "\n".join(f"{role}: {text}" for role, text in messages)
+        response = await self.client.chat.completions.create(
+            model=self.summary_model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ],
+        )
+        return response.choices[0].message.content.strip()
+
+    # Создаёт новый поток с пересказом старого и возвращает его id; старый поток удаляется в фоне.
+    # Если пересказ не удался, в новый поток переносятся только последние сообщения
+    async def rollover(self, thread_id):
+        messages = [message async for message in thread_messages(self.client, thread_id)]
+        recent = messages[-self.keep_messages:] if self.keep_messages else []
+        seed = []
+        try:
+            summary = await self.summarize(messages[:len(messages) - len(recent)])
+            seed.append({"role": "user", "content": f"Краткое содержание предыдущего разговора:\n{summary}"})
+        except Exception as e:
+            logging.error(f"Ошибка при пересказе потока {thread_id}: {e}")
+        seed += [{"role": role, "content": text} for role, text in recent if text]
+
+        thread = await self.client.beta.threads.create(messages=seed)
+        self.threads.pop(thread_id, None)
+        for message in seed:
+            self.add(thread.id, message["content"], message["role"])
+
+        task = asyncio.create_task(self._delete(thread_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        logging.info(f"Поток {thread_id} ({len(messages)} сообщений) перенесён в {thread.id}")
+        return thread.id
+
+    # Перед новым сообщением: если поток чата разросся, чат переходит на новый поток.
+    # При ошибке разговор продолжается в старом потоке
+    async def trim(self, sessions, chat_id):
+        thread_id = sessions[chat_id]
+        if not self.over_limit(thread_id):
+            return
+        try:
+            sessions[chat_id] = await self.rollover(thread_id)
+        except Exception as e:
+            logging.error(f"Ошибка при переносе потока {thread_id}: {e}")
+
+    async def _delete(self, thread_id):
+        try:
+            await self.client.beta.threads.delete(thread_id=thread_id)
+        except Exception as e:
+            logging.error(f"Ошибка при удалении потока {thread_id}: {e}")
@@ -0,0 +1,84 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import vk_api
+
+# Один клиент VK на токен: соединение с api.vk.ru и ограничение частоты запросов общие для всех отправок
+# процесса. Два клиента на один токен вдвоём превысили бы лимит, поэтому разные настройки для одного токена -
+# ошибка конфигурации
+clients = {}
+clients_lock = threading.Lock()
+
+def get_vk_client(token, **kwargs):
+    with clients_lock:
+        if token not in clients:
+            clients[token] = (VkClient(token, **kwargs), kwargs)
+        client, settings = clients[token]
+        if settings != kwargs:
+            raise ValueError(f"Клиент VK для этого токена уже создан с {settings}, запрошен с {kwargs}")
+        return client
+
+
+# Потокобезопасный клиент VK API на одной keep-alive сессии. VkApi.method держит блокировку сессии на всё
+# время HTTP запроса, поэтому запросы одного клиента идут строго по одному и пул соединений ничего бы не дал.
+# Пропускную способность даёт batch_window > 0: messages.send, вызванные из разных потоков в пределах окна,
+# уходят одним запросом execute
+class VkClient:
+    # execute принимает не больше 25 вызовов API
+    max_batch = 25
+
+    def __init__(self, token, rps=20, batch_window=0.0):
+        self.vk_session = vk_api.VkApi(token=token)
+        # По умолчанию vk_api ждёт 1/3 секунды между запросами (лимит ключа пользователя),
+        # ключу сообщества разрешено 20 запросов в секунду
+        self.vk_session.RPS_DELAY = 1 / rps
+        self.vk = self.vk_session.get_api()
+        self.batch_window = batch_window
+        if batch_window:
+            self.pending = queue.Queue()
+            threading.Thread(target=self._batcher, name="vk-batcher", daemon=True).start()
+
+    def send_message(self, user_id, message, random_id=0):
+        values = {'user_id': user_id, 'message': message, 'random_id': random_id}
+        if not self.batch_window:
+            return self.vk.messages.send(**values)
+        future = Future()
+        self.pending.put((values, future))
+        return future.result()
+
+    # Отправляет все сообщения через execute, по 25 за запрос. Возвращает список, где
+    # для каждого сообщения лежит id сообщения или исключение vk_api.ApiError
+    def send_many(self, messages):
+        with vk_api.VkRequestsPool(self.vk_session) as pool:
+            pending = [pool.method('messages.send', values) for values in messages]
+        return [
+            request.result if request.ok
+            else vk_api.ApiError(self.vk_session, 'messages.send', values, False, request.error)
+            for values, request in zip(messages, pending)
+        ]
+
+    def _batcher(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self.pending.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            try:
+                if len(batch) == 1:
+                    values, future = batch[0]
+                    results = [self.vk.messages.send(**values)]
+                else:
+                    results = self.send_many([values for values, _ in batch])
+            except Exception as e:
+                logging.error(f"Ошибка VK API при пакетной отправке: {e}")
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,109 @@
+import json
+import logging
+from urllib.parse import parse_qs
+
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.args = query
+        self.headers = headers
+        self.body = body
+
+    @property
+    def is_json(self):
+        return self.headers.get('content-type', '').startswith('application/json')
+
+    def get_json(self):
+        return json.loads(self.body or b'null')
+
+
+class Response:
+    def __init__(self, body, status=200, content_type='text/plain; charset=utf-8'):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.content_type = content_type
+
+
+# Минимальное ASGI приложение для uvicorn, работает в том же цикле событий, что и боты.
+# Обработчики - корутины от Request, возвращают как во Flask строку, (строка, статус) или Response.
+# Функции из on_shutdown вызываются при остановке сервера, когда новые запросы уже не принимаются
+class App:
+    def __init__(self):
+        self.routes = {}
+        self.on_shutdown = []
+
+    def route(self, path, methods=('GET',)):
+        def decorator(handler):
+            self.add_route(path, handler, methods)
+            return handler
+        return decorator
+
+    def add_route(self, path, handler, methods=('GET',)):
+        for method in methods:
+            self.routes[(method, path)] = handler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for callback in self.on_shutdown:
+                    try:
+                        await callback()
+                    except Exception as e:
+                        logging.error(f"Ошибка при остановке: {e}")
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            known = any(path == scope['path'] for _, path in self.routes)
+            response = Response('Method Not Allowed', 405) if known else Response('Not Found', 404)
+        else:
+            request = Request(
+                scope['method'],
+                scope['path'],
+                {key: values[0] for key, values in parse_qs(scope['query_string'].decode()).items()},
+                {key.decode().lower(): value.decode() for key, value in scope['headers']},
+                body,
+            )
+            try:
+                response = self.make_response(await handler(request))
+            except Exception as e:
+                logging.error(f"Ошибка при обработке запроса {scope['path']}: {e}")
+                response = Response('Internal Server Error', 500)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': [
+                (b'content-type', response.content_type.encode()),
+                (b'content-length', str(len(response.body)).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': response.body})
+
+    @staticmethod
+    def make_response(result):
+        if isinstance(result, Response):
+            return result
+        if isinstance(result, tuple):
+            return Response(*result)
+        return Response(result)
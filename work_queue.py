@@ -0,0 +1,65 @@
+import logging
+import queue
+import itertools
+import threading
+from collections import OrderedDict
+
+
+# Пул рабочих потоков с общей очередью заданий. С priority(задание) первым берётся задание
+# с наименьшим значением, при равных - пришедшее раньше
+class WorkerPool:
+    def __init__(self, handler, workers=4, maxsize=0, priority=None):
+        self.handler = handler
+        self.priority = priority
+        self.order = itertools.count()
+        self.queue = queue.PriorityQueue(maxsize=maxsize) if priority else queue.Queue(maxsize=maxsize)
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"worker-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    # Возвращает False, если очередь переполнена
+    def submit(self, item):
+        if self.priority:
+            item = (self.priority(item), next(self.order), item)
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if self.priority:
+                item = item[2]
+            try:
+                self.handler(item)
+            except Exception as e:
+                logging.error(f"Ошибка при обработке задания из очереди: {e}")
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        self.queue.join()
+
+
+# Последние увиденные идентификаторы событий, чтобы не обрабатывать повторы
+class RecentIds:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Возвращает True, если идентификатор встретился впервые
+    def add(self, key):
+        with self.lock:
+            if key in self.ids:
+                self.ids.move_to_end(key)
+                return False
+            self.ids[key] = True
+            if len(self.ids) > self.maxsize:
+                self.ids.popitem(last=False)
+            return True